@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "accounts"
+
+    def ready(self):
+        from . import search_index  # noqa: F401 registers the search trigger check
+        from . import user_counts  # noqa: F401 connects the user counter signals
@@ -0,0 +1,52 @@
+"""Authentication for async views.
+
+Django 4.2's login_required and staff_member_required only wrap sync
+views, and request.user is a lazy object that queries the database the
+first time it is read, which an async view may not do. The decorators
+below load the user in one trip to a worker thread before the view runs.
+They preload the profile that base.html reads on every page, so the view
+and its template can use request.user without touching the database.
+"""
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.contrib.auth import REDIRECT_FIELD_NAME, get_user
+from django.contrib.auth.views import redirect_to_login
+from .models import Profile
+
+
+def _load_user(request):
+    user = get_user(request)
+    if user.is_authenticated:
+        try:
+            user.profile
+        except Profile.DoesNotExist:
+            # Cached as missing, so templates do not query again
+            pass
+    return user
+
+
+async def aget_user(request):
+    """Resolve request.user without blocking the event loop"""
+    request.user = await sync_to_async(_load_user)(request)
+    return request.user
+
+
+def _auser_passes_test(test_func, login_url=None):
+    def decorator(view_func):
+        @wraps(view_func)
+        async def _wrapper_view(request, *args, **kwargs):
+            if test_func(await aget_user(request)):
+                return await view_func(request, *args, **kwargs)
+            return redirect_to_login(request.get_full_path(), login_url, REDIRECT_FIELD_NAME)
+        return _wrapper_view
+    return decorator
+
+
+def alogin_required(view_func):
+    """login_required for async views"""
+    return _auser_passes_test(lambda u: u.is_authenticated)(view_func)
+
+
+def astaff_member_required(view_func):
+    """staff_member_required for async views"""
+    return _auser_passes_test(lambda u: u.is_active and u.is_staff, login_url='admin:login')(view_func)
@@ -0,0 +1,166 @@
+"""Rule-based fraud scoring.
+
+Each rule looks at one aspect of a proposed debit and returns a
+``(score, reason)`` pair when it fires. The pipeline adds up the scores of
+the rules it runs and flags the transaction once the total reaches
+``THRESHOLD``. The hard limits in ``REQUIRED_RULES`` always run, first.
+The softer signals in ``RULES`` follow, cheapest first, until ``BUDGET_MS``
+is used up; the rest are skipped. The budget is checked between rules, so
+it bounds how many rules run, not how long one of them takes.
+"""
+import hashlib
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, StdDev
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from . import velocity
+
+logger = logging.getLogger(__name__)
+
+STATS_TIMEOUT = 30 * 24 * 3600
+
+
+@dataclass
+class FraudContext:
+    user: object
+    amount: Decimal
+    receiver: object = None
+    ip: str = None
+    device: str = None
+    now: float = field(default_factory=time.time)
+
+
+def _weight(name):
+    return settings.FRAUD_SCORING['WEIGHTS'][name]
+
+
+def _device_fingerprint(ip, device):
+    return hashlib.sha1(f'{ip}|{device}'.encode()).hexdigest()[:16]
+
+
+# Rules, roughly in order of cost
+
+def time_of_day_rule(ctx):
+    start, end = settings.FRAUD_SCORING['NIGHT_HOURS']
+    hour = timezone.localtime(datetime.fromtimestamp(ctx.now, tz=dt_timezone.utc)).hour
+    if start <= hour < end:
+        return _weight('time_of_day'), 'Transaction at an unusual hour'
+
+
+def device_change_rule(ctx):
+    if ctx.ip is None and ctx.device is None:
+        return None
+    last = cache.get(f'fraud:device:{ctx.user.pk}')
+    if last is not None and last != _device_fingerprint(ctx.ip, ctx.device):
+        return _weight('device_change'), 'New device or network'
+
+
+def velocity_rule(ctx):
+    is_fraud, reason = velocity.check(ctx.user, ctx.amount, ctx.receiver, ctx.now)
+    if is_fraud:
+        return _weight('velocity'), reason
+
+
+def new_receiver_rule(ctx):
+    if ctx.receiver is not None and not velocity.is_known_pair(ctx.user, ctx.receiver):
+        return _weight('new_receiver'), 'First payment to this recipient'
+
+
+def amount_zscore_rule(ctx):
+    count, mean, m2 = get_amount_stats(ctx.user.pk)
+    if count < settings.FRAUD_SCORING['MIN_HISTORY']:
+        return None
+    std = math.sqrt(m2 / count)
+    if std == 0:
+        return None
+    zscore = (float(ctx.amount) - mean) / std
+    if zscore > settings.FRAUD_SCORING['ZSCORE_LIMIT']:
+        return _weight('amount_zscore'), f'Amount far above usual spending (z={zscore:.1f})'
+
+
+# Per-user amount statistics (count, mean, sum of squared deviations)
+
+def get_amount_stats(user_id):
+    key = f'fraud:amounts:{user_id}'
+    stats = cache.get(key)
+    if stats is None:
+        from transactions.models import Transaction
+
+        row = Transaction.objects.filter(
+            sender_id=user_id,
+            status='completed'
+        ).exclude(transaction_type='deposit').aggregate(
+            count=Count('id'),
+            mean=Avg('amount'),
+            std=StdDev('amount'),
+        )
+        count = row['count']
+        mean = float(row['mean'] or 0)
+        std = float(row['std'] or 0)
+        stats = (count, mean, std * std * count)
+        cache.set(key, stats, STATS_TIMEOUT)
+    return stats
+
+
+def record_amount(user_id, amount):
+    """Fold a committed debit into the user's running statistics (Welford)"""
+    record_amounts(user_id, [amount])
+
+
+def record_amounts(user_id, amounts):
+    """record_amount for several committed debits, with one cache read and write"""
+    key = f'fraud:amounts:{user_id}'
+    stats = cache.get(key)
+    if stats is None:
+        # Seeded from the database, which already contains these debits
+        return
+    count, mean, m2 = stats
+    for amount in amounts:
+        count += 1
+        delta = float(amount) - mean
+        mean += delta / count
+        m2 += delta * (float(amount) - mean)
+    cache.set(key, (count, mean, m2), STATS_TIMEOUT)
+
+
+def remember_device(user, ip, device):
+    cache.set(f'fraud:device:{user.pk}', _device_fingerprint(ip, device), STATS_TIMEOUT)
+
+
+_rules = None
+
+
+def get_rules():
+    """The (required, budgeted) rule functions"""
+    global _rules
+    if _rules is None:
+        _rules = (
+            [import_string(path) for path in settings.FRAUD_SCORING['REQUIRED_RULES']],
+            [import_string(path) for path in settings.FRAUD_SCORING['RULES']],
+        )
+    return _rules
+
+
+def score(ctx):
+    """Run the rule pipeline; returns (score, reasons)"""
+    required, budgeted = get_rules()
+    budget = settings.FRAUD_SCORING['BUDGET_MS'] / 1000
+    started = time.perf_counter()
+    total = 0.0
+    reasons = []
+    for rule in required + budgeted:
+        if rule not in required and time.perf_counter() - started > budget:
+            logger.warning('Fraud scoring budget exceeded before %s for user %s', rule.__name__, ctx.user.pk)
+            break
+        result = rule(ctx)
+        if result:
+            total += result[0]
+            reasons.append(result[1])
+    return total, reasons
@@ -0,0 +1,221 @@
+"""Live balance and notification updates over server-sent events.
+
+The ledger and the notification outbox publish small events once their
+transaction commits. A transfer publishes "balance changed" for every
+account it touched; a queued notification publishes its title and
+message. A pub/sub backend hands each event to the open streams of that
+user. LocalPubSubBackend does this within one process. A backend shared
+between processes (several ASGI workers, or broadcasts sent from
+process_notifications) only needs the same three methods and is selected
+with LIVE_UPDATES['BACKEND'].
+
+bankapp/asgi.py routes the live_updates URL to ``application`` below, a
+plain ASGI app. An idle stream costs one queue and two small tasks, with
+no thread and no database work until an event arrives. Under WSGI the
+same URL is served by accounts.views.live_updates, which sends a single
+snapshot and tells the browser when to reconnect.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from importlib import import_module
+from io import BytesIO
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.utils.module_loading import import_string
+from .models import User
+
+HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    # Stops nginx from buffering the stream
+    (b'x-accel-buffering', b'no'),
+]
+
+
+def _offer(queues, event):
+    for queue in queues:
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A client this far behind still gets the latest balance with the queued events
+            pass
+
+
+class LocalPubSubBackend:
+    """Delivers events to streams in this process; publish() may be called from any thread"""
+
+    def __init__(self, max_queued=100):
+        self._subscribers = {}
+        self._max_queued = max_queued
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """Register a stream of ``user_id`` on the running event loop and return its queue"""
+        queue = asyncio.Queue(self._max_queued)
+        with self._lock:
+            self._subscribers.setdefault(user_id, {})[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            queues = self._subscribers.get(user_id, {})
+            queues.pop(queue, None)
+            if not queues:
+                self._subscribers.pop(user_id, None)
+
+    def publish(self, user_ids, event):
+        by_loop = defaultdict(list)
+        with self._lock:
+            for user_id in user_ids:
+                for queue, loop in self._subscribers.get(user_id, {}).items():
+                    by_loop[loop].append(queue)
+        # One wakeup per event loop, however many streams it serves
+        for loop, queues in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_offer, queues, event)
+            except RuntimeError:
+                # The loop closed under streams that have not unsubscribed yet
+                pass
+
+    def stream_count(self):
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                options = settings.LIVE_UPDATES
+                _backend = import_string(options['BACKEND'])(**options.get('OPTIONS', {}))
+    return _backend
+
+
+def publish(user_ids, event):
+    get_backend().publish([user_id for user_id in user_ids if user_id is not None], event)
+
+
+def publish_on_commit(user_ids, event):
+    """Publish once the current transaction commits, so streams never see rolled back changes"""
+    user_ids = list(user_ids)
+    transaction.on_commit(lambda: publish(user_ids, event))
+
+
+def balance_changed(user_ids):
+    publish_on_commit(user_ids, {'type': 'balance'})
+
+
+def format_event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'.encode()
+
+
+def _balance(user_id):
+    balance = User.objects.filter(pk=user_id).values_list('profile__balance', flat=True).first()
+    return str(balance) if balance is not None else None
+
+
+def snapshot(user_id):
+    """The events a stream starts with: current balance and unread notification count"""
+    balance, unread = User.objects.filter(pk=user_id).values_list('profile__balance', 'unread_notifications').first()
+    return format_event('balance', {'balance': str(balance) if balance is not None else None}) + format_event(
+        'unread', {'count': unread}
+    )
+
+
+def _authenticate(scope):
+    """The id of the user logged in by the request's session cookie, or None"""
+    request = ASGIRequest(scope, BytesIO())
+    engine = import_module(settings.SESSION_ENGINE)
+    request.session = engine.SessionStore(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    user = get_user(request)
+    return user.pk if user.is_authenticated else None
+
+
+async def _body(send, data):
+    await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+
+KEEPALIVE = {'type': 'keepalive'}
+
+
+def _keepalive(queue, interval):
+    """Queue a keepalive every ``interval`` seconds; returns a handle whose cancel() stops it"""
+    loop = asyncio.get_running_loop()
+
+    def tick():
+        _offer([queue], KEEPALIVE)
+        holder[0] = loop.call_later(interval, tick)
+
+    # A timer rather than wait_for() with a timeout, which costs a task per event
+    holder = [loop.call_later(interval, tick)]
+    return lambda: holder[0].cancel()
+
+
+async def _stream(user_id, queue, send):
+    while True:
+        events = [await queue.get()]
+        while not queue.empty():
+            events.append(queue.get_nowait())
+        chunks = []
+        # Any number of balance changes costs one read
+        if any(event['type'] == 'balance' for event in events):
+            chunks.append(format_event('balance', {'balance': await sync_to_async(_balance)(user_id)}))
+        chunks.extend(
+            format_event('notification', {'title': event['title'], 'message': event['message']})
+            for event in events if event['type'] == 'notification'
+        )
+        if not chunks:
+            # Keeps proxies from closing the connection and notices dead clients
+            chunks.append(b': keepalive\n\n')
+        await _body(send, b''.join(chunks))
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def application(scope, receive, send):
+    """ASGI app streaming live updates to the logged in user until the client goes away"""
+    user_id = await sync_to_async(_authenticate)(scope)
+    if user_id is None:
+        await send({'type': 'http.response.start', 'status': 403, 'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': b'Log in to receive live updates'})
+        return
+    backend = get_backend()
+    # Subscribed before the snapshot is read, so no change in between goes unnoticed
+    queue = backend.subscribe(user_id)
+    try:
+        initial = await sync_to_async(snapshot)(user_id)
+        await send({'type': 'http.response.start', 'status': 200, 'headers': HEADERS})
+        await _body(send, initial)
+        stop_keepalive = _keepalive(queue, settings.LIVE_UPDATES['KEEPALIVE_SECONDS'])
+        # The stream runs in this task; the watcher cancels it when the client goes away
+        watcher = asyncio.ensure_future(_wait_for_disconnect(receive))
+        current = asyncio.current_task()
+
+        def disconnected(_):
+            current.cancel()
+
+        watcher.add_done_callback(disconnected)
+        try:
+            await _stream(user_id, queue, send)
+        except asyncio.CancelledError:
+            if not watcher.done() or watcher.cancelled():
+                raise
+        finally:
+            stop_keepalive()
+            watcher.remove_done_callback(disconnected)
+            watcher.cancel()
+    finally:
+        backend.unsubscribe(user_id, queue)
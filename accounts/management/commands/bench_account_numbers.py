@@ -0,0 +1,161 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import date
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, transaction
+from accounts import numbers
+from accounts.models import Profile, User
+
+BENCH_PREFIX = 'bench_numbers_'
+PHONE_BASE = 9400000000
+RESULT_MARKER = 'NUMBERS_RESULT '
+DELETE_BATCH = 10000
+
+
+def _legacy_number():
+    """How Profile.save numbered accounts before the block allocator"""
+    while True:
+        account_num = f"CE{random.randint(1000000000, 9999999999)}"
+        if not Profile.objects.filter(account_number=account_num).exists():
+            return account_num
+
+
+class Command(BaseCommand):
+    help = 'Register profiles from several processes at once and check that no two get the same account number (use a scratch database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=1000000)
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--threads', type=int, default=2, help='Registering threads per process')
+        parser.add_argument('--legacy', action='store_true', help='Number accounts the old way, for comparison')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users afterwards')
+        parser.add_argument('--worker', type=int, help=f'Register one share in this process and print its result ({RESULT_MARKER.strip()})')
+
+    def handle(self, *args, **options):
+        if options['worker'] is not None:
+            result = self._register(options['worker'], options)
+            self.stdout.write(RESULT_MARKER + json.dumps(result))
+            return
+
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        workers = options['processes'] * options['threads']
+        self.stdout.write(
+            f"Registering {options['profiles']:,} profiles from {options['processes']} processes x "
+            f"{options['threads']} threads ({'random numbers' if options['legacy'] else 'block allocator'}, "
+            f"blocks of {settings.ACCOUNT_NUMBER_BLOCK_SIZE})"
+        )
+        started = time.perf_counter()
+        processes = [
+            subprocess.Popen(
+                [
+                    sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'bench_account_numbers',
+                    '--worker', str(index), '--profiles', str(options['profiles']),
+                    '--processes', str(options['processes']), '--threads', str(options['threads']),
+                    *(['--legacy'] if options['legacy'] else []),
+                ],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            )
+            for index in range(options['processes'])
+        ]
+        results = []
+        for process in processes:
+            stdout, stderr = process.communicate()
+            lines = [line for line in stdout.splitlines() if line.startswith(RESULT_MARKER)]
+            if not lines:
+                raise CommandError(f"Worker failed: {(stderr.strip().splitlines() or ['no output'])[-1]}")
+            results.append(json.loads(lines[0][len(RESULT_MARKER):]))
+        elapsed = time.perf_counter() - started
+
+        registered = sum(result['registered'] for result in results)
+        clashes = sum(result['clashes'] for result in results)
+        queries = sum(result['queries'] for result in results)
+        try:
+            if registered + clashes != options['profiles']:
+                raise CommandError(f"Only {registered + clashes:,} of {options['profiles']:,} registrations finished")
+            self._verify(registered, options['legacy'])
+            self.stdout.write(
+                f'{registered:,} registered in {elapsed:.0f}s ({registered / elapsed:,.0f}/s) by {workers} workers, '
+                f'{queries / max(registered, 1):.2f} queries per registration, {clashes} account number clashes'
+            )
+            if clashes:
+                raise CommandError(f'{clashes} registrations failed on a duplicate account number')
+        finally:
+            if not options['keep']:
+                self._cleanup()
+
+    def _verify(self, registered, legacy):
+        account_numbers = Profile.objects.filter(user__username__startswith=BENCH_PREFIX).values_list('account_number', flat=True)
+        distinct = account_numbers.order_by().distinct().count()
+        if distinct != registered:
+            raise CommandError(f'{registered:,} profiles registered but {distinct:,} distinct account numbers')
+        if not legacy:
+            invalid = sum(not numbers.is_valid(number) for number in account_numbers.iterator(chunk_size=DELETE_BATCH))
+            if invalid:
+                raise CommandError(f'{invalid} account numbers fail their check digit')
+
+    def _register(self, index, options):
+        """Register this process's share of the profiles the way accounts.views.register does"""
+        workers = options['processes'] * options['threads']
+        password = make_password(None)
+        totals = {'registered': 0, 'clashes': 0, 'queries': 0}
+        lock = threading.Lock()
+
+        def register(worker):
+            local = {'registered': 0, 'clashes': 0, 'queries': 0}
+
+            def count_queries(execute, sql, params, many, context):
+                local['queries'] += 1
+                return execute(sql, params, many, context)
+
+            try:
+                with connection.execute_wrapper(count_queries):
+                    for i in range(worker, options['profiles'], workers):
+                        try:
+                            with transaction.atomic():
+                                user = User.objects.create(
+                                    username=f'{BENCH_PREFIX}{i}', phone_number=f'0{PHONE_BASE + i}', password=password
+                                )
+                                Profile.objects.create(
+                                    user=user,
+                                    full_name=user.username,
+                                    cnic=f'94444-{i:07d}-4',
+                                    date_of_birth=date(1990, 1, 1),
+                                    address='Benchmark',
+                                    account_number=_legacy_number() if options['legacy'] else '',
+                                )
+                            local['registered'] += 1
+                        except IntegrityError as e:
+                            if 'account_number' not in str(e):
+                                raise
+                            local['clashes'] += 1
+            finally:
+                connection.close()
+                with lock:
+                    for key, value in local.items():
+                        totals[key] += value
+
+        threads = [
+            threading.Thread(target=register, args=(index * options['threads'] + thread,))
+            for thread in range(options['threads'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return totals
+
+    def _cleanup(self):
+        # In id chunks, so the cascade never loads every benchmark user at once
+        bench = User.objects.filter(username__startswith=BENCH_PREFIX).order_by('pk')
+        while True:
+            ids = list(bench.values_list('pk', flat=True)[:DELETE_BATCH])
+            if not ids:
+                break
+            User.objects.filter(pk__in=ids).delete()
@@ -0,0 +1,227 @@
+import asyncio
+import statistics
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.hashers import make_password
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db.backends.signals import connection_created
+from django.urls import reverse
+from accounts.models import Notification, Profile, User
+from transactions.models import Transaction
+
+BENCH_PREFIX = 'bench_views_'
+PHONE_BASE = 9300000000
+
+
+class QueryLatency:
+    """Sleeps before every query, standing in for the round trip to a database server"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+    def install(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class Command(BaseCommand):
+    help = 'Compare requests/second and latency of the read views served through WSGI and ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=64, help='Concurrent clients')
+        parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads, as in gunicorn --threads')
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration per view and mode')
+        parser.add_argument('--query-latency-ms', type=float, default=0.0,
+                            help='Added to every query; SQLite answers in-process, a database server does not')
+        parser.add_argument('--transactions', type=int, default=200)
+
+    def handle(self, *args, **options):
+        user, staff, detail_id = self._populate(options['transactions'])
+        cookies = {'user': self._session_cookie(user), 'staff': self._session_cookie(staff)}
+        views = [
+            ('dashboard', reverse('accounts:dashboard'), 'user'),
+            ('transaction_history', reverse('transactions:transaction_history'), 'user'),
+            ('transaction_detail', reverse('transactions:transaction_detail', args=[detail_id]), 'user'),
+            ('notifications', reverse('accounts:notifications'), 'user'),
+            ('admin_dashboard', reverse('admin_panel:dashboard'), 'staff'),
+        ]
+        latency = QueryLatency(options['query_latency_ms'] / 1000)
+        if latency.seconds:
+            connection_created.connect(latency.install)
+        wsgi, asgi = get_wsgi_application(), get_asgi_application()
+        self.stdout.write(
+            f"{options['clients']} clients, WSGI with {options['threads']} threads, ASGI on one event loop, "
+            f"{options['query_latency_ms']:g} ms per query"
+        )
+        self.stdout.write(f"{'view':22} {'mode':5} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        try:
+            for name, path, who in views:
+                for mode, run in (('wsgi', self._wsgi), ('asgi', self._asgi)):
+                    timings, errors = run(wsgi if mode == 'wsgi' else asgi, path, cookies[who], options)
+                    timings.sort()
+                    self.stdout.write(
+                        f'{name:22} {mode:5} {len(timings) / options["seconds"]:>8.0f} '
+                        f'{statistics.median(timings):>8.1f} {timings[int(len(timings) * 0.99)]:>8.1f} {errors:>7}'
+                    )
+                    if errors:
+                        raise CommandError(f'{name} failed under {mode.upper()}')
+        finally:
+            connection_created.disconnect(latency.install)
+            engine = import_module(settings.SESSION_ENGINE)
+            for cookie in cookies.values():
+                engine.SessionStore(cookie.split('=', 1)[1]).delete()
+            User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+    def _wsgi(self, application, path, cookie, options):
+        """Requests queue for a fixed pool of worker threads, as under a threaded WSGI server"""
+        deadline = time.perf_counter() + options['seconds']
+        timings, errors = [], [0]
+
+        def serve():
+            status = []
+            body = application(self._environ(path, cookie), lambda s, h, e=None: status.append(s))
+            b''.join(body)
+            body.close()
+            return status[0]
+
+        def client():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                status = workers.submit(serve).result()
+                timings.append((time.perf_counter() - started) * 1000)
+                if not status.startswith('200'):
+                    errors[0] += 1
+
+        with ThreadPoolExecutor(options['threads']) as workers:
+            clients = [threading.Thread(target=client) for _ in range(options['clients'])]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+        return timings, errors[0]
+
+    def _asgi(self, application, path, cookie, options):
+        async def run():
+            deadline = time.perf_counter() + options['seconds']
+            timings, errors = [], 0
+
+            async def client():
+                nonlocal errors
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    status = []
+                    received = asyncio.Event()
+
+                    async def receive():
+                        if received.is_set():
+                            await asyncio.Event().wait()
+                        received.set()
+                        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+                    async def send(message):
+                        if message['type'] == 'http.response.start':
+                            status.append(message['status'])
+
+                    await application(self._scope(path, cookie), receive, send)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    if status[0] != 200:
+                        errors += 1
+
+            await asyncio.gather(*(client() for _ in range(options['clients'])))
+            return timings, errors
+
+        return asyncio.run(run())
+
+    def _environ(self, path, cookie):
+        return {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'QUERY_STRING': '',
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'localhost',
+            'HTTP_COOKIE': cookie,
+            'REMOTE_ADDR': '127.0.0.1',
+            'wsgi.input': BytesIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.url_scheme': 'http',
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'wsgi.version': (1, 0),
+        }
+
+    def _scope(self, path, cookie):
+        return {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())],
+            'client': ('127.0.0.1', 50000),
+            'server': ('localhost', 80),
+        }
+
+    def _session_cookie(self, user):
+        engine = import_module(settings.SESSION_ENGINE)
+        session = engine.SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+    def _populate(self, count):
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        password = make_password(None)
+        user, counterpart, staff = User.objects.bulk_create([
+            User(username=f'{BENCH_PREFIX}{i}', phone_number=f'0{PHONE_BASE + i}', password=password, is_staff=i == 2)
+            for i in range(3)
+        ])
+        Profile.objects.bulk_create([
+            Profile(
+                user=member,
+                full_name=member.username,
+                cnic=f'93333-{i:07d}-3',
+                date_of_birth=date(1990, 1, 1),
+                address='Benchmark',
+                account_number=f'CE{PHONE_BASE + i}',
+                balance=Decimal('1000.00'),
+            )
+            for i, member in enumerate((user, counterpart, staff))
+        ])
+        transactions = Transaction.objects.bulk_create([
+            Transaction(
+                transaction_id=str(uuid.uuid4())[:12],
+                sender=user if i % 2 else counterpart,
+                receiver=counterpart if i % 2 else user,
+                amount=Decimal('10.00'),
+                status='completed',
+            )
+            for i in range(count)
+        ])
+        Notification.objects.bulk_create([
+            Notification(user=user, title='Bench', message=f'Notification {i}', is_read=True) for i in range(50)
+        ])
+        return user, staff, transactions[-1].transaction_id
@@ -0,0 +1,156 @@
+import statistics
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+from itertools import islice
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Count, F, Q
+from accounts import outbox
+from accounts.models import Broadcast, Notification, Profile, User
+from transactions import ledger
+from transactions.models import Transaction
+from transactions.pagination import keyset_page
+
+BENCH_PREFIX = 'bench_bc_'
+PHONE_BASE = 9500000000
+BATCH_SIZE = 5000
+TITLE = 'Benchmark broadcast'
+
+
+class Command(BaseCommand):
+    help = 'Broadcast to a large user base while timing ordinary user traffic against the same database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000000)
+        parser.add_argument('--batch-size', type=int, default=None, help='Users per broadcast chunk')
+        parser.add_argument('--pause', type=float, default=settings.NOTIFICATIONS['BROADCAST_PAUSE_SECONDS'],
+                            help='Seconds between broadcast chunks')
+        parser.add_argument('--baseline-seconds', type=float, default=3.0)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users afterwards')
+
+    def handle(self, *args, **options):
+        self._populate(options['users'])
+        payer, payee = self._traffic_users()
+
+        deadline = time.perf_counter() + options['baseline_seconds']
+        baseline = self._traffic(payer, payee, lambda: time.perf_counter() < deadline)
+
+        broadcast = outbox.broadcast(TITLE, 'Scheduled maintenance tonight from 02:00 to 03:00.')
+        self.stdout.write(f'Broadcast {broadcast.pk} to {broadcast.total_users} users')
+        chunks, busy = [], [0]
+        done = threading.Event()
+
+        def worker():
+            try:
+                while True:
+                    chunk_started = time.perf_counter()
+                    try:
+                        current = outbox.deliver_broadcast(options['batch_size'])
+                    except OperationalError:
+                        busy[0] += 1
+                        time.sleep(0.05)
+                        continue
+                    if current is None:
+                        break
+                    chunks.append((time.perf_counter() - chunk_started) * 1000)
+                    time.sleep(options['pause'])
+                    if len(chunks) % 50 == 0:
+                        self.stdout.write(f'\r{current.delivered}/{current.total_users} users ({current.progress}%)', ending='')
+            finally:
+                connection.close()
+                done.set()
+
+        started = time.perf_counter()
+        thread = threading.Thread(target=worker)
+        thread.start()
+        during = self._traffic(payer, payee, lambda: not done.is_set())
+        thread.join()
+        elapsed = time.perf_counter() - started
+        self.stdout.write('')
+
+        broadcast.refresh_from_db()
+        self.stdout.write(
+            f'Delivered {broadcast.delivered} in {elapsed:.1f}s ({broadcast.delivered / elapsed:.0f} users/second), '
+            f'{len(chunks)} chunks, chunk p50 {statistics.median(chunks):.0f} ms, max {max(chunks):.0f} ms, '
+            f'{busy[0]} busy retries'
+        )
+        self.stdout.write(f"{'user traffic':24} {'ops':>6} {'errors':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for name, (timings, errors) in (('before the broadcast', baseline), ('during the broadcast', during)):
+            p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+            self.stdout.write(
+                f'{name:24} {len(timings):>6} {errors:>7} {statistics.median(timings):>8.1f} {p99:>8.1f} {timings[-1]:>8.1f}'
+            )
+
+        received = Notification.objects.filter(title=TITLE).count()
+        mismatched = User.objects.filter(username__startswith=BENCH_PREFIX, pk__lte=broadcast.last_user_id).annotate(
+            unread=Count('notification', filter=Q(notification__is_read=False))
+        ).exclude(unread_notifications=F('unread')).count()
+        self.stdout.write(f'Notifications written: {received}, unread counters off: {mismatched}')
+
+        Notification.objects.filter(title=TITLE).delete()
+        Broadcast.objects.filter(title=TITLE).delete()
+        outbox.recount(User.objects.filter(pk__lte=broadcast.last_user_id).exclude(username__startswith=BENCH_PREFIX))
+        Transaction.objects.filter(sender=payer).delete()
+        if not options['keep']:
+            User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        else:
+            User.objects.filter(username__startswith=BENCH_PREFIX).update(unread_notifications=0)
+
+        if received != broadcast.total_users or mismatched:
+            raise CommandError('The broadcast missed users or miscounted unread notifications')
+        self.stdout.write(self.style.SUCCESS('Every user received the broadcast exactly once'))
+
+    def _traffic(self, payer, payee, running):
+        """Transfers and inbox reads back to back while ``running()``; returns sorted timings and errors"""
+        timings, errors = [], 0
+        while running():
+            op_started = time.perf_counter()
+            try:
+                ledger.transfer(payer, payee, Decimal('0.01'))
+                page, _ = keyset_page(payee.notification_set.all())
+                list(page)
+            except OperationalError:
+                errors += 1
+            timings.append((time.perf_counter() - op_started) * 1000)
+        return sorted(timings), errors
+
+    def _traffic_users(self):
+        users = list(User.objects.filter(username__startswith=BENCH_PREFIX).order_by('pk')[:2])
+        Profile.objects.filter(user=users[0]).update(balance=Decimal('1000000.00'))
+        return users
+
+    def _populate(self, total):
+        # Leftovers of an interrupted run
+        Notification.objects.filter(title=TITLE).delete()
+        Broadcast.objects.filter(title=TITLE).delete()
+        User.objects.filter(username__startswith=BENCH_PREFIX).update(unread_notifications=0)
+        existing = User.objects.filter(username__startswith=BENCH_PREFIX).count()
+        # Hashing a password per user would dominate the run
+        password = make_password(None)
+        users = (
+            User(username=f'{BENCH_PREFIX}{i:07d}', phone_number=f'0{PHONE_BASE + i}', password=password)
+            for i in range(existing, total)
+        )
+        created = existing
+        while batch := list(islice(users, BATCH_SIZE)):
+            batch = User.objects.bulk_create(batch)
+            if created == 0:
+                # Only the two traffic users need accounts
+                Profile.objects.bulk_create([
+                    Profile(
+                        user=user,
+                        full_name=user.username,
+                        cnic=f'95555-{offset:07d}-5',
+                        date_of_birth=date(1990, 1, 1),
+                        address='Benchmark',
+                        account_number=f'CE{9500000000 + offset}',
+                    )
+                    for offset, user in enumerate(batch[:2])
+                ])
+            created += len(batch)
+            self.stdout.write(f'\r{created}/{total} users', ending='')
+        self.stdout.write('')
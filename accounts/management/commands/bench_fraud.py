@@ -0,0 +1,79 @@
+import statistics
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from accounts import velocity
+from accounts.models import User
+from transactions.models import Transaction
+
+BENCH_PREFIX = 'bench_fraud_'
+
+
+def legacy_detect_fraud(user, amount):
+    """The previous per-call implementation, kept for comparison"""
+    recent_transactions = Transaction.objects.filter(
+        sender=user,
+        created_at__gte=timezone.now() - timedelta(hours=1),
+        status='completed'
+    )
+    total_recent = sum(t.amount for t in recent_transactions)
+    if total_recent + amount > 50000:
+        return True, "Multiple large transactions detected"
+    if amount > 100000:
+        return True, "Large transaction amount"
+    return False, "Transaction appears normal"
+
+
+class Command(BaseCommand):
+    help = 'Compare fraud check latency of the old query-per-call rule and the velocity counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--per-hour', type=int, default=10000, help='Completed debits in the last hour')
+        parser.add_argument('--checks', type=int, default=200)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users afterwards')
+
+    def handle(self, *args, **options):
+        user, other = self._populate(options['per_hour'])
+        amount = Decimal('1.00')
+
+        legacy = self._time(lambda: legacy_detect_fraud(user, amount), options['checks'])
+        # The first check seeds the counters from the database; time the steady state
+        velocity.check(user, amount, other)
+        current = self._time(lambda: velocity.check(user, amount, other), options['checks'])
+
+        self.stdout.write(f"{options['per_hour']} debits in the last hour, {options['checks']} checks")
+        self.stdout.write(f"{'':10} {'p50 ms':>10} {'p99 ms':>10}")
+        for name, timings in (('legacy', legacy), ('velocity', current)):
+            p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+            self.stdout.write(f'{name:10} {statistics.median(timings):>10.3f} {p99:>10.3f}')
+
+        if not options['keep']:
+            User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+    def _time(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return sorted(timings)
+
+    def _populate(self, count):
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        user = User.objects.create(username=f'{BENCH_PREFIX}user', phone_number='09700000001')
+        other = User.objects.create(username=f'{BENCH_PREFIX}other', phone_number='09700000002')
+        Transaction.objects.bulk_create([
+            Transaction(
+                transaction_id=uuid.uuid4().hex[:12],
+                sender=user,
+                receiver=other,
+                transaction_type='send',
+                amount=Decimal('0.01'),
+                status='completed',
+            )
+            for _ in range(count)
+        ], batch_size=5000)
+        return user, other
@@ -0,0 +1,234 @@
+import asyncio
+import statistics
+import time
+from datetime import date
+from decimal import Decimal
+from importlib import import_module
+from urllib.parse import urlsplit
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from accounts import live
+from accounts.models import Profile, User
+from transactions import ledger
+from transactions.models import Transaction
+
+BENCH_PREFIX = 'bench_live_'
+PHONE_BASE = 9400000000
+
+
+def _rss_mb(pid='self'):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class Connection:
+    """One simulated client of live.application, driven without a server"""
+
+    def __init__(self, cookie):
+        self.scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': reverse('accounts:live_updates'),
+            'query_string': b'',
+            'headers': [(b'cookie', cookie.encode())],
+        }
+        self.gone = asyncio.Event()
+        self.status = None
+        self.chunks = []
+        self.read = 0
+        self.received = asyncio.Event()
+
+    async def receive(self):
+        await self.gone.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif message.get('body'):
+            self.chunks.append(message['body'])
+            self.received.set()
+
+    async def wait_for(self, event):
+        """Wait for a chunk carrying ``event``, skipping keepalives and anything else"""
+        marker = f'event: {event}'.encode()
+        while True:
+            while self.read < len(self.chunks):
+                self.read += 1
+                if marker in self.chunks[self.read - 1]:
+                    return
+            self.received.clear()
+            await self.received.wait()
+
+
+class Command(BaseCommand):
+    help = 'Hold thousands of idle live update streams on one process and time an update reaching all of them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=1000, help='Streams are spread over this many users')
+        parser.add_argument('--url', help='Connect over TCP to a running ASGI server instead, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--server-pid', type=int, help='Report the memory of the server process (with --url)')
+        parser.add_argument('--hold', type=float, default=30.0, help='Seconds to hold the connections (with --url)')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users afterwards')
+
+    def handle(self, *args, **options):
+        users = self._populate(options['users'])
+        cookies = [self._session_cookie(user) for user in users]
+        try:
+            if options['url']:
+                asyncio.run(self._over_tcp(options, cookies))
+            else:
+                asyncio.run(self._in_process(options, users, cookies))
+        finally:
+            Transaction.objects.filter(sender__username__startswith=BENCH_PREFIX).delete()
+            engine = import_module(settings.SESSION_ENGINE)
+            for cookie in cookies:
+                engine.SessionStore(cookie.split('=', 1)[1]).delete()
+            if not options['keep']:
+                User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+    async def _in_process(self, options, users, cookies):
+        backend = live.get_backend()
+        count = options['connections']
+        rss_before = _rss_mb()
+        started = time.perf_counter()
+        connections = [Connection(cookies[i % len(cookies)]) for i in range(count)]
+        tasks = [
+            asyncio.ensure_future(live.application(conn.scope, conn.receive, conn.send)) for conn in connections
+        ]
+        await asyncio.gather(*(conn.wait_for('unread') for conn in connections))
+        opened = time.perf_counter() - started
+        grown = _rss_mb() - rss_before
+        refused = sum(conn.status != 200 for conn in connections)
+        self.stdout.write(
+            f'{count} streams open in {opened:.1f}s, {backend.stream_count()} subscribed, {refused} refused, '
+            f'RSS +{grown:.0f} MB ({grown * 1024 / count:.1f} KiB each), '
+            f'{len(asyncio.all_tasks())} tasks'
+        )
+
+        # Every stream idles: nothing runs until an event or a keepalive is due
+        await asyncio.sleep(1)
+
+        # One transfer reaches the streams of both parties only
+        payer, payee = users[0], users[1]
+        watched = [conn for i, conn in enumerate(connections) if i % len(users) in (0, 1)]
+        started = time.perf_counter()
+        await sync_to_async(ledger.transfer)(payer, payee, Decimal('1.00'))
+        try:
+            await asyncio.wait_for(asyncio.gather(*(conn.wait_for('balance') for conn in watched)), 10)
+        except asyncio.TimeoutError:
+            raise CommandError('A stream of the transfer parties missed its balance update')
+        self.stdout.write(
+            f'Transfer reached {len(watched)} streams of both parties in {(time.perf_counter() - started) * 1000:.1f} ms'
+        )
+
+        # An event for every user at once, as a broadcast with a shared backend would send
+        latencies = []
+        sent = {}
+
+        async def timed(conn):
+            await conn.wait_for('notification')
+            latencies.append((time.perf_counter() - sent['at']) * 1000)
+
+        waits = [asyncio.ensure_future(timed(conn)) for conn in connections]
+        await asyncio.sleep(0)
+        sent['at'] = time.perf_counter()
+        live.publish([user.pk for user in users], {'type': 'notification', 'title': 'Bench', 'message': 'Fan out'})
+        await asyncio.gather(*waits)
+        latencies.sort()
+        self.stdout.write(
+            f'Notification to {len(users)} users reached {len(latencies)} streams: p50 {statistics.median(latencies):.1f} ms, '
+            f'p99 {latencies[int(len(latencies) * 0.99)]:.1f} ms, last {latencies[-1]:.1f} ms'
+        )
+
+        for conn in connections:
+            conn.gone.set()
+        await asyncio.gather(*tasks)
+        left = backend.stream_count()
+        self.stdout.write(f'After every client disconnected: {left} subscriptions left')
+        if refused or left:
+            raise CommandError('Streams were refused or not cleaned up')
+        self.stdout.write(self.style.SUCCESS(f'Held {count} idle streams in one process'))
+
+    async def _over_tcp(self, options, cookies):
+        url = urlsplit(options['url'])
+        path = reverse('accounts:live_updates')
+        count = options['connections']
+        server_before = _rss_mb(options['server_pid']) if options['server_pid'] else None
+
+        async def connect(cookie):
+            reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+            writer.write(
+                f'GET {path} HTTP/1.1\r\nHost: {url.netloc}\r\nAccept: text/event-stream\r\nCookie: {cookie}\r\n\r\n'.encode()
+            )
+            head = await reader.readuntil(b'\r\n\r\n')
+            if b' 200 ' not in head.split(b'\r\n', 1)[0]:
+                raise CommandError(f'Stream refused: {head.decode()}')
+            await reader.readuntil(b'event: unread')
+            return reader, writer
+
+        # Open in waves so the listen backlog is not the limit being measured
+        started = time.perf_counter()
+        streams = []
+        for start in range(0, count, 500):
+            streams += await asyncio.gather(*(connect(cookies[i % len(cookies)]) for i in range(start, min(start + 500, count))))
+        self.stdout.write(f'{len(streams)} streams open in {time.perf_counter() - started:.1f}s')
+
+        async def alive(reader):
+            # A keepalive or any event proves the server still serves the stream
+            try:
+                return bool(await asyncio.wait_for(reader.read(1024), options['hold']))
+            except asyncio.TimeoutError:
+                return False
+
+        results = await asyncio.gather(*(alive(reader) for reader, _ in streams))
+        self.stdout.write(f'{sum(results)}/{len(streams)} streams still served after {options["hold"]:.0f}s idle')
+        if server_before is not None:
+            server_after = _rss_mb(options['server_pid'])
+            self.stdout.write(
+                f'Server RSS {server_before:.0f} MB before, {server_after:.0f} MB with the streams open '
+                f'({(server_after - server_before) * 1024 / len(streams):.1f} KiB each)'
+            )
+        for _, writer in streams:
+            writer.close()
+        if not all(results):
+            raise CommandError('Some streams went quiet')
+        self.stdout.write(self.style.SUCCESS(f'Held {len(streams)} idle streams on one server'))
+
+    def _session_cookie(self, user):
+        engine = import_module(settings.SESSION_ENGINE)
+        session = engine.SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+    def _populate(self, count):
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        password = make_password(None)
+        users = User.objects.bulk_create([
+            User(username=f'{BENCH_PREFIX}{i}', phone_number=f'0{PHONE_BASE + i}', password=password)
+            for i in range(count)
+        ], batch_size=5000)
+        Profile.objects.bulk_create([
+            Profile(
+                user=user,
+                full_name=user.username,
+                cnic=f'94444-{i:07d}-4',
+                date_of_birth=date(1990, 1, 1),
+                address='Benchmark',
+                account_number=f'CE{PHONE_BASE + i}',
+                balance=Decimal('1000.00'),
+            )
+            for i, user in enumerate(users)
+        ], batch_size=5000)
+        return users
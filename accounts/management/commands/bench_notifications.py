@@ -0,0 +1,91 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, Q
+from accounts import outbox
+from accounts.models import Notification, NotificationOutbox, User
+from transactions.pagination import keyset_page
+
+BENCH_PREFIX = 'bench_notif_'
+PHONE_BASE = 9600000000
+
+
+def legacy_notifications_page(user):
+    """The previous notifications view: every row fetched and every row updated"""
+    notifications = user.notification_set.all().order_by('-created_at')
+    rows = list(notifications)
+    notifications.update(is_read=True)
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Compare per-row notification writes with outbox delivery, and the old and paginated inbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--events', type=int, default=100000, help='Notifications queued for delivery')
+        parser.add_argument('--legacy-events', type=int, default=5000, help='Notifications written one by one')
+        parser.add_argument('--inbox', type=int, default=50000, help='Notifications held by the heavy user')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users afterwards')
+
+    def handle(self, *args, **options):
+        users = self._populate(options['users'])
+        user_ids = [user.pk for user in users]
+        bench_users = User.objects.filter(username__startswith=BENCH_PREFIX)
+        NotificationOutbox.objects.filter(user__in=bench_users).delete()
+
+        started = time.perf_counter()
+        for i in range(options['legacy_events']):
+            Notification.objects.create(user_id=user_ids[i % len(user_ids)], title='Bench', message=f'Legacy {i}')
+        legacy_rate = options['legacy_events'] / (time.perf_counter() - started)
+        Notification.objects.filter(user__in=bench_users).delete()
+        bench_users.update(unread_notifications=0)
+
+        started = time.perf_counter()
+        outbox.notify_many((user_ids[i % len(user_ids)], 'Bench', f'Queued {i}') for i in range(options['events']))
+        queued = time.perf_counter() - started
+        started = time.perf_counter()
+        delivered = 0
+        while True:
+            count = outbox.deliver()
+            if not count:
+                break
+            delivered += count
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'one create per notification    {legacy_rate:>10.0f} notifications/second')
+        self.stdout.write(f'outbox enqueue                 {options["events"] / queued:>10.0f} notifications/second')
+        self.stdout.write(f'outbox delivery                {delivered / elapsed:>10.0f} notifications/second')
+
+        mismatched = bench_users.annotate(
+            unread=Count('notification', filter=Q(notification__is_read=False))
+        ).exclude(unread_notifications=F('unread')).count()
+        self.stdout.write(f'Users whose unread counter disagrees with the table: {mismatched}')
+
+        heavy = users[0]
+        Notification.objects.bulk_create(
+            [Notification(user=heavy, title='Bench', message=f'Inbox {i}') for i in range(options['inbox'])],
+            batch_size=5000,
+        )
+        outbox.recount(User.objects.filter(pk=heavy.pk))
+        started = time.perf_counter()
+        page, _ = keyset_page(heavy.notification_set.all())
+        outbox.mark_read(heavy, [n.pk for n in page if not n.is_read])
+        paginated = time.perf_counter() - started
+        started = time.perf_counter()
+        legacy_notifications_page(heavy)
+        legacy = time.perf_counter() - started
+        self.stdout.write(f'Inbox of {options["inbox"]}: legacy page {legacy * 1000:.1f} ms, paginated {paginated * 1000:.1f} ms')
+
+        if not options['keep']:
+            Notification.objects.filter(user__in=bench_users).delete()
+            bench_users.delete()
+
+        if delivered != options['events'] or mismatched:
+            raise CommandError('Outbox delivery lost notifications or miscounted unread')
+        self.stdout.write(self.style.SUCCESS('Every queued notification was delivered and counted'))
+
+    def _populate(self, count):
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        return User.objects.bulk_create([
+            User(username=f'{BENCH_PREFIX}{i}', phone_number=f'0{PHONE_BASE + i}')
+            for i in range(count)
+        ], batch_size=5000)
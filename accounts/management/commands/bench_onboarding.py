@@ -0,0 +1,101 @@
+import csv
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from accounts import onboarding
+from accounts.models import User
+
+BENCH_PREFIX = 'bench_onboard_'
+PHONE_BASE = 9300000000
+DELETE_BATCH = 10000
+
+
+class Command(BaseCommand):
+    help = 'Onboard a synthetic customer file with some bad and duplicate rows, and time it (use a scratch database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=1000000)
+        parser.add_argument('--plaintext', type=float, default=0.0,
+                            help='Share of rows with a plaintext password to hash; the rest bring a hash or none')
+        parser.add_argument('--bad', type=float, default=0.01, help='Share of invalid and duplicate rows')
+        parser.add_argument('--batch-size', type=int, default=onboarding.BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=None)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users afterwards')
+
+    def handle(self, *args, **options):
+        self._cleanup()
+        with tempfile.TemporaryDirectory() as scratch:
+            path = os.path.join(scratch, 'customers.csv')
+            expected = self._write(path, options)
+            started = time.perf_counter()
+            with open(path, newline='') as source:
+                counts = Counter(
+                    result['status'] for result in onboarding.onboard(
+                        onboarding.read_customers(source), batch_size=options['batch_size'], workers=options['workers']
+                    )
+                )
+            elapsed = time.perf_counter() - started
+        try:
+            rate = options['customers'] / elapsed
+            self.stdout.write(
+                f"{options['customers']:,} rows in {elapsed:.0f}s ({rate:,.0f} rows/s, 1M rows in {1000000 / rate / 60:.1f} min): "
+                f"{counts['created']:,} created, {counts['rejected']:,} rejected"
+            )
+            if counts != expected:
+                raise CommandError(f'Expected {dict(expected)}, got {dict(counts)}')
+        finally:
+            if not options['keep']:
+                self._cleanup()
+
+    def _write(self, path, options):
+        """Write the customer file; returns how many rows should be created and rejected"""
+        rng = random.Random(0)
+        # Every pre-hashed row shares one hash, as the cost of making them is not what is measured
+        password_hash = make_password('migrated-password')
+        expected = Counter()
+        with open(path, 'w', newline='') as handle:
+            writer = csv.DictWriter(handle, onboarding.FIELDS)
+            writer.writeheader()
+            for i in range(options['customers']):
+                row = {
+                    'username': f'{BENCH_PREFIX}{i}',
+                    'email': f'{BENCH_PREFIX}{i}@example.com',
+                    'first_name': 'Bench',
+                    'last_name': str(i),
+                    'phone_number': f'0{PHONE_BASE + i}',
+                    'cnic': f'93333{i:07d}3',
+                    'date_of_birth': '1990-01-01',
+                    'address': 'Benchmark',
+                    'password': '',
+                    'password_hash': '',
+                    'pin': '1234',
+                }
+                kind = rng.random()
+                if kind < options['plaintext']:
+                    row['password'] = f'secret-{i}'
+                elif kind < 0.9:
+                    row['password_hash'] = password_hash
+                if i and rng.random() < options['bad']:
+                    # Half reuse the first customer's phone number, half have an impossible date
+                    if rng.random() < 0.5:
+                        row['phone_number'] = f'0{PHONE_BASE}'
+                    else:
+                        row['date_of_birth'] = '1990-02-30'
+                    expected['rejected'] += 1
+                else:
+                    expected['created'] += 1
+                writer.writerow(row)
+        return expected
+
+    def _cleanup(self):
+        # In id chunks, so the cascade never loads every benchmark user at once
+        bench = User.objects.filter(username__startswith=BENCH_PREFIX).order_by('pk')
+        while True:
+            ids = list(bench.values_list('pk', flat=True)[:DELETE_BATCH])
+            if not ids:
+                break
+            User.objects.filter(pk__in=ids).delete()
@@ -0,0 +1,58 @@
+import csv
+import sys
+import time
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from accounts import onboarding
+
+RESULT_FIELDS = ['line', 'username', 'status', 'user_id', 'account_number', 'error']
+
+
+class Command(BaseCommand):
+    help = (
+        'Create a user and profile for every row of a CSV or JSONL customer file '
+        f"({', '.join(onboarding.FIELDS)})"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Customer file, or - for stdin')
+        parser.add_argument('--format', choices=onboarding.FORMATS, default=None,
+                            help='Defaults to jsonl for .jsonl files and csv otherwise')
+        parser.add_argument('--batch-size', type=int, default=onboarding.BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Processes hashing plaintext passwords (default: one per CPU)')
+        parser.add_argument('--output', help='Write per-row results to this CSV file')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('jsonl' if options['file'].endswith('.jsonl') else 'csv')
+
+        source = sys.stdin if options['file'] == '-' else open(options['file'], encoding='utf-8-sig', newline='')
+        output = open(options['output'], 'w', newline='') if options['output'] else None
+        writer = csv.DictWriter(output, RESULT_FIELDS) if output else None
+        if writer:
+            writer.writeheader()
+        counts = Counter()
+        started = time.perf_counter()
+        try:
+            results = onboarding.onboard(
+                onboarding.read_customers(source, fmt),
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+            )
+            for result in results:
+                counts[result['status']] += 1
+                if writer:
+                    writer.writerow(result)
+                elif result['status'] != 'created':
+                    self.stderr.write(f"line {result['line']}: {result['error']}")
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if output:
+                output.close()
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"Created {counts['created']}, rejected {counts['rejected']} in {elapsed:.1f}s")
+        if counts['rejected']:
+            raise CommandError(f"{counts['rejected']} customers were rejected")
+        self.stdout.write(self.style.SUCCESS('All customers created'))
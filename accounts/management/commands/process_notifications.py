@@ -0,0 +1,60 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+from accounts import outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued notifications and broadcasts in batches, polling until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.NOTIFICATIONS['BATCH_SIZE'])
+        parser.add_argument('--broadcast-batch-size', type=int,
+                            default=settings.NOTIFICATIONS['BROADCAST_BATCH_SIZE'])
+        parser.add_argument('--broadcast-pause', type=float,
+                            default=settings.NOTIFICATIONS['BROADCAST_PAUSE_SECONDS'],
+                            help='Seconds between broadcast chunks, leaving the database to user traffic')
+        parser.add_argument('--interval', type=float, default=settings.NOTIFICATIONS['POLL_SECONDS'],
+                            help='Seconds to wait when there is nothing to deliver')
+        parser.add_argument('--once', action='store_true', help='Deliver everything pending and exit')
+        parser.add_argument('--recount', action='store_true',
+                            help='Rebuild every unread counter from the Notification table first')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            self.stdout.write(f'Recounted unread notifications for {outbox.recount()} users')
+        delivered = 0
+        reported = {}
+        try:
+            while True:
+                # Personal notifications and broadcast chunks take turns, so a
+                # large broadcast never holds up a transfer receipt
+                try:
+                    count = outbox.deliver(options['batch_size'])
+                    delivered += count
+                    broadcast = outbox.deliver_broadcast(options['broadcast_batch_size'])
+                except OperationalError as e:
+                    # SQLite reports a busy database instead of waiting when two
+                    # transactions both want to write; each batch is atomic, so retry
+                    self.stderr.write(f'Delivery failed, retrying: {e}')
+                    time.sleep(options['interval'])
+                    continue
+                if broadcast is not None and (
+                    broadcast.completed_at or broadcast.progress >= reported.get(broadcast.pk, 0) + 10
+                ):
+                    reported[broadcast.pk] = broadcast.progress
+                    self.stdout.write(
+                        f'Broadcast {broadcast.pk}: {broadcast.delivered}/{broadcast.total_users} users '
+                        f'({broadcast.progress}%)'
+                    )
+                # A full batch or an unfinished broadcast means there is more waiting
+                if count < options['batch_size'] and broadcast is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                elif broadcast is not None and not broadcast.completed_at:
+                    time.sleep(options['broadcast_pause'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Delivered {delivered} notifications'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from accounts import search_index
+
+
+class Command(BaseCommand):
+    help = 'Recreate the substring search index over users and profiles'
+
+    def handle(self, *args, **options):
+        if not search_index.install(connection):
+            raise CommandError(f'No substring search index available on {connection.vendor}')
+        self.stdout.write(self.style.SUCCESS('User search index rebuilt'))
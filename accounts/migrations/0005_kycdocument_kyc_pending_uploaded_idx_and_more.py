@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_alter_user_phone_number'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='kycdocument',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['uploaded_at'], name='kyc_pending_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', 'created_at'], name='notif_user_read_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'created_at'], name='notif_user_created_idx'),
+        ),
+    ]
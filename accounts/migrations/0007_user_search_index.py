@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from accounts import search_index
+
+
+def install(apps, schema_editor):
+    search_index.install(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    search_index.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0006_user_user_date_joined_idx_user_user_email_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:06
+
+from django.db import migrations, models
+
+
+def start_sequence(apps, schema_editor):
+    AccountNumberSequence = apps.get_model('accounts', 'AccountNumberSequence')
+    AccountNumberSequence.objects.create(pk=1, next_serial=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_broadcast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_serial', models.PositiveBigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(start_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+from accounts import search_index
+
+
+def install(apps, schema_editor):
+    # 0008 added User.unread_notifications, which SQLite applies by rebuilding
+    # accounts_user and dropping the search triggers on it
+    search_index.install(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0010_account_number_sequence"),
+    ]
+
+    operations = [
+        migrations.RunPython(install, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:37
+
+from django.db import migrations, models
+
+
+def count_users(apps, schema_editor):
+    User = apps.get_model('accounts', 'User')
+    apps.get_model('accounts', 'UserCounts').objects.create(
+        pk=1,
+        total=User.objects.count(),
+        active=User.objects.filter(is_active=True, is_blocked=False).count(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_reinstall_user_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounts',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.BigIntegerField(default=0)),
+                ('active', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:39
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+from accounts import search_index
+
+
+def install(apps, schema_editor):
+    # Recreates the search table with the email column
+    search_index.install(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_user_counts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(django.db.models.functions.text.Lower('username'), name='user_username_lower_idx'),
+        ),
+        migrations.RunPython(install, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Lower
 from django.core.validators import RegexValidator
+from . import numbers
 import uuid
 
 class User(AbstractUser):
@@ -10,6 +12,17 @@ class User(AbstractUser):
     is_blocked = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Kept current by accounts.outbox so the header badge needs no COUNT query
+    unread_notifications = models.PositiveIntegerField(default=0)
+    
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Admin user list order and email prefix search
+            models.Index(fields=['date_joined'], name='user_date_joined_idx'),
+            models.Index(fields=['email'], name='user_email_idx'),
+            # Case-insensitive username prefix search
+            models.Index(Lower('username'), name='user_username_lower_idx'),
+        ]
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -25,15 +38,22 @@ class Profile(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.account_number:
-            # Generate unique 12-digit account number
-            import random
-            while True:
-                account_num = f"CE{random.randint(1000000000, 9999999999)}"
-                if not Profile.objects.filter(account_number=account_num).exists():
-                    self.account_number = account_num
-                    break
+            self.account_number = numbers.new_number()
         super().save(*args, **kwargs)
 
+class AccountNumberSequence(models.Model):
+    """The next account number serial not yet reserved by any worker; a single row"""
+    SINGLETON = 1
+
+    next_serial = models.PositiveBigIntegerField(default=1)
+
+class UserCounts(models.Model):
+    """How many users exist and how many are active and not blocked; a single row kept by accounts.user_counts"""
+    SINGLETON = 1
+
+    total = models.BigIntegerField(default=0)
+    active = models.BigIntegerField(default=0)
+
 class KYCDocument(models.Model):
     DOCUMENT_TYPES = [
         ('cnic_front', 'CNIC Front'),
@@ -54,6 +74,12 @@ class KYCDocument(models.Model):
     uploaded_at = models.DateTimeField(auto_now_add=True)
     reviewed_at = models.DateTimeField(blank=True, null=True)
     reviewer_notes = models.TextField(blank=True)
+    
+    class Meta:
+        indexes = [
+            # Only the small pending backlog is indexed for the review queue
+            models.Index(fields=['uploaded_at'], condition=models.Q(status='pending'), name='kyc_pending_uploaded_idx'),
+        ]
 
 class OTPVerification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -68,4 +94,35 @@ class Notification(models.Model):
     title = models.CharField(max_length=100)
     message = models.TextField()
     is_read = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notif_user_read_created_idx'),
+            models.Index(fields=['user', 'created_at'], name='notif_user_created_idx'),
+        ]
+
+class NotificationOutbox(models.Model):
+    """A notification waiting to be delivered by manage.py process_notifications"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    title = models.CharField(max_length=100)
+    message = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+class Broadcast(models.Model):
+    """A notification for every active user, fanned out in chunks by process_notifications"""
+    title = models.CharField(max_length=100)
+    message = models.TextField()
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Recipients are the users active with an id up to last_user_id when it was sent
+    last_user_id = models.BigIntegerField(default=0)
+    total_users = models.PositiveIntegerField(default=0)
+    # Fan-out cursor: every recipient with an id up to delivered_until has the notification
+    delivered_until = models.BigIntegerField(default=0)
+    delivered = models.PositiveIntegerField(default=0)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    @property
+    def progress(self):
+        return 100 if not self.total_users else min(100, self.delivered * 100 // self.total_users)
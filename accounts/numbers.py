@@ -0,0 +1,154 @@
+"""Account numbers.
+
+Account numbers used to be 10 random digits, checked with one query per
+attempt until a free one turned up, and two registrations could still
+pick the same number between the check and the insert. They are now
+serials handed out from blocks. A worker reserves the next
+ACCOUNT_NUMBER_BLOCK_SIZE serials with one UPDATE of
+AccountNumberSequence and numbers its next registrations from the block
+without touching the database. Blocks never overlap, so neither do the
+numbers, and a serial left over when a worker stops is simply never used.
+
+A new number is CE, a 0, the serial in at least 8 digits and a Luhn check
+digit, e.g. CE0000000018. The random numbers never start with 0, so the
+two kinds cannot clash. ``is_valid`` catches a mistyped digit and most
+swapped neighbours in a new number; the staff user search uses it to flag
+a number that cannot exist.
+
+A block reserved inside a database transaction only counts as reserved
+once that transaction commits. Until then only the registration that
+reserved it takes numbers from it, so a rolled-back reservation can never
+have handed out numbers that a later reservation hands out again.
+
+If the sequence row is missing, as after a flush, the next reservation
+recreates it after the highest number in use.
+"""
+import os
+import re
+import threading
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Length
+
+PREFIX = 'CE0'
+SERIAL_DIGITS = 8
+
+
+def check_digit(digits):
+    """The Luhn digit that makes ``digits`` followed by it pass the check"""
+    total = 0
+    for position, digit in enumerate(reversed(digits)):
+        digit = int(digit)
+        if position % 2 == 0:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return str(-total % 10)
+
+
+def format_number(serial):
+    digits = f'{serial:0{SERIAL_DIGITS}d}'
+    return f'{PREFIX}{digits}{check_digit(digits)}'
+
+
+def _compact(account_number):
+    return re.sub(r'[\s-]', '', account_number).upper()
+
+
+def is_valid(account_number):
+    """Whether ``account_number`` is a well-formed block-allocated number"""
+    match = re.fullmatch(rf'{PREFIX}(\d{{{SERIAL_DIGITS},}})(\d)', _compact(account_number))
+    return match is not None and check_digit(match.group(1)) == match.group(2)
+
+
+def is_mistyped(account_number):
+    """Whether ``account_number`` is as long as a block-allocated number but fails its check digit"""
+    full_length = re.fullmatch(rf'{PREFIX}\d{{{SERIAL_DIGITS + 1},}}', _compact(account_number))
+    return full_length is not None and not is_valid(account_number)
+
+
+def _next_free_serial(profiles):
+    """One past the highest serial in use among ``profiles``"""
+    last = (
+        profiles.filter(account_number__startswith=PREFIX)
+        .order_by(Length('account_number').desc(), '-account_number')
+        .values_list('account_number', flat=True).first()
+    )
+    return int(last[len(PREFIX):-1]) + 1 if last else 1
+
+
+def reserve(count):
+    """Reserve ``count`` serials; returns the first. Joins the caller's transaction if there is one."""
+    # Imported here: accounts.models uses this module
+    from .models import AccountNumberSequence, Profile
+
+    sequence = AccountNumberSequence.objects.filter(pk=AccountNumberSequence.SINGLETON)
+    with transaction.atomic():
+        if not sequence.update(next_serial=F('next_serial') + count):
+            # get_or_create rereads the row if a concurrent reservation created it first
+            AccountNumberSequence.objects.get_or_create(
+                pk=AccountNumberSequence.SINGLETON, defaults={'next_serial': _next_free_serial(Profile.objects)},
+            )
+            sequence.update(next_serial=F('next_serial') + count)
+        # The UPDATE holds the row (the whole database on SQLite) until the transaction ends
+        end = sequence.values_list('next_serial', flat=True).get()
+    return end - count
+
+
+class BlockAllocator:
+    """Hands out account numbers from reserved blocks; safe to call from any thread"""
+
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._blocks = []
+
+    def _adopt(self, start, end):
+        with self._lock:
+            if self._pid == os.getpid() and start < end:
+                self._blocks.append([start, end])
+
+    def allocate(self, count=1):
+        """``count`` new account numbers"""
+        numbers = []
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker must not number from its parent's blocks
+                self._pid, self._blocks = os.getpid(), []
+            while self._blocks and len(numbers) < count:
+                block = self._blocks[0]
+                taken = min(count - len(numbers), block[1] - block[0])
+                numbers.extend(range(block[0], block[0] + taken))
+                block[0] += taken
+                if block[0] == block[1]:
+                    self._blocks.pop(0)
+        if len(numbers) < count:
+            needed = count - len(numbers)
+            size = max(needed, self.block_size)
+            start = reserve(size)
+            numbers.extend(range(start, start + needed))
+            if connection.in_atomic_block:
+                transaction.on_commit(lambda: self._adopt(start + needed, start + size))
+            else:
+                self._adopt(start + needed, start + size)
+        return [format_number(serial) for serial in numbers]
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_allocator():
+    global _allocator
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                _allocator = BlockAllocator(settings.ACCOUNT_NUMBER_BLOCK_SIZE)
+    return _allocator
+
+
+def new_number():
+    return get_allocator().allocate()[0]
@@ -0,0 +1,221 @@
+"""Bulk onboarding: creating many customers at once from a CSV or JSONL file.
+
+Rows are processed in batches. Each batch is checked for usernames, phone
+numbers and CNICs already taken with one ``__in`` query per column. A
+value used twice in the file is rejected on every row after its first.
+Valid rows are inserted with ``bulk_create`` in one database transaction
+per batch, with account numbers from one allocator reservation. Each input
+row gets exactly one result, either created or rejected with the reason.
+
+Hashing a password costs as much CPU as hundreds of inserts, so plaintext
+passwords are hashed in a pool of processes. A row can instead bring a
+``password_hash`` that Django already understands, as when customers move
+over from another Django deployment. A row with neither gets an unusable
+password, and the customer sets one through password reset.
+"""
+import csv
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import islice
+import django
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from . import numbers, user_counts
+from .models import Profile, User
+from .utils import normalize_phone
+
+BATCH_SIZE = 2000
+FORMATS = ('csv', 'jsonl')
+FIELDS = [
+    'username', 'email', 'first_name', 'last_name', 'phone_number', 'cnic',
+    'date_of_birth', 'address', 'password', 'password_hash', 'pin',
+]
+PHONE_RE = re.compile(r'^0\d{10}$')
+PIN_RE = re.compile(r'^\d{4}$')
+
+
+def read_customers(stream, fmt='csv'):
+    """Yield one dict per customer row, with its line and every field in FIELDS.
+
+    CSV files need a header row naming the columns. Rows that cannot be
+    parsed come back with an ``error`` key instead of being dropped, so
+    they are still reported.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield {'line': reader.line_num, **{field: (row.get(field) or '').strip() for field in FIELDS}}
+    elif fmt == 'jsonl':
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+                yield {'line': line, **{field: str(row.get(field) or '').strip() for field in FIELDS}}
+            except (ValueError, AttributeError):
+                yield {'line': line, **dict.fromkeys(FIELDS, ''), 'error': 'Unreadable row'}
+    else:
+        raise ValueError(f'Unknown customer format {fmt!r}')
+
+
+def _result(row, status, **extra):
+    return {'line': row['line'], 'username': row['username'], 'status': status, **extra}
+
+
+def _clean(row):
+    """Normalise ``row`` in place; returns the reason it is invalid, or None"""
+    if 'error' in row:
+        return row['error']
+    if not row['username']:
+        return 'Missing username'
+    try:
+        User.username_validator(row['username'])
+    except ValidationError:
+        return 'Invalid username'
+    if len(row['username']) > User._meta.get_field('username').max_length:
+        return 'Username too long'
+    row['phone_number'] = normalize_phone(row['phone_number'])
+    if not PHONE_RE.match(row['phone_number']):
+        return 'Invalid phone number'
+    digits = re.sub(r'[\s-]', '', row['cnic'])
+    if not (len(digits) == 13 and digits.isdigit()):
+        return 'Invalid CNIC'
+    # Stored the way registration stores them: 12345-1234567-1
+    row['cnic'] = f'{digits[:5]}-{digits[5:12]}-{digits[12:]}'
+    try:
+        row['date_of_birth'] = date.fromisoformat(row['date_of_birth'])
+    except ValueError:
+        return 'Invalid date of birth'
+    if row['pin'] and not PIN_RE.match(row['pin']):
+        return 'Invalid PIN'
+    if row['password_hash']:
+        try:
+            identify_hasher(row['password_hash'])
+        except ValueError:
+            return 'Unknown password hash'
+    return None
+
+
+def _taken(rows):
+    """The usernames, phone numbers and CNICs of ``rows`` that already belong to someone"""
+    return (
+        set(User.objects.filter(username__in=[row['username'] for row in rows]).values_list('username', flat=True)),
+        set(User.objects.filter(phone_number__in=[row['phone_number'] for row in rows]).values_list('phone_number', flat=True)),
+        set(Profile.objects.filter(cnic__in=[row['cnic'] for row in rows]).values_list('cnic', flat=True)),
+    )
+
+
+def _check_batch(rows, results):
+    """The rows that can be created; the others get a rejection in ``results``"""
+    candidates = []
+    for row in rows:
+        error = _clean(row)
+        if error:
+            results[row['line']] = _result(row, 'rejected', error=error)
+        else:
+            candidates.append(row)
+    usernames, phones, cnics = _taken(candidates)
+    valid = []
+    for row in candidates:
+        if row['username'] in usernames:
+            error = 'Username already exists'
+        elif row['phone_number'] in phones:
+            error = 'Phone number already registered'
+        elif row['cnic'] in cnics:
+            error = 'CNIC already registered'
+        else:
+            error = None
+        # Whatever a row claims is taken from then on, so a later row with the same value is a duplicate
+        usernames.add(row['username'])
+        phones.add(row['phone_number'])
+        cnics.add(row['cnic'])
+        if error:
+            results[row['line']] = _result(row, 'rejected', error=error)
+        else:
+            valid.append(row)
+    return valid
+
+
+def _user(row, password):
+    return User(
+        username=row['username'],
+        email=row['email'],
+        password=password,
+        first_name=row['first_name'],
+        last_name=row['last_name'],
+        phone_number=row['phone_number'],
+        is_active=True,
+        is_verified=True,
+    )
+
+
+def _profile(row, user, account_number):
+    return Profile(
+        user=user,
+        full_name=f"{row['first_name']} {row['last_name']}".strip() or row['username'],
+        cnic=row['cnic'],
+        date_of_birth=row['date_of_birth'],
+        address=row['address'],
+        pin=row['pin'] or None,
+        account_number=account_number,
+    )
+
+
+def _insert_batch(rows, passwords, results):
+    try:
+        with transaction.atomic():
+            users = User.objects.bulk_create([_user(row, password) for row, password in zip(rows, passwords)])
+            user_counts.added(users)
+            account_numbers = numbers.get_allocator().allocate(len(rows))
+            Profile.objects.bulk_create([
+                _profile(row, user, account_number) for row, user, account_number in zip(rows, users, account_numbers)
+            ])
+    except IntegrityError:
+        # Someone registered one of these since the check; find which rows still fit, one by one
+        for row, password in zip(rows, passwords):
+            try:
+                with transaction.atomic():
+                    user = _user(row, password)
+                    user.save()
+                    profile = _profile(row, user, '')
+                    profile.save()
+            except IntegrityError:
+                results[row['line']] = _result(row, 'rejected', error='Already registered')
+            else:
+                results[row['line']] = _result(row, 'created', user_id=user.pk, account_number=profile.account_number)
+    else:
+        for row, user, account_number in zip(rows, users, account_numbers):
+            results[row['line']] = _result(row, 'created', user_id=user.pk, account_number=account_number)
+
+
+def _passwords(rows, pool, workers):
+    """A stored password for every row, hashing the plaintext ones in ``pool``"""
+    plain = [row['password'] for row in rows if not row['password_hash'] and row['password']]
+    hashed = iter(pool.map(make_password, plain, chunksize=max(1, len(plain) // (4 * workers))) if plain else ())
+    unusable = make_password(None)
+    return [
+        row['password_hash'] or (next(hashed) if row['password'] else unusable)
+        for row in rows
+    ]
+
+
+def onboard(rows, batch_size=BATCH_SIZE, workers=None):
+    """Create a user and profile for every valid row and yield one result dict per row, in input order"""
+    rows = iter(rows)
+    workers = workers or os.cpu_count()
+    # Workers set Django up themselves, in case they are spawned rather than forked
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            results = {}
+            valid = _check_batch(batch, results)
+            if valid:
+                _insert_batch(valid, _passwords(valid, pool, workers), results)
+            yield from (results[row['line']] for row in batch)
+
@@ -0,0 +1,172 @@
+"""Notification outbox.
+
+Views and the ledger do not write notifications directly. They enqueue
+an outbox row inside their own database transaction, so a notification
+exists exactly when the change it describes commits. ``manage.py
+process_notifications`` then delivers the outbox in batches. Each batch is
+one bulk insert into Notification, a handful of UPDATEs to the users'
+unread counters, and deleting the delivered rows.
+
+A broadcast to every user is stored once as a Broadcast row. The same
+worker fans it out in chunks of user ids, one short transaction per
+chunk, so user traffic never waits long behind it. The chunks alternate
+with outbox batches, and the Broadcast row records the progress.
+
+User.unread_notifications is the denormalized unread count shown in the
+header. Delivery increments it and marking notifications read decrements
+it by the number of rows actually changed. recount() rebuilds it from the
+Notification table.
+
+Queued notifications are also published to open live update streams
+(accounts.live) as soon as they commit, ahead of their delivery.
+"""
+from collections import defaultdict
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from . import live
+from .models import Broadcast, Notification, NotificationOutbox, User
+
+
+def _chunks(ids):
+    size = connection.features.max_query_params or 1000
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def notify(user, title, message):
+    """Queue one notification; call inside the transaction that caused it"""
+    NotificationOutbox.objects.create(user=user, title=title, message=message)
+    live.publish_on_commit([user.pk], {'type': 'notification', 'title': title, 'message': message})
+
+
+def notify_many(items):
+    """Queue (user id, title, message) tuples with one insert per batch"""
+    rows = NotificationOutbox.objects.bulk_create(
+        [NotificationOutbox(user_id=user_id, title=title, message=message) for user_id, title, message in items],
+        batch_size=settings.NOTIFICATIONS['BATCH_SIZE'],
+    )
+    transaction.on_commit(lambda: _publish(rows))
+
+
+def _publish(rows):
+    for row in rows:
+        live.publish([row.user_id], {'type': 'notification', 'title': row.title, 'message': row.message})
+
+
+def _add_unread(counts):
+    # Most users in a batch get one notification, so grouping by count
+    # keeps this to a few statements instead of one per user
+    by_count = defaultdict(list)
+    for user_id, count in counts.items():
+        by_count[count].append(user_id)
+    for count, user_ids in by_count.items():
+        for chunk in _chunks(user_ids):
+            User.objects.filter(pk__in=chunk).update(unread_notifications=F('unread_notifications') + count)
+
+
+def deliver(batch_size=None):
+    """Move one batch from the outbox into Notification; returns the number delivered"""
+    batch_size = batch_size or settings.NOTIFICATIONS['BATCH_SIZE']
+    with transaction.atomic():
+        # skip_locked lets several workers drain in parallel where the database supports it
+        events = list(
+            NotificationOutbox.objects.select_for_update(skip_locked=True)
+            .order_by('pk')
+            .values_list('pk', 'user_id', 'title', 'message')[:batch_size]
+        )
+        if not events:
+            return 0
+        Notification.objects.bulk_create(
+            [Notification(user_id=user_id, title=title, message=message) for _, user_id, title, message in events],
+            batch_size=batch_size,
+        )
+        counts = defaultdict(int)
+        for _, user_id, _, _ in events:
+            counts[user_id] += 1
+        _add_unread(counts)
+        for chunk in _chunks([pk for pk, _, _, _ in events]):
+            NotificationOutbox.objects.filter(pk__in=chunk).delete()
+    return len(events)
+
+
+def broadcast(title, message, created_by=None):
+    """Send a notification to every active user; the worker delivers it in chunks"""
+    recipients = User.objects.filter(is_active=True)
+    last_user_id = recipients.order_by('-pk').values_list('pk', flat=True).first() or 0
+    return Broadcast.objects.create(
+        title=title,
+        message=message,
+        created_by=created_by,
+        last_user_id=last_user_id,
+        total_users=recipients.filter(pk__lte=last_user_id).count(),
+    )
+
+
+def deliver_broadcast(batch_size=None):
+    """Deliver the next chunk of the oldest unfinished broadcast; returns it, or None if there is none"""
+    batch_size = batch_size or settings.NOTIFICATIONS['BROADCAST_BATCH_SIZE']
+    broadcast = Broadcast.objects.filter(completed_at__isnull=True).order_by('pk').first()
+    if broadcast is None:
+        return None
+    with transaction.atomic():
+        # Claim the chunk with a write before reading anything. The row lock
+        # keeps a second worker off the same chunk, and on SQLite it takes the
+        # write lock up front instead of upgrading a read transaction, which
+        # SQLite refuses rather than waits for
+        claimed = Broadcast.objects.filter(
+            pk=broadcast.pk, delivered_until=broadcast.delivered_until, completed_at__isnull=True
+        ).update(delivered_until=F('delivered_until'))
+        if not claimed:
+            broadcast.refresh_from_db()
+            return broadcast
+        user_ids = list(
+            User.objects.filter(
+                is_active=True, pk__gt=broadcast.delivered_until, pk__lte=broadcast.last_user_id
+            ).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if user_ids:
+            Notification.objects.bulk_create(
+                [Notification(user_id=user_id, title=broadcast.title, message=broadcast.message) for user_id in user_ids],
+                batch_size=batch_size,
+            )
+            _add_unread(dict.fromkeys(user_ids, 1))
+            live.publish_on_commit(user_ids, {'type': 'notification', 'title': broadcast.title, 'message': broadcast.message})
+            broadcast.delivered_until = user_ids[-1]
+            broadcast.delivered += len(user_ids)
+        if len(user_ids) < batch_size:
+            broadcast.completed_at = timezone.now()
+        broadcast.save(update_fields=['delivered_until', 'delivered', 'completed_at'])
+    return broadcast
+
+
+def _mark_read(user, notifications):
+    with transaction.atomic():
+        changed = notifications.filter(user=user, is_read=False).update(is_read=True)
+        if changed:
+            # Relative, so notifications delivered meanwhile stay counted
+            User.objects.filter(pk=user.pk).update(
+                unread_notifications=Greatest(F('unread_notifications') - changed, 0)
+            )
+    return changed
+
+
+def mark_read(user, notification_ids):
+    """Mark the given notifications of ``user`` read and lower the counter to match"""
+    return _mark_read(user, Notification.objects.filter(pk__in=notification_ids))
+
+
+def mark_all_read(user):
+    """Mark every unread notification of ``user`` read; only unread rows are touched"""
+    return _mark_read(user, Notification.objects.all())
+
+
+def recount(users=None):
+    """Rebuild unread counters from the Notification table"""
+    unread = Notification.objects.filter(user=OuterRef('pk'), is_read=False).order_by().values('user').annotate(
+        count=Count('pk')
+    ).values('count')
+    users = User.objects.all() if users is None else users
+    return users.update(unread_notifications=Coalesce(Subquery(unread), 0))
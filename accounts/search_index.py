@@ -0,0 +1,125 @@
+"""Substring search index over user names, emails, phone numbers, CNIC and account numbers.
+
+On SQLite this is an FTS5 table using the trigram tokenizer, kept in sync
+with ``accounts_user`` and ``accounts_profile`` by triggers; its rowid is
+the user id. On PostgreSQL it is a set of pg_trgm GIN indexes that serve
+the ORM's ``icontains`` lookups directly. Other backends get no index and
+fall back to plain ``icontains``.
+
+SQLite drops triggers when Django rebuilds a table during a migration, so
+a migration that alters either table must end by calling ``install`` from
+a RunPython operation. ``manage.py check --database default`` reports
+missing triggers, and ``manage.py rebuild_user_search`` restores them.
+"""
+from django.core import checks
+from django.db import DatabaseError, connections, transaction
+
+SEARCH_TABLE = 'accounts_user_search'
+
+SQLITE_INSTALL = [
+    f"""CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(
+        username, email, phone_number, full_name, cnic, account_number, tokenize='trigram'
+    )""",
+    f"""INSERT INTO {SEARCH_TABLE}(rowid, username, email, phone_number, full_name, cnic, account_number)
+        SELECT u.id, u.username, u.email, u.phone_number, p.full_name, p.cnic, p.account_number
+        FROM accounts_user u LEFT JOIN accounts_profile p ON p.user_id = u.id""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_user_ai AFTER INSERT ON accounts_user BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, username, email, phone_number)
+        VALUES (new.id, new.username, new.email, new.phone_number);
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_user_au AFTER UPDATE OF username, email, phone_number ON accounts_user BEGIN
+        UPDATE {SEARCH_TABLE} SET username = new.username, email = new.email, phone_number = new.phone_number
+        WHERE rowid = new.id;
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_user_ad AFTER DELETE ON accounts_user BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_profile_ai AFTER INSERT ON accounts_profile BEGIN
+        UPDATE {SEARCH_TABLE} SET full_name = new.full_name, cnic = new.cnic, account_number = new.account_number
+        WHERE rowid = new.user_id;
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_profile_au AFTER UPDATE OF full_name, cnic, account_number ON accounts_profile BEGIN
+        UPDATE {SEARCH_TABLE} SET full_name = new.full_name, cnic = new.cnic, account_number = new.account_number
+        WHERE rowid = new.user_id;
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_profile_ad AFTER DELETE ON accounts_profile BEGIN
+        UPDATE {SEARCH_TABLE} SET full_name = NULL, cnic = NULL, account_number = NULL WHERE rowid = old.user_id;
+    END""",
+]
+
+SQLITE_TRIGGERS = [
+    f'{SEARCH_TABLE}_{name}'
+    for name in ('user_ai', 'user_au', 'user_ad', 'profile_ai', 'profile_au', 'profile_ad')
+]
+
+SQLITE_UNINSTALL = [f'DROP TRIGGER IF EXISTS {name}' for name in SQLITE_TRIGGERS] + [
+    f'DROP TABLE IF EXISTS {SEARCH_TABLE}'
+]
+
+POSTGRES_COLUMNS = [
+    ('accounts_user', 'username'),
+    ('accounts_user', 'email'),
+    ('accounts_profile', 'full_name'),
+    ('accounts_profile', 'cnic'),
+    ('accounts_profile', 'account_number'),
+]
+
+POSTGRES_INSTALL = ['CREATE EXTENSION IF NOT EXISTS pg_trgm'] + [
+    # Matches the UPPER(col::text) LIKE UPPER(...) that icontains generates
+    f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)'
+    for table, column in POSTGRES_COLUMNS
+]
+
+POSTGRES_UNINSTALL = [f'DROP INDEX IF EXISTS {table}_{column}_trgm' for table, column in POSTGRES_COLUMNS]
+
+
+def install(connection):
+    """Create the search index; returns False if the database cannot host it"""
+    statements = {'sqlite': SQLITE_INSTALL, 'postgresql': POSTGRES_INSTALL}.get(connection.vendor)
+    if statements is None:
+        return False
+    uninstall(connection)
+    try:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+    except DatabaseError:
+        # SQLite older than 3.34 has no trigram tokenizer; pg_trgm may not be installable
+        return False
+    return True
+
+
+def uninstall(connection):
+    statements = {'sqlite': SQLITE_UNINSTALL, 'postgresql': POSTGRES_UNINSTALL}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def has_fts_table(connection):
+    return connection.vendor == 'sqlite' and SEARCH_TABLE in connection.introspection.table_names()
+
+
+def missing_triggers(connection):
+    """The SQLite triggers that should keep the search table current but do not exist"""
+    if not has_fts_table(connection):
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN ('accounts_user', 'accounts_profile')")
+        present = {row[0] for row in cursor.fetchall()}
+    return [name for name in SQLITE_TRIGGERS if name not in present]
+
+
+@checks.register(checks.Tags.database)
+def check_search_triggers(databases=None, **kwargs):
+    # A warning, not an error, so migrate can still run the migration that restores them
+    errors = []
+    for alias in databases or []:
+        missing = missing_triggers(connections[alias])
+        if missing:
+            errors.append(checks.Warning(
+                f"The user search index on '{alias}' is missing triggers: {', '.join(missing)}",
+                hint='Run manage.py rebuild_user_search, and reinstall the index in the migration that dropped them.',
+                id='accounts.W001',
+            ))
+    return errors
@@ -0,0 +1,268 @@
+import csv
+import os
+import tempfile
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from transactions import ids
+from transactions.models import Transaction
+from admin_panel.search import search_users
+from transactions import ledger
+from . import fraud, numbers, onboarding, search_index, velocity
+from .models import AccountNumberSequence, Profile, User
+
+
+def make_user(username, phone, balance='0.00'):
+    user = User.objects.create_user(username=username, password='pw', phone_number=phone)
+    Profile.objects.create(
+        user=user,
+        full_name=username,
+        cnic=f'12345-{phone[-7:]}-1',
+        date_of_birth=date(1990, 1, 1),
+        address='Test',
+        balance=Decimal(balance),
+        pin='4821',
+    )
+    return user
+
+
+class DashboardQueryTests(TestCase):
+    def setUp(self):
+        self.user = make_user('alice', '03000000001')
+        self.other = make_user('bob', '03000000002')
+        self.client.force_login(self.user)
+
+    def add_history(self, count):
+        Transaction.objects.bulk_create([
+            Transaction(
+                transaction_id=ids.new_id(),
+                sender=self.user if i % 2 else self.other,
+                receiver=self.other if i % 2 else self.user,
+                transaction_type='send',
+                amount=Decimal('1.00'),
+                status='completed',
+            )
+            for i in range(count)
+        ])
+
+    def get_dashboard(self, queries):
+        cache.clear()
+        with self.assertNumQueries(queries):
+            response = self.client.get('/accounts/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_does_not_grow_with_history(self):
+        # Session, user, profile, recent transactions, month totals, pending requests
+        self.add_history(5)
+        self.get_dashboard(6)
+        self.add_history(500)
+        self.get_dashboard(6)
+
+    def test_month_totals_are_cached(self):
+        self.add_history(10)
+        response = self.get_dashboard(6)
+        self.assertEqual(response.context['total_transactions'], 10)
+        self.assertEqual(response.context['money_sent'], Decimal('5.00'))
+        with self.assertNumQueries(5):
+            self.client.get('/accounts/dashboard/')
+
+
+class FraudScoreTests(TestCase):
+    def setUp(self):
+        self.user = make_user('alice', '03000000001')
+        self.other = make_user('bob', '03000000002')
+
+    @override_settings(FRAUD_SCORING={**fraud.settings.FRAUD_SCORING, 'BUDGET_MS': 0})
+    def test_velocity_runs_when_budget_is_spent(self):
+        fraud._rules = None
+        self.addCleanup(setattr, fraud, '_rules', None)
+        ctx = fraud.FraudContext(user=self.user, amount=Decimal('1000000.00'), receiver=self.other)
+        total, reasons = fraud.score(ctx)
+        self.assertGreaterEqual(total, fraud.settings.FRAUD_SCORING['THRESHOLD'])
+
+
+class RescoreTests(TestCase):
+    def setUp(self):
+        self.user = make_user('alice', '03000000001')
+        self.other = make_user('bob', '03000000002')
+
+    def pay(self, day, amount='100.00'):
+        transaction = Transaction.objects.create(
+            sender=self.user,
+            receiver=self.other,
+            transaction_type='send',
+            amount=Decimal(amount),
+            status='completed',
+        )
+        # created_at is set on insert; move it to the day under test
+        Transaction.objects.filter(pk=transaction.pk).update(
+            created_at=datetime(2024, 1, day, 12, tzinfo=dt_timezone.utc)
+        )
+        return transaction
+
+    def rescore(self, **options):
+        with tempfile.TemporaryDirectory() as scratch:
+            path = os.path.join(scratch, 'flagged.csv')
+            call_command('rescore_transactions', output=path, threshold=0.1, stdout=StringIO(), **options)
+            with open(path, newline='') as handle:
+                return {row['transaction_id']: row['reasons'].split() for row in csv.DictReader(handle)}
+
+    def test_since_keeps_earlier_history(self):
+        for day in range(1, 7):
+            self.pay(day)
+        later = self.pay(10)
+        flagged = self.rescore(since='2024-01-10')
+        self.assertNotIn('new_receiver', flagged.get(later.transaction_id, []))
+        self.assertEqual(set(flagged) - {later.transaction_id}, set())
+
+    def test_since_still_flags_outliers(self):
+        for day in range(1, 7):
+            self.pay(day, amount=f'{90 + 5 * day}.00')
+        later = self.pay(10, amount='20000.00')
+        flagged = self.rescore(since='2024-01-10')
+        self.assertIn('amount_zscore', flagged[later.transaction_id])
+
+
+class SearchIndexTests(TestCase):
+    def test_migrations_leave_the_triggers_installed(self):
+        self.assertEqual(search_index.missing_triggers(connection), [])
+
+    def test_new_users_are_found_by_substring(self):
+        bob = make_user('bob', '03000000002')
+        users, _ = search_users('bob', None, 'contains')
+        self.assertEqual(users, [bob])
+
+
+@override_settings(FRAUD_VELOCITY={**fraud.settings.FRAUD_VELOCITY, 'BACKEND': 'accounts.velocity.DatabaseVelocityBackend'})
+class DatabaseVelocityTests(TestCase):
+    def setUp(self):
+        velocity._backend = None
+        self.addCleanup(setattr, velocity, '_backend', None)
+        self.user = make_user('alice', '03000000001', balance='100000.00')
+        self.other = make_user('bob', '03000000002')
+
+    def test_hourly_amount_counts_every_committed_transfer(self):
+        for _ in range(3):
+            ledger.transfer(self.user, self.other, Decimal('15000.00'))
+        self.assertEqual(velocity.check(self.user, Decimal('4000.00'), self.other), (False, 'Transaction appears normal'))
+        self.assertTrue(velocity.check(self.user, Decimal('6000.00'), self.other)[0])
+
+    def test_deposits_do_not_count(self):
+        ledger.deposit(self.user, Decimal('60000.00'))
+        self.assertFalse(velocity.check(self.user, Decimal('100.00'))[0])
+
+
+class AccountNumberTests(TestCase):
+    def test_check_digit(self):
+        self.assertEqual(numbers.format_number(1), 'CE0000000018')
+        self.assertEqual(numbers.format_number(10), 'CE0000000109')
+        self.assertTrue(numbers.is_valid('ce00-0000-0018'))
+        # A mistyped digit, swapped neighbours, and the digit cut off
+        for number in ('CE0000000028', 'CE0000000108', 'CE000000001'):
+            self.assertFalse(numbers.is_valid(number), number)
+        self.assertTrue(numbers.is_mistyped('CE0000000028'))
+        self.assertFalse(numbers.is_mistyped('CE0000000018'))
+        self.assertFalse(numbers.is_mistyped('CE000000'))
+
+    def test_allocations_come_from_one_reserved_block(self):
+        allocator = numbers.BlockAllocator(block_size=5)
+        with mock.patch.object(numbers, 'reserve', wraps=numbers.reserve) as reserve:
+            with self.captureOnCommitCallbacks(execute=True):
+                first = allocator.allocate(2)
+            with self.assertNumQueries(0):
+                rest = allocator.allocate(3)
+            # The block is used up, so the next number reserves another
+            later = allocator.allocate()
+        self.assertEqual(reserve.call_count, 2)
+        serials = [int(number[3:-1]) for number in first + rest + later]
+        self.assertEqual(serials[:5], list(range(serials[0], serials[0] + 5)))
+        self.assertEqual(len(set(serials)), 6)
+        self.assertTrue(all(numbers.is_valid(number) for number in first + rest + later))
+
+    def test_rolled_back_block_is_not_adopted(self):
+        allocator = numbers.BlockAllocator(block_size=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    allocator.allocate()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(allocator._blocks, [])
+
+    def test_missing_sequence_row_is_recreated_after_the_numbers_in_use(self):
+        existing = make_user('alice', '03000000001').profile.account_number
+        AccountNumberSequence.objects.all().delete()
+        serial = numbers.reserve(5)
+        self.assertGreater(serial, int(existing[3:-1]))
+        self.assertEqual(numbers.reserve(1), serial + 5)
+
+
+class OnboardingTests(TestCase):
+    HEADER = 'username,phone_number,cnic,date_of_birth,password\n'
+
+    def setUp(self):
+        self.existing = make_user('alice', '03000000001')
+
+    def onboard(self, rows, **kwargs):
+        stream = StringIO(self.HEADER + ''.join(f'{row}\n' for row in rows))
+        return list(onboarding.onboard(onboarding.read_customers(stream), workers=1, **kwargs))
+
+    def outcomes(self, results):
+        return [(result['username'], result['status'], result.get('error')) for result in results]
+
+    def test_duplicates_in_the_file_and_the_database_are_rejected(self):
+        results = self.onboard([
+            'bob,03000000002,1234500000021,1990-01-01,',
+            'carol,0300-0000002,1234500000031,1990-01-01,',
+            'dave,03000000004,12345-0000002-1,1990-01-01,',
+            'erin,03000000001,1234500000051,1990-01-01,',
+            'frank,03000000006,12345-0000001-1,1990-01-01,',
+            'bob,03000000007,1234500000071,1990-01-01,',
+        ])
+        self.assertEqual(self.outcomes(results), [
+            ('bob', 'created', None),
+            ('carol', 'rejected', 'Phone number already registered'),
+            ('dave', 'rejected', 'CNIC already registered'),
+            ('erin', 'rejected', 'Phone number already registered'),
+            ('frank', 'rejected', 'CNIC already registered'),
+            ('bob', 'rejected', 'Username already exists'),
+        ])
+        self.assertEqual(User.objects.count(), 2)
+
+    def test_each_batch_takes_its_numbers_from_one_reservation(self):
+        rows = [f'user{i},0300000001{i},12345000001{i}1,1990-01-01,' for i in range(5)]
+        with mock.patch.object(numbers, 'reserve', wraps=numbers.reserve) as reserve:
+            results = self.onboard(rows, batch_size=2)
+        # Blocks are adopted when the batch commits, which a TestCase never does
+        self.assertEqual(reserve.call_count, 3)
+        account_numbers = [result['account_number'] for result in results]
+        self.assertEqual(len(set(account_numbers)), 5)
+        self.assertTrue(all(numbers.is_valid(number) for number in account_numbers))
+        self.assertEqual(
+            sorted(Profile.objects.exclude(user=self.existing).values_list('account_number', flat=True)),
+            sorted(account_numbers),
+        )
+
+    def test_a_row_registered_since_the_check_is_rejected_alone(self):
+        # As if alice registered between the batch check and the insert
+        with mock.patch.object(onboarding, '_taken', return_value=(set(), set(), set())):
+            results = self.onboard([
+                'bob,03000000002,1234500000021,1990-01-01,',
+                'erin,03000000001,1234500000051,1990-01-01,',
+                'carol,03000000003,1234500000031,1990-01-01,',
+            ])
+        self.assertEqual(self.outcomes(results), [
+            ('bob', 'created', None), ('erin', 'rejected', 'Already registered'), ('carol', 'created', None),
+        ])
+        self.assertTrue(all(numbers.is_valid(result['account_number']) for result in results if result['status'] == 'created'))
+
+    def test_plaintext_passwords_are_hashed(self):
+        [result] = self.onboard(['bob,03000000002,1234500000021,1990-01-01,s3cret-pass'])
+        self.assertTrue(User.objects.get(pk=result['user_id']).check_password('s3cret-pass'))
@@ -13,4 +13,6 @@ urlpatterns = [
     path('kyc-upload/', views.kyc_upload, name='kyc_upload'),
     path('change-pin/', views.change_pin, name='change_pin'),
     path('notifications/', views.notifications, name='notifications'),
+    path('notifications/read-all/', views.mark_all_notifications_read, name='mark_all_notifications_read'),
+    path('live/', views.live_updates, name='live_updates'),
 ]
\ No newline at end of file
@@ -0,0 +1,85 @@
+"""Running user totals for the staff dashboard.
+
+Counting accounts_user for every dashboard refresh reads the whole table.
+Instead, one UserCounts row holds the number of users and of active,
+unblocked users. Signals update it in the same transaction as every user
+save and delete, including blocking from the admin panel and edits in the
+Django admin. bulk_create sends no signals, so code that bulk inserts users
+calls added() itself (accounts.onboarding does).
+
+rebuild() recounts from the user table. It also runs when the row is
+missing, for example after a flush.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from .models import User, UserCounts
+
+
+def _is_active(user):
+    """Whether ``user`` counts as active, or None if those fields were not loaded"""
+    # Read __dict__ so a deferred field is not fetched. A save cannot change a
+    # field that was not loaded, since Django only writes the loaded ones.
+    fields = user.__dict__
+    if 'is_active' not in fields or 'is_blocked' not in fields:
+        return None
+    return fields['is_active'] and not fields['is_blocked']
+
+
+def rebuild():
+    """Recount both totals from the user table (a full scan)"""
+    counts = {
+        'total': User.objects.count(),
+        'active': User.objects.filter(is_active=True, is_blocked=False).count(),
+    }
+    try:
+        with transaction.atomic():
+            UserCounts.objects.update_or_create(pk=UserCounts.SINGLETON, defaults=counts)
+    except IntegrityError:
+        # Another process created the row first; its counts are just as current
+        pass
+    return counts
+
+
+def _bump(total, active):
+    if not (total or active):
+        return
+    updated = UserCounts.objects.filter(pk=UserCounts.SINGLETON).update(
+        total=F('total') + total, active=F('active') + active,
+    )
+    if not updated:
+        # The count already includes this change
+        rebuild()
+
+
+def added(users):
+    """Count ``users`` just bulk inserted; call in the transaction that inserted them"""
+    _bump(len(users), sum(1 for user in users if _is_active(user)))
+
+
+def get():
+    """{'total': ..., 'active': ...}"""
+    counts = UserCounts.objects.filter(pk=UserCounts.SINGLETON).values('total', 'active').first()
+    return counts or rebuild()
+
+
+def _loaded(sender, instance, **kwargs):
+    instance._counted_active = _is_active(instance)
+
+
+def _saved(sender, instance, created, **kwargs):
+    active = _is_active(instance)
+    if created:
+        _bump(1, 1 if active else 0)
+    elif active is not None and instance._counted_active is not None and active != instance._counted_active:
+        _bump(0, 1 if active else -1)
+    instance._counted_active = active
+
+
+def _deleted(sender, instance, **kwargs):
+    _bump(-1, -1 if instance._counted_active else 0)
+
+
+post_init.connect(_loaded, sender=User, dispatch_uid='accounts.user_counts.loaded')
+post_save.connect(_saved, sender=User, dispatch_uid='accounts.user_counts.saved')
+post_delete.connect(_deleted, sender=User, dispatch_uid='accounts.user_counts.deleted')
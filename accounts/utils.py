@@ -1,5 +1,9 @@
 import random
+import re
 import string
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
 
 def generate_otp():
     """Generate a 6-digit OTP"""
@@ -11,27 +15,76 @@ def send_otp(phone_number, otp_code):
     # In production, integrate with SMS service like Twilio
     return True
 
-def detect_fraud(user, amount, transaction_type):
+def normalize_phone(value):
+    """Digits only, with a +92 / 0092 country code replaced by the local 0"""
+    digits = re.sub(r'\D', '', value)
+    if digits.startswith('0092'):
+        digits = '0' + digits[4:]
+    elif digits.startswith('92'):
+        digits = '0' + digits[2:]
+    return digits
+
+def detect_fraud(user, amount, transaction_type, receiver=None, ip=None, device=None):
     """Basic fraud detection logic"""
-    from transactions.models import Transaction
-    from datetime import timedelta
-    from django.utils import timezone
-    
-    # Check for multiple large transactions in short time
-    recent_transactions = Transaction.objects.filter(
-        sender=user,
-        created_at__gte=timezone.now() - timedelta(hours=1),
-        status='completed'
-    )
+    from .fraud import FraudContext, remember_device, score
     
-    total_recent = sum(t.amount for t in recent_transactions)
+    # Flag if single transaction > MAX_SINGLE_AMOUNT
+    if amount > settings.FRAUD_VELOCITY['MAX_SINGLE_AMOUNT']:
+        return True, "Large transaction amount"
     
-    # Flag if more than 50000 in last hour
-    if total_recent + amount > 50000:
-        return True, "Multiple large transactions detected"
+    # Velocity, amount, device, recipient and time-of-day rules
+    total, reasons = score(FraudContext(user, amount, receiver, ip, device))
+    if total >= settings.FRAUD_SCORING['THRESHOLD']:
+        return True, '; '.join(reasons)
     
-    # Flag if single transaction > 100000
-    if amount > 100000:
-        return True, "Large transaction amount"
+    if ip is not None or device is not None:
+        remember_device(user, ip, device)
+    return False, "Transaction appears normal"
+
+def month_start():
+    """Midnight on the first day of the current month in the active timezone"""
+    return timezone.localtime().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def _monthly_stats_key(user_id):
+    return f"monthly_stats:{user_id}:{timezone.localtime():%Y-%m}"
+
+def _monthly_stats_query(user):
+    from transactions.models import Transaction
+    from django.db.models import Count, Q, Sum
     
-    return False, "Transaction appears normal"
\ No newline at end of file
+    return Transaction.objects.filter(
+        Q(sender=user) | Q(receiver=user),
+        created_at__gte=month_start()
+    ), {
+        'total_transactions': Count('id'),
+        'money_sent': Sum('amount', filter=Q(sender=user)),
+        'money_received': Sum('amount', filter=Q(receiver=user)),
+    }
+
+def get_monthly_stats(user):
+    """Count, sent and received totals for the current month in one query"""
+    key = _monthly_stats_key(user.pk)
+    stats = cache.get(key)
+    if stats is None:
+        queryset, aggregates = _monthly_stats_query(user)
+        stats = queryset.aggregate(**aggregates)
+        stats['money_sent'] = stats['money_sent'] or 0
+        stats['money_received'] = stats['money_received'] or 0
+        cache.set(key, stats, settings.DASHBOARD_STATS_CACHE_TIMEOUT)
+    return stats
+
+async def aget_monthly_stats(user):
+    """get_monthly_stats for async views"""
+    key = _monthly_stats_key(user.pk)
+    stats = await cache.aget(key)
+    if stats is None:
+        queryset, aggregates = _monthly_stats_query(user)
+        stats = await queryset.aaggregate(**aggregates)
+        stats['money_sent'] = stats['money_sent'] or 0
+        stats['money_received'] = stats['money_received'] or 0
+        await cache.aset(key, stats, settings.DASHBOARD_STATS_CACHE_TIMEOUT)
+    return stats
+
+def invalidate_monthly_stats(*user_ids):
+    """Drop cached dashboard stats after a ledger write"""
+    cache.delete_many([_monthly_stats_key(user_id) for user_id in user_ids if user_id is not None])
@@ -0,0 +1,265 @@
+"""Sliding-window transfer velocity counters used by fraud detection.
+
+Each tracked key (money sent by a user, money received by a user) keeps a
+fixed ring of time buckets, so recording a transfer and reading the totals
+for a window are both constant work no matter how active the user is.
+Counters are fed from the ledger once a transfer commits.
+
+LocalVelocityBackend only sees its own process, so with N workers a user
+can move N times the hourly limit; it is refused when DEBUG is off.
+Production uses CacheVelocityBackend on a shared cache, or
+DatabaseVelocityBackend, which keeps no counters and sums the indexed
+Transaction rows instead.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Sum
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+HOUR = 3600
+MINUTE = 60
+BUCKETS = 60
+
+
+def _cents(amount):
+    return int(Decimal(str(amount)) * 100)
+
+
+class LocalVelocityBackend:
+    """Per-process counters; fastest, but each worker sees only its own traffic"""
+
+    def __init__(self, max_keys=100000):
+        self._windows = OrderedDict()
+        self._pairs = OrderedDict()
+        self._max_keys = max_keys
+        self._lock = threading.Lock()
+
+    def _touch(self, store, key, default):
+        value = store.get(key)
+        if value is None:
+            value = store[key] = default()
+            if len(store) > self._max_keys:
+                store.popitem(last=False)
+        else:
+            store.move_to_end(key)
+        return value
+
+    def is_tracked(self, key):
+        return key in self._windows
+
+    def add(self, key, now, cents, windows=(HOUR, MINUTE)):
+        with self._lock:
+            rings = self._touch(self._windows, key, dict)
+            for window in windows:
+                index = int(now // (window / BUCKETS))
+                slots = rings.setdefault(window, [[-1, 0, 0] for _ in range(BUCKETS)])
+                slot = slots[index % BUCKETS]
+                if slot[0] != index:
+                    slot[:] = [index, 0, 0]
+                slot[1] += 1
+                slot[2] += cents
+
+    def start_tracking(self, key):
+        with self._lock:
+            self._touch(self._windows, key, dict)
+
+    def totals(self, key, window, now):
+        """(count, cents) recorded for ``key`` within the last ``window`` seconds"""
+        rings = self._windows.get(key)
+        slots = rings.get(window) if rings else None
+        if not slots:
+            return 0, 0
+        oldest = int(now // (window / BUCKETS)) - BUCKETS + 1
+        count = cents = 0
+        for index, slot_count, slot_cents in slots:
+            if index >= oldest:
+                count += slot_count
+                cents += slot_cents
+        return count, cents
+
+    def has_pair(self, sender_id, receiver_id):
+        return (sender_id, receiver_id) in self._pairs
+
+    def add_pair(self, sender_id, receiver_id):
+        with self._lock:
+            self._touch(self._pairs, (sender_id, receiver_id), lambda: True)
+
+
+class CacheVelocityBackend:
+    """Counters kept in a Django cache so every worker shares them.
+
+    Set ``FRAUD_VELOCITY['OPTIONS']['cache_alias']`` to a shared cache
+    (Redis, Memcached) for this to be useful across processes.
+    """
+
+    def __init__(self, cache_alias='default', **kwargs):
+        self._cache = caches[cache_alias]
+
+    def _bucket_keys(self, key, window, index):
+        base = f'velocity:{key[0]}:{key[1]}:{window}:{index}'
+        return f'{base}:n', f'{base}:c'
+
+    def is_tracked(self, key):
+        return self._cache.get(f'velocity:{key[0]}:{key[1]}:tracked') is not None
+
+    def start_tracking(self, key):
+        self._cache.set(f'velocity:{key[0]}:{key[1]}:tracked', 1, HOUR)
+
+    def add(self, key, now, cents, windows=(HOUR, MINUTE)):
+        for window in windows:
+            index = int(now // (window / BUCKETS))
+            for cache_key, delta in zip(self._bucket_keys(key, window, index), (1, cents)):
+                self._cache.add(cache_key, 0, window)
+                try:
+                    self._cache.incr(cache_key, delta)
+                except ValueError:
+                    self._cache.set(cache_key, delta, window)
+        self._cache.touch(f'velocity:{key[0]}:{key[1]}:tracked', HOUR)
+
+    def totals(self, key, window, now):
+        newest = int(now // (window / BUCKETS))
+        keys = []
+        for index in range(newest - BUCKETS + 1, newest + 1):
+            keys.extend(self._bucket_keys(key, window, index))
+        values = self._cache.get_many(keys)
+        count = sum(values.get(k, 0) for k in keys[0::2])
+        cents = sum(values.get(k, 0) for k in keys[1::2])
+        return count, cents
+
+    def has_pair(self, sender_id, receiver_id):
+        return self._cache.get(f'velocity:pair:{sender_id}:{receiver_id}') is not None
+
+    def add_pair(self, sender_id, receiver_id):
+        self._cache.set(f'velocity:pair:{sender_id}:{receiver_id}', 1, 30 * 24 * HOUR)
+
+
+class DatabaseVelocityBackend:
+    """Totals read from the Transaction table; shared by every worker, one indexed query per window"""
+
+    def __init__(self, **kwargs):
+        pass
+
+    def is_tracked(self, key):
+        # Nothing to seed: committed transfers are already in the table
+        return True
+
+    def start_tracking(self, key):
+        pass
+
+    def add(self, key, now, cents, windows=(HOUR, MINUTE)):
+        pass
+
+    def totals(self, key, window, now):
+        from transactions.models import Transaction
+
+        side = 'sender_id' if key[0] == 'sent' else 'receiver_id'
+        row = Transaction.objects.filter(
+            created_at__gte=datetime.fromtimestamp(now - window, tz=dt_timezone.utc),
+            status='completed',
+            **{side: key[1]}
+        ).exclude(transaction_type='deposit').aggregate(count=Count('id'), amount=Sum('amount'))
+        return row['count'], _cents(row['amount'] or 0)
+
+    def has_pair(self, sender_id, receiver_id):
+        # is_known_pair falls back to the table
+        return False
+
+    def add_pair(self, sender_id, receiver_id):
+        pass
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                options = settings.FRAUD_VELOCITY
+                _backend = import_string(options['BACKEND'])(**options.get('OPTIONS', {}))
+    return _backend
+
+
+def _seed(backend, key, **filters):
+    """Load the last hour of debits for ``key`` the first time this backend sees it"""
+    from transactions.models import Transaction
+
+    backend.start_tracking(key)
+    recent = Transaction.objects.filter(
+        created_at__gte=timezone.now() - timedelta(hours=1),
+        status='completed',
+        **filters
+    ).exclude(transaction_type='deposit').values_list('amount', 'created_at')
+    for amount, created_at in recent.iterator():
+        backend.add(key, created_at.timestamp(), _cents(amount))
+
+
+def record_transfer(sender_id, receiver_id, amount, now=None):
+    """Count a committed debit against the sender (and receiver, if any).
+
+    Keys this backend is not tracking yet are skipped; they are seeded from
+    the database, including this transfer, the first time they are checked.
+    """
+    backend = get_backend()
+    now = time.time() if now is None else now
+    cents = _cents(amount)
+    if backend.is_tracked(('sent', sender_id)):
+        backend.add(('sent', sender_id), now, cents)
+    if receiver_id is not None:
+        if backend.is_tracked(('received', receiver_id)):
+            backend.add(('received', receiver_id), now, cents)
+        backend.add_pair(sender_id, receiver_id)
+
+
+def is_known_pair(user, receiver):
+    """Whether ``user`` has paid ``receiver`` before; a database hit is remembered"""
+    from transactions.models import Transaction
+
+    backend = get_backend()
+    if backend.has_pair(user.pk, receiver.pk):
+        return True
+    if Transaction.objects.filter(sender=user, receiver=receiver, status='completed').exists():
+        backend.add_pair(user.pk, receiver.pk)
+        return True
+    return False
+
+
+def check(user, amount, receiver=None, now=None):
+    """Apply the velocity rules to a proposed debit; returns (is_fraud, reason)"""
+    rules = settings.FRAUD_VELOCITY
+    backend = get_backend()
+    now = time.time() if now is None else now
+    cents = _cents(amount)
+
+    if not backend.is_tracked(('sent', user.pk)):
+        _seed(backend, ('sent', user.pk), sender=user)
+
+    _, sent_cents = backend.totals(('sent', user.pk), HOUR, now)
+    if sent_cents + cents > rules['MAX_AMOUNT_PER_HOUR'] * 100:
+        return True, "Multiple large transactions detected"
+
+    count, _ = backend.totals(('sent', user.pk), MINUTE, now)
+    if rules['MAX_COUNT_PER_MINUTE'] and count + 1 > rules['MAX_COUNT_PER_MINUTE']:
+        return True, "Too many transactions in a short time"
+
+    if receiver is not None:
+        if rules['MAX_RECEIVED_PER_HOUR']:
+            if not backend.is_tracked(('received', receiver.pk)):
+                _seed(backend, ('received', receiver.pk), receiver=receiver)
+            _, received_cents = backend.totals(('received', receiver.pk), HOUR, now)
+            if received_cents + cents > rules['MAX_RECEIVED_PER_HOUR'] * 100:
+                return True, "Receiver has unusually high incoming volume"
+
+        limit = rules['NEW_COUNTERPARTY_MAX_AMOUNT']
+        if limit and amount > limit and not is_known_pair(user, receiver):
+            return True, "Large payment to a new recipient"
+
+    return False, "Transaction appears normal"
@@ -1,10 +1,17 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
+from django.http import HttpResponse
+from django.conf import settings
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
 from django.db import transaction
-from .models import User, Profile, KYCDocument, Notification
+from django.views.decorators.http import require_POST
+from transactions.pagination import akeyset_page
+from . import live, outbox
+from .decorators import alogin_required
+from .models import User, Profile, KYCDocument
 from .forms import RegistrationForm, LoginForm, ProfileForm, KYCUploadForm, PinChangeForm
 import random
 from datetime import timedelta
@@ -107,78 +114,55 @@ def logout_view(request):
     messages.success(request, 'You have been logged out successfully.')
     return redirect('home')
 
-@login_required
-def dashboard(request):
+def _create_default_profile(user):
+    # Generate unique CNIC
+    while True:
+        cnic = f"42101-{random.randint(1000000, 9999999)}-{random.randint(1, 9)}"
+        if not Profile.objects.filter(cnic=cnic).exists():
+            break
+    
+    return Profile.objects.create(
+        user=user,
+        full_name=user.get_full_name() or user.username,
+        cnic=cnic,
+        date_of_birth='1990-01-01',
+        address='Default Address',
+        balance=Decimal('0.00'),
+        pin=None
+    )
+
+@alogin_required
+async def dashboard(request):
+    from transactions.models import Transaction
+    from django.db.models import Q
+    from .utils import aget_monthly_stats
+    
     # Create profile if it doesn't exist
     try:
         profile = request.user.profile
     except Profile.DoesNotExist:
-        import random
-        # Generate unique CNIC
-        while True:
-            cnic = f"42101-{random.randint(1000000, 9999999)}-{random.randint(1, 9)}"
-            if not Profile.objects.filter(cnic=cnic).exists():
-                break
-        
-        profile = Profile.objects.create(
-            user=request.user,
-            full_name=request.user.get_full_name() or request.user.username,
-            cnic=cnic,
-            date_of_birth='1990-01-01',
-            address='Default Address',
-            balance=Decimal('0.00'),
-            pin=None
-        )
-    
-    # Get all transactions for the user
-    from transactions.models import Transaction
-    from django.db.models import Q, Sum
-    from datetime import datetime, timedelta
+        profile = await sync_to_async(_create_default_profile)(request.user)
     
     # Get recent transactions (both sent and received)
-    recent_transactions = Transaction.objects.filter(
-        Q(sender=request.user) | Q(receiver=request.user)
-    ).order_by('-created_at')[:5]
-    
-    # Calculate statistics for current month
-    current_month = datetime.now().replace(day=1)
-    
-    # Total transactions this month
-    total_transactions = Transaction.objects.filter(
-        Q(sender=request.user) | Q(receiver=request.user),
-        created_at__gte=current_month
-    ).count()
+    recent_transactions = [
+        trans async for trans in Transaction.objects.filter(
+            Q(sender=request.user) | Q(receiver=request.user)
+        ).order_by('-created_at')[:5]
+    ]
     
-    # Money sent this month
-    money_sent = Transaction.objects.filter(
-        sender=request.user,
-        created_at__gte=current_month
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    # Count, money sent and money received this month (cached per user)
+    stats = await aget_monthly_stats(request.user)
     
-    # Money received this month
-    money_received = Transaction.objects.filter(
-        receiver=request.user,
-        created_at__gte=current_month
-    ).aggregate(total=Sum('amount'))['total'] or 0
-    
-    try:
-        pending_requests = request.user.money_requests_received.filter(status='pending')
-    except:
-        pending_requests = []
-    
-    try:
-        notifications = request.user.notification_set.filter(is_read=False)[:5]
-    except:
-        notifications = []
+    pending_requests = [
+        money_request async for money_request in
+        request.user.money_requests_received.filter(status='pending').select_related('requester')
+    ]
     
     context = {
         'profile': profile,
         'recent_transactions': recent_transactions,
         'pending_requests': pending_requests,
-        'notifications': notifications,
-        'total_transactions': total_transactions,
-        'money_sent': money_sent,
-        'money_received': money_received,
+        **stats,
     }
     return render(request, 'accounts/dashboard.html', context)
 
@@ -240,9 +224,32 @@ def change_pin(request):
     
     return render(request, 'accounts/change_pin.html', {'form': form, 'is_first_time': is_first_time})
 
+@alogin_required
+async def notifications(request):
+    try:
+        notifications, next_cursor = await akeyset_page(request.user.notification_set.all(), request.GET.get('cursor'))
+    except ValueError:
+        return redirect('accounts:notifications')
+    # Only the page being shown is marked read; the rows keep is_read for the "New" badge
+    changed = await sync_to_async(outbox.mark_read)(request.user, [n.pk for n in notifications if not n.is_read])
+    request.user.unread_notifications = max(request.user.unread_notifications - changed, 0)
+    return render(request, 'accounts/notifications.html', {
+        'notifications': notifications,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+    })
+
+@login_required
+@require_POST
+def mark_all_notifications_read(request):
+    outbox.mark_all_read(request.user)
+    return redirect('accounts:notifications')
+
 @login_required
-def notifications(request):
-    notifications = request.user.notification_set.all().order_by('-created_at')
-    # Mark as read
-    notifications.update(is_read=True)
-    return render(request, 'accounts/notifications.html', {'notifications': notifications})
\ No newline at end of file
+def live_updates(request):
+    # Only reached under WSGI; bankapp/asgi.py streams this URL. Sends the
+    # current state once and has the browser reconnect after a while
+    retry = settings.LIVE_UPDATES['RETRY_SECONDS'] * 1000
+    response = HttpResponse(f'retry: {retry}\n\n'.encode() + live.snapshot(request.user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,52 @@
+from datetime import datetime, time, timedelta
+from django import forms
+from django.utils import timezone
+from transactions.models import Transaction
+
+class TransactionFilterForm(forms.Form):
+    status = forms.ChoiceField(
+        choices=[('', 'All statuses')] + Transaction.STATUS_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    date_from = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    date_to = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError('The start date must not be after the end date.')
+        return cleaned_data
+
+    def filter(self, queryset):
+        """Apply the validated filters; call only after is_valid()"""
+        data = self.cleaned_data
+        if data['status']:
+            queryset = queryset.filter(status=data['status'])
+        # Whole local days, as half-open datetime ranges so created_at's index is used
+        if data['date_from']:
+            queryset = queryset.filter(created_at__gte=_start_of(data['date_from']))
+        if data['date_to']:
+            queryset = queryset.filter(created_at__lt=_start_of(data['date_to'] + timedelta(days=1)))
+        return queryset
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+class BroadcastForm(forms.Form):
+    title = forms.CharField(
+        max_length=100,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g. Scheduled maintenance'})
+    )
+    message = forms.CharField(
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3, 'placeholder': 'Shown to every user'})
+    )
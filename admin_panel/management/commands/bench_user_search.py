@@ -0,0 +1,121 @@
+import statistics
+import time
+from datetime import date, timedelta
+from itertools import islice
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from accounts.models import User, Profile
+from accounts.search_index import has_fts_table
+from admin_panel.search import search_users
+
+BENCH_PREFIX = 'bench_search_'
+# Phone numbers and CNICs in ranges real users do not get
+PHONE_BASE = 3900000000
+CNIC_BASE = 9900000000000
+BATCH_SIZE = 5000
+
+
+def legacy_search(search):
+    """The previous unpaginated OR of three icontains filters, kept for comparison"""
+    users = User.objects.all().order_by('-date_joined')
+    return list(
+        users.filter(username__icontains=search)
+        | users.filter(phone_number__icontains=search)
+        | users.filter(email__icontains=search)
+    )
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users and measure admin user search latency per query type'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--reuse', action='store_true', help='Search users left by an earlier --keep run')
+        parser.add_argument('--keep', action='store_true', help='Keep the generated users afterwards')
+        parser.add_argument('--skip-legacy', action='store_true', help='Do not time the old search')
+
+    def handle(self, *args, **options):
+        total = options['users']
+        if not options['reuse']:
+            self._populate(total)
+        sample = total // 2
+        queries = {
+            'list (no query)': ('', 'prefix'),
+            'username prefix': (f'{BENCH_PREFIX}{sample:07d}'[:-2], 'prefix'),
+            'phone prefix': (f'+92 {PHONE_BASE + sample}'[:-3], 'prefix'),
+            'cnic prefix': (str(CNIC_BASE + sample)[:9], 'prefix'),
+            'account prefix': (f'CE{9000000000 + sample}'[:-2], 'prefix'),
+            'email prefix': (f'{BENCH_PREFIX}{sample:07d}@', 'prefix'),
+            'name contains': (f'son {sample:07d}', 'contains'),
+            'account contains': (str(9000000000 + sample)[-6:], 'contains'),
+        }
+        if not has_fts_table(connection):
+            self.stdout.write(self.style.WARNING('No substring index; contains searches will scan'))
+
+        self.stdout.write(f'{User.objects.count()} users')
+        self.stdout.write(f"{'query':20} {'rows':>5} {'median ms':>10} {'p99 ms':>10}")
+        for name, (query, mode) in queries.items():
+            page, next_cursor = search_users(query, mode=mode)
+            timings = self._time(lambda: search_users(query, mode=mode), options['repeat'])
+            self._report(name, len(page), timings)
+            if next_cursor:
+                timings = self._time(lambda: search_users(query, next_cursor, mode), options['repeat'])
+                self._report(f'{name}, page 2', len(page), timings)
+
+        if not options['skip_legacy']:
+            for name, query in (('legacy phone', queries['phone prefix'][0][4:]), ('legacy username', BENCH_PREFIX)):
+                rows = []
+                timings = self._time(lambda: rows.append(len(legacy_search(query))), 3)
+                self._report(name, rows[-1], timings)
+
+        if not options['keep']:
+            User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+    def _time(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return sorted(timings)
+
+    def _report(self, name, rows, timings):
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        self.stdout.write(f'{name:20} {rows:>5} {statistics.median(timings):>10.2f} {p99:>10.2f}')
+
+    def _populate(self, total):
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        # Hashing a password per user would dominate the run
+        password = make_password(None)
+        joined = timezone.now() - timedelta(minutes=total)
+        users = (
+            User(
+                username=f'{BENCH_PREFIX}{i:07d}',
+                email=f'{BENCH_PREFIX}{i:07d}@example.com',
+                phone_number=f'0{PHONE_BASE + i}',
+                password=password,
+                date_joined=joined + timedelta(minutes=i),
+            )
+            for i in range(total)
+        )
+        created = 0
+        while batch := list(islice(users, BATCH_SIZE)):
+            batch = User.objects.bulk_create(batch)
+            Profile.objects.bulk_create([self._profile(user, created + offset) for offset, user in enumerate(batch)])
+            created += len(batch)
+            self.stdout.write(f'\r{created}/{total} users', ending='')
+        self.stdout.write('')
+
+    def _profile(self, user, i):
+        cnic = str(CNIC_BASE + i)
+        return Profile(
+            user=user,
+            full_name=f'Person {i:07d}',
+            cnic=f'{cnic[:5]}-{cnic[5:12]}-{cnic[12:]}',
+            date_of_birth=date(1990, 1, 1),
+            address='Generated for search benchmark',
+            account_number=f'CE{9000000000 + i}',
+        )
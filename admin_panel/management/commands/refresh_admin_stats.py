@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from accounts import user_counts
+from admin_panel.stats import refresh_dashboard_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the cached admin dashboard statistics (run periodically, e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount-users', action='store_true',
+                            help='Recount the user totals from the user table first (a full scan)')
+
+    def handle(self, *args, **options):
+        if options['recount_users']:
+            user_counts.rebuild()
+        stats = refresh_dashboard_stats()
+        self.stdout.write(self.style.SUCCESS(f"Admin stats refreshed as of {stats['stats_as_of']:%Y-%m-%d %H:%M:%S}"))
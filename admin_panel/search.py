@@ -0,0 +1,101 @@
+"""Staff user search.
+
+Prefix searches pick one indexed column from the shape of the query (phone
+number, CNIC, account number, email or username) and seek on it with a
+range condition, so the database walks the B-tree instead of scanning.
+Usernames are matched without regard to case through the index on
+LOWER(username).
+Substring ("contains") searches use the index from accounts.search_index.
+"""
+import re
+from django.db import connection
+from django.db.models import Q
+from django.db.models.functions import Lower
+from accounts.models import User
+from accounts.utils import normalize_phone
+from accounts.search_index import SEARCH_TABLE, has_fts_table
+from transactions.pagination import PAGE_SIZE, decode_cursor, encode_cursor, keyset_page
+
+# Sorts after every character that can appear in the searched columns
+PREFIX_END = '\uffff'
+
+_fts_available = {}
+
+# Prefix fields that are expressions rather than columns, each matching an index
+PREFIX_EXPRESSIONS = {'username_lower': Lower('username')}
+
+
+def _format_cnic(digits):
+    # CNICs are stored as 12345-1234567-1
+    parts = [digits[:5], digits[5:12], digits[12:]]
+    return '-'.join(part for part in parts if part)
+
+
+def prefix_field(query):
+    """The (field, value) a prefix search for ``query`` should seek on"""
+    compact = re.sub(r'[\s-]', '', query)
+    if '@' in query:
+        return 'email', query
+    if compact[:2].upper() == 'CE' and compact[2:].isdigit():
+        return 'profile__account_number', 'CE' + compact[2:]
+    if compact.lstrip('+').isdigit():
+        if compact.startswith(('0', '+', '92')):
+            return 'phone_number', normalize_phone(compact)
+        return 'profile__cnic', _format_cnic(compact)
+    return 'username_lower', query.lower()
+
+
+def prefix_query(users, query):
+    """``users`` narrowed to a prefix search for ``query``, and the field to page on"""
+    field, value = prefix_field(query)
+    if field in PREFIX_EXPRESSIONS:
+        users = users.annotate(**{field: PREFIX_EXPRESSIONS[field]})
+    return users.filter(**{f'{field}__gte': value, f'{field}__lt': value + PREFIX_END}), field
+
+
+def _contains_page(users, query, cursor):
+    """Substring search, newest users first"""
+    if connection.alias not in _fts_available:
+        _fts_available[connection.alias] = has_fts_table(connection)
+    if _fts_available[connection.alias]:
+        after = decode_cursor(cursor)[1] if cursor else None
+        sql = f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s'
+        params = ['"' + query.replace('"', '""') + '"']
+        if after is not None:
+            sql += ' AND rowid < %s'
+            params.append(after)
+        sql += ' ORDER BY rowid DESC LIMIT %s'
+        params.append(PAGE_SIZE + 1)
+        with connection.cursor() as db_cursor:
+            db_cursor.execute(sql, params)
+            ids = [row[0] for row in db_cursor.fetchall()]
+        items = list(users.filter(pk__in=ids).order_by('-pk'))
+        next_cursor = None
+        if len(items) > PAGE_SIZE:
+            items = items[:PAGE_SIZE]
+            next_cursor = encode_cursor(items[-1], 'pk')
+        return items, next_cursor
+
+    # PostgreSQL serves these from the pg_trgm indexes; elsewhere they scan
+    matches = (
+        Q(username__icontains=query)
+        | Q(email__icontains=query)
+        | Q(phone_number__icontains=query)
+        | Q(profile__full_name__icontains=query)
+        | Q(profile__cnic__icontains=query)
+        | Q(profile__account_number__icontains=query)
+    )
+    return keyset_page(users.filter(matches), cursor, field='pk')
+
+
+def search_users(query='', cursor=None, mode='prefix'):
+    """One page of users matching ``query``; returns (users, next_cursor)"""
+    users = User.objects.select_related('profile')
+    query = query.strip()
+    if not query:
+        return keyset_page(users, cursor, field='date_joined')
+    # The trigram index needs at least three characters
+    if mode == 'contains' and len(query) >= 3:
+        return _contains_page(users, query, cursor)
+    matches, field = prefix_query(users, query)
+    return keyset_page(matches, cursor, field=field, descending=False)
@@ -0,0 +1,48 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, Sum
+from django.utils import timezone
+from accounts import user_counts
+from accounts.models import KYCDocument
+from transactions.models import DailyTransactionRollup
+
+STATS_KEY = 'admin_panel:dashboard_stats'
+
+
+def compute_dashboard_stats():
+    """Headline numbers for the staff dashboard.
+
+    User totals come from the maintained counter row, transaction totals from the
+    daily rollups (a few dozen rows per day), and pending KYC uses its partial
+    index, so none of this scans a large table.
+    """
+    users = user_counts.get()
+    totals = DailyTransactionRollup.objects.aggregate(
+        total_transactions=Sum('count'),
+        total_volume=Sum('volume', filter=Q(status='completed')),
+    )
+    return {
+        'total_users': users['total'],
+        'active_users': users['active'],
+        'total_transactions': totals['total_transactions'] or 0,
+        'total_volume': totals['total_volume'] or 0,
+        'pending_kyc': KYCDocument.objects.filter(status='pending').count(),
+        'stats_as_of': timezone.now(),
+    }
+
+
+def refresh_dashboard_stats():
+    stats = compute_dashboard_stats()
+    cache.set(STATS_KEY, stats, settings.ADMIN_STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def get_dashboard_stats():
+    """Cached dashboard stats; recomputed at most once per timeout"""
+    return cache.get(STATS_KEY) or refresh_dashboard_stats()
+
+
+async def aget_dashboard_stats():
+    """get_dashboard_stats for async views"""
+    return await cache.aget(STATS_KEY) or await sync_to_async(refresh_dashboard_stats)()
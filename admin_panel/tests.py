@@ -0,0 +1,129 @@
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from accounts import onboarding, search_index, user_counts
+from accounts.models import User, UserCounts
+from accounts.tests import make_user
+from transactions import ledger
+from . import search, stats
+
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        search._fts_available.clear()
+        self.addCleanup(search._fts_available.clear)
+
+    def test_index_lookup_is_cached(self):
+        with mock.patch.object(search, 'has_fts_table', return_value=False) as has_fts_table:
+            search.search_users('bob', None, 'contains')
+            search.search_users('bob', None, 'contains')
+        has_fts_table.assert_called_once()
+
+    def test_username_prefix_ignores_case(self):
+        user = make_user('AliKhan', '03000000001')
+        make_user('bob', '03000000002')
+        for query in ('ali', 'ALIK', 'AliKhan'):
+            users, next_cursor = search.search_users(query)
+            self.assertEqual(users, [user])
+
+    def test_contains_finds_partial_email(self):
+        user = make_user('alice', '03000000001')
+        user.email = 'alice.w@gmail.com'
+        user.save()
+        make_user('bob', '03000000002')
+        for fts in (True, False):
+            search._fts_available.clear()
+            with mock.patch.object(search, 'has_fts_table', return_value=fts and search_index.has_fts_table(connection)):
+                users, next_cursor = search.search_users('gmail', mode='contains')
+            self.assertEqual(users, [user])
+
+    def test_mistyped_account_number_is_flagged(self):
+        staff = make_user('staff', '03000000003')
+        staff.is_staff = True
+        staff.save()
+        self.client.force_login(staff)
+        number = staff.profile.account_number
+        mistyped = number[:-1] + str((int(number[-1]) + 1) % 10)
+        response = self.client.get('/admin-panel/users/', {'search': mistyped})
+        self.assertContains(response, 'not a valid account number')
+        response = self.client.get('/admin-panel/users/', {'search': number})
+        self.assertNotContains(response, 'not a valid account number')
+
+    def test_missing_triggers_are_reported(self):
+        if not search_index.has_fts_table(connection):
+            self.skipTest('No FTS search table on this database')
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {search_index.SEARCH_TABLE}_profile_au')
+        warnings = search_index.check_search_triggers(databases=['default'])
+        self.assertEqual([warning.id for warning in warnings], ['accounts.W001'])
+        self.assertIn('profile_au', warnings[0].msg)
+
+
+class FinancialReportTests(TestCase):
+    def setUp(self):
+        self.user = make_user('alice', '03000000001', balance='100.00')
+        self.other = make_user('bob', '03000000002')
+        self.staff = make_user('staff', '03000000003')
+        self.staff.is_staff = True
+        self.staff.save()
+        self.client.force_login(self.staff)
+
+    def test_reports_render_the_rollups(self):
+        ledger.transfer(self.user, self.other, Decimal('30.00'))
+        response = self.client.get('/admin-panel/reports/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'PKR 30.00')
+        self.assertEqual([user.username for user in response.context['top_users']], ['alice'])
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        self.staff = make_user('staff', '03000000003')
+        self.staff.is_staff = True
+        self.staff.save()
+        self.client.force_login(self.staff)
+
+    def assertCounts(self, total, active):
+        self.assertEqual(user_counts.get(), {'total': total, 'active': active})
+        self.assertEqual(user_counts.get(), user_counts.rebuild())
+
+    def test_counts_follow_registration_blocking_and_deletion(self):
+        alice = make_user('alice', '03000000001')
+        self.assertCounts(2, 2)
+        self.client.get(f'/admin-panel/block-user/{alice.pk}/')
+        self.assertCounts(2, 1)
+        self.client.get(f'/admin-panel/unblock-user/{alice.pk}/')
+        self.assertCounts(2, 2)
+        User.objects.filter(pk=alice.pk).update(is_active=False)
+        user_counts.rebuild()
+        User.objects.get(pk=alice.pk).delete()
+        self.assertCounts(1, 1)
+
+    def test_saving_a_deferred_user_keeps_the_counts(self):
+        user = User.objects.only('username').get(pk=self.staff.pk)
+        user.save()
+        self.assertCounts(1, 1)
+
+    def test_bulk_onboarding_is_counted(self):
+        stream = StringIO(
+            'username,phone_number,cnic,date_of_birth\n'
+            'carol,03000000011,12345-0000011-1,1990-01-01\n'
+            'dave,03000000012,12345-0000012-1,1990-01-01\n'
+        )
+        results = list(onboarding.onboard(onboarding.read_customers(stream), workers=1))
+        self.assertEqual([result['status'] for result in results], ['created', 'created'])
+        self.assertCounts(3, 3)
+
+    def test_missing_row_is_rebuilt(self):
+        UserCounts.objects.all().delete()
+        make_user('alice', '03000000001')
+        self.assertCounts(2, 2)
+
+    def test_stats_do_not_count_users(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = stats.compute_dashboard_stats()
+        self.assertEqual((result['total_users'], result['active_users']), (1, 1))
+        self.assertFalse([query['sql'] for query in queries if 'FROM "accounts_user"' in query['sql']])
@@ -1,69 +1,97 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.db.models import Sum, Count
+from django.db.models import Sum, F
 from django.utils import timezone
 from datetime import timedelta
-from accounts.models import User, Profile, KYCDocument, Notification
-from transactions.models import Transaction, Bill
+from accounts import numbers, outbox
+from accounts.decorators import astaff_member_required
+from accounts.models import User, Profile, KYCDocument, Broadcast
+from transactions.models import Transaction, Bill, DailyTransactionRollup
+from transactions.pagination import keyset_page
+from .export import FORMATS
+from .forms import BroadcastForm, TransactionFilterForm
+from .search import search_users
+from .stats import aget_dashboard_stats
 
-@staff_member_required
-def admin_dashboard(request):
-    # Statistics
-    total_users = User.objects.count()
-    active_users = User.objects.filter(is_active=True, is_blocked=False).count()
-    total_transactions = Transaction.objects.count()
-    total_volume = Transaction.objects.filter(status='completed').aggregate(Sum('amount'))['amount__sum'] or 0
-    pending_kyc = KYCDocument.objects.filter(status='pending').count()
+@astaff_member_required
+async def admin_dashboard(request):
+    # Statistics (cached; see admin_panel.stats)
+    stats = await aget_dashboard_stats()
     
     # Recent transactions
-    recent_transactions = Transaction.objects.all().order_by('-created_at')[:10]
+    recent_transactions = [
+        trans async for trans in Transaction.objects.select_related('sender', 'receiver').order_by('-created_at')[:10]
+    ]
     
     context = {
-        'total_users': total_users,
-        'active_users': active_users,
-        'total_transactions': total_transactions,
-        'total_volume': total_volume,
-        'pending_kyc': pending_kyc,
+        **stats,
         'recent_transactions': recent_transactions,
     }
     return render(request, 'admin_panel/dashboard.html', context)
 
 @staff_member_required
 def user_management(request):
-    users = User.objects.all().order_by('-date_joined')
-    
-    # Search functionality
-    search = request.GET.get('search')
-    if search:
-        users = users.filter(
-            username__icontains=search
-        ) | users.filter(
-            phone_number__icontains=search
-        ) | users.filter(
-            email__icontains=search
-        )
+    # Indexed prefix search by default; "contains" uses the substring index
+    search = request.GET.get('search', '').strip()
+    mode = 'contains' if request.GET.get('mode') == 'contains' else 'prefix'
+    try:
+        users, next_cursor = search_users(search, request.GET.get('cursor'), mode)
+    except ValueError:
+        messages.error(request, 'Invalid page link.')
+        return redirect('admin_panel:user_management')
+    
+    if not users and numbers.is_mistyped(search):
+        messages.warning(request, f'{search} is not a valid account number; check it for a mistyped digit.')
     
-    return render(request, 'admin_panel/user_management.html', {'users': users})
+    context = {
+        'users': users,
+        'search': search,
+        'mode': mode,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+    }
+    return render(request, 'admin_panel/user_management.html', context)
 
 @staff_member_required
 def transaction_management(request):
-    transactions = Transaction.objects.all().order_by('-created_at')
-    
-    # Filter by status
-    status_filter = request.GET.get('status')
-    if status_filter:
-        transactions = transactions.filter(status=status_filter)
-    
-    # Filter by date range
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
-    if date_from:
-        transactions = transactions.filter(created_at__gte=date_from)
-    if date_to:
-        transactions = transactions.filter(created_at__lte=date_to)
-    
-    return render(request, 'admin_panel/transaction_management.html', {'transactions': transactions})
+    form = TransactionFilterForm(request.GET)
+    transactions, next_cursor = [], None
+    if form.is_valid():
+        queryset = form.filter(Transaction.objects.select_related('sender', 'receiver'))
+        try:
+            transactions, next_cursor = keyset_page(queryset, request.GET.get('cursor'))
+        except ValueError:
+            messages.error(request, 'Invalid page link.')
+            return redirect('admin_panel:transaction_management')
+    
+    # Filters without the cursor, for the pagination and export links
+    filters = request.GET.copy()
+    filters.pop('cursor', None)
+    
+    context = {
+        'form': form,
+        'transactions': transactions,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+        'filters': filters.urlencode(),
+    }
+    return render(request, 'admin_panel/transaction_management.html', context)
+
+@staff_member_required
+def export_transactions(request, fmt):
+    if fmt not in FORMATS:
+        raise Http404('Unknown export format')
+    form = TransactionFilterForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest('Invalid filters')
+    
+    content_type, lines = FORMATS[fmt]
+    response = StreamingHttpResponse(lines(form.filter(Transaction.objects.all())), content_type=content_type)
+    filename = f"transactions-{timezone.now():%Y%m%d-%H%M%S}.{fmt}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
 @staff_member_required
 def kyc_review(request):
@@ -78,10 +106,10 @@ def approve_kyc(request, doc_id):
     doc.save()
     
     # Notify user
-    Notification.objects.create(
-        user=doc.user,
-        title='KYC Approved',
-        message=f'Your {doc.get_document_type_display()} has been approved.'
+    outbox.notify(
+        doc.user,
+        'KYC Approved',
+        f'Your {doc.get_document_type_display()} has been approved.'
     )
     
     messages.success(request, f'KYC document approved for {doc.user.username}')
@@ -99,10 +127,10 @@ def reject_kyc(request, doc_id):
         doc.save()
         
         # Notify user
-        Notification.objects.create(
-            user=doc.user,
-            title='KYC Rejected',
-            message=f'Your {doc.get_document_type_display()} was rejected. Reason: {notes}'
+        outbox.notify(
+            doc.user,
+            'KYC Rejected',
+            f'Your {doc.get_document_type_display()} was rejected. Reason: {notes}'
         )
         
         messages.success(request, f'KYC document rejected for {doc.user.username}')
@@ -117,10 +145,10 @@ def block_user(request, user_id):
     user.save()
     
     # Notify user
-    Notification.objects.create(
-        user=user,
-        title='Account Blocked',
-        message='Your account has been temporarily blocked. Contact support for assistance.'
+    outbox.notify(
+        user,
+        'Account Blocked',
+        'Your account has been temporarily blocked. Contact support for assistance.'
     )
     
     messages.success(request, f'User {user.username} has been blocked.')
@@ -133,42 +161,57 @@ def unblock_user(request, user_id):
     user.save()
     
     # Notify user
-    Notification.objects.create(
-        user=user,
-        title='Account Unblocked',
-        message='Your account has been unblocked. You can now use all services.'
+    outbox.notify(
+        user,
+        'Account Unblocked',
+        'Your account has been unblocked. You can now use all services.'
     )
     
     messages.success(request, f'User {user.username} has been unblocked.')
     return redirect('admin_panel:user_management')
 
+@staff_member_required
+def broadcasts(request):
+    if request.method == 'POST':
+        form = BroadcastForm(request.POST)
+        if form.is_valid():
+            # Stored once; process_notifications fans it out in the background
+            broadcast = outbox.broadcast(form.cleaned_data['title'], form.cleaned_data['message'], request.user)
+            messages.success(request, f'Broadcast queued for {broadcast.total_users} users.')
+            return redirect('admin_panel:broadcasts')
+    else:
+        form = BroadcastForm()
+    
+    return render(request, 'admin_panel/broadcasts.html', {
+        'form': form,
+        'broadcasts': Broadcast.objects.select_related('created_by').order_by('-pk')[:20],
+    })
+
 @staff_member_required
 def financial_reports(request):
+    # Everything here reads the rollup tables, never the Transaction table
+    completed = DailyTransactionRollup.objects.filter(status='completed')
+    
     # Daily transactions for last 30 days
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    daily_transactions = Transaction.objects.filter(
-        created_at__gte=thirty_days_ago,
-        status='completed'
-    ).extra(
-        select={'day': 'date(created_at)'}
+    thirty_days_ago = timezone.localdate() - timedelta(days=30)
+    daily_transactions = completed.filter(
+        day__gte=thirty_days_ago
     ).values('day').annotate(
-        count=Count('id'),
-        volume=Sum('amount')
+        count=Sum('count'),
+        volume=Sum('volume')
     ).order_by('day')
     
     # Transaction type breakdown
-    transaction_types = Transaction.objects.filter(
-        status='completed'
-    ).values('transaction_type').annotate(
-        count=Count('id'),
-        volume=Sum('amount')
+    transaction_types = completed.values('transaction_type').annotate(
+        count=Sum('count'),
+        volume=Sum('volume')
     )
     
     # Top users by transaction volume
-    top_users = User.objects.annotate(
-        transaction_volume=Sum('sent_transactions__amount')
-    ).filter(
-        transaction_volume__isnull=False
+    top_users = User.objects.filter(
+        volume_rollup__isnull=False
+    ).annotate(
+        transaction_volume=F('volume_rollup__sent_volume')
     ).order_by('-transaction_volume')[:10]
     
     context = {
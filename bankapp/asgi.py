@@ -13,4 +13,22 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bankapp.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up
+from django.urls import reverse  # noqa: E402
+from accounts import live  # noqa: E402
+from bankapp.sqlite3.base import set_journal_modes  # noqa: E402
+
+set_journal_modes()
+
+LIVE_PATH = reverse('accounts:live_updates')
+
+
+async def application(scope, receive, send):
+    # Live update streams stay open for hours, so they bypass the Django
+    # handler, which would hold a thread per connection
+    if scope['type'] == 'http' and scope['path'] == LIVE_PATH:
+        await live.application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
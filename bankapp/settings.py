@@ -1,5 +1,6 @@
 import os
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -49,12 +50,54 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'bankapp.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# Database profile, chosen with DB_ENGINE. SQLite runs in WAL mode once a
+# server has started (see bankapp/sqlite3), so readers never wait for the
+# writer, and starts transactions IMMEDIATE, so concurrent writers wait on
+# the busy timeout instead of failing with "database is locked". PostgreSQL keeps connections open between requests;
+# put PgBouncer in front of it to pool them across workers.
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='bankapp_db'),
+            'USER': config('DB_USER', default=''),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='5432'),
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+            'CONN_HEALTH_CHECKS': True,
+            # Needed behind PgBouncer in transaction pooling mode
+            'DISABLE_SERVER_SIDE_CURSORS': config('DB_PGBOUNCER', default=False, cast=bool),
+            'OPTIONS': {
+                'connect_timeout': config('DB_CONNECT_TIMEOUT', default=5, cast=int),
+            },
+        }
     }
-}
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'bankapp.sqlite3',
+            'NAME': config('SQLITE_PATH', default=os.path.join(BASE_DIR, 'db.sqlite3')),
+            # A file rather than shared memory, so threaded tests wait on the busy timeout like production
+            'TEST': {'NAME': config('SQLITE_TEST_PATH', default=os.path.join(BASE_DIR, 'test_db.sqlite3'))},
+            'OPTIONS': {
+                # Seconds a connection waits for a lock before giving up
+                'timeout': config('SQLITE_BUSY_TIMEOUT', default=20, cast=float),
+                'transaction_mode': config('SQLITE_TRANSACTION_MODE', default='IMMEDIATE'),
+                'journal_mode': config('SQLITE_JOURNAL_MODE', default='WAL'),
+                'init_command': ';'.join([
+                    # With WAL a power cut may lose the last commits but never corrupts
+                    # the database; FULL syncs every commit to disk
+                    f"PRAGMA synchronous = {config('SQLITE_SYNCHRONOUS', default='NORMAL')}",
+                    f"PRAGMA mmap_size = {config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int)}",
+                ]),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"DB_ENGINE must be 'sqlite' or 'postgresql', not {DB_ENGINE!r}")
 
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -76,10 +119,129 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Rendered QR images, cached by content: an in-process LRU bounded in bytes in
+# front of a shared directory (set QR_CACHE_DIR to an empty string to disable it)
+QR_CACHE = {
+    'MEMORY_BYTES': config('QR_CACHE_MEMORY_BYTES', default=16 * 1024 * 1024, cast=int),
+    'DIRECTORY': config('QR_CACHE_DIR', default=os.path.join(MEDIA_ROOT, 'qr_cache')),
+}
+
+# How long a one-time (fixed amount) QR code can be paid after it is generated
+QR_CODE_TTL_MINUTES = config('QR_CODE_TTL_MINUTES', default=15, cast=int)
+
+# Biller settlement files written by manage.py settle_bills
+SETTLEMENT_DIR = config('SETTLEMENT_DIR', default=os.path.join(BASE_DIR, 'settlements'))
+
+# Payout rows the bulk transfer page accepts in one upload; larger files go
+# through manage.py disburse, which streams them
+DISBURSEMENT_MAX_UPLOAD_ROWS = config('DISBURSEMENT_MAX_UPLOAD_ROWS', default=5000, cast=int)
+
+# Drift reports and saved progress of manage.py reconcile_balances
+RECONCILIATION_DIR = config('RECONCILIATION_DIR', default=os.path.join(BASE_DIR, 'reconciliation'))
+
+# Transaction id generator (see transactions/ids.py). Each process draws a random
+# node for its ids unless TRANSACTION_ID_NODE gives it one (0-65535), and draws
+# again if an id it made is already taken.
+TRANSACTION_IDS = {
+    'GENERATOR': config('TRANSACTION_ID_GENERATOR', default='transactions.ids.TimeOrderedIdGenerator'),
+    'OPTIONS': {'node': config('TRANSACTION_ID_NODE', default=None)},
+}
+
+# Rows each daily transaction rollup is split over; transfers pick one at random
+ROLLUP_SHARDS = config('ROLLUP_SHARDS', default=16, cast=int)
+
+# Account numbers each worker reserves at a time (see accounts/numbers.py)
+ACCOUNT_NUMBER_BLOCK_SIZE = config('ACCOUNT_NUMBER_BLOCK_SIZE', default=100, cast=int)
+
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/accounts/dashboard/'
 LOGOUT_REDIRECT_URL = '/'
 
+# Seconds a user's dashboard month totals stay cached; ledger writes invalidate them early
+DASHBOARD_STATS_CACHE_TIMEOUT = config('DASHBOARD_STATS_CACHE_TIMEOUT', default=300, cast=int)
+
+# Seconds the admin dashboard headline numbers are cached (see refresh_admin_stats)
+ADMIN_STATS_CACHE_TIMEOUT = config('ADMIN_STATS_CACHE_TIMEOUT', default=60, cast=int)
+
+# Sliding-window fraud velocity rules (amounts in PKR, None disables a rule).
+# LocalVelocityBackend counts per process, so it is only allowed with DEBUG;
+# use CacheVelocityBackend on a shared cache or DatabaseVelocityBackend otherwise.
+FRAUD_VELOCITY_BACKEND = config(
+    'FRAUD_VELOCITY_BACKEND',
+    default='accounts.velocity.LocalVelocityBackend' if DEBUG else 'accounts.velocity.DatabaseVelocityBackend',
+)
+if not DEBUG and FRAUD_VELOCITY_BACKEND == 'accounts.velocity.LocalVelocityBackend':
+    raise ImproperlyConfigured(
+        'LocalVelocityBackend multiplies the velocity limits by the number of workers; '
+        'use DatabaseVelocityBackend or CacheVelocityBackend on a shared cache'
+    )
+
+FRAUD_VELOCITY = {
+    'BACKEND': FRAUD_VELOCITY_BACKEND,
+    'OPTIONS': {},
+    'MAX_SINGLE_AMOUNT': config('FRAUD_MAX_SINGLE_AMOUNT', default=100000, cast=int),
+    'MAX_AMOUNT_PER_HOUR': config('FRAUD_MAX_AMOUNT_PER_HOUR', default=50000, cast=int),
+    'MAX_COUNT_PER_MINUTE': config('FRAUD_MAX_COUNT_PER_MINUTE', default=10, cast=int),
+    'MAX_RECEIVED_PER_HOUR': None,
+    'NEW_COUNTERPARTY_MAX_AMOUNT': config('FRAUD_NEW_COUNTERPARTY_MAX_AMOUNT', default=25000, cast=int),
+}
+
+# Fraud scoring pipeline: rule scores are summed and compared to THRESHOLD.
+# Velocity hits score a full THRESHOLD on their own; the softer signals only
+# block a transaction in combination. REQUIRED_RULES always run; RULES run
+# in order until BUDGET_MS is spent.
+FRAUD_SCORING = {
+    'REQUIRED_RULES': [
+        'accounts.fraud.velocity_rule',
+    ],
+    'RULES': [
+        'accounts.fraud.time_of_day_rule',
+        'accounts.fraud.device_change_rule',
+        'accounts.fraud.new_receiver_rule',
+        'accounts.fraud.amount_zscore_rule',
+    ],
+    'WEIGHTS': {
+        'velocity': 1.0,
+        'amount_zscore': 0.6,
+        'device_change': 0.4,
+        'new_receiver': 0.3,
+        'time_of_day': 0.2,
+    },
+    'THRESHOLD': config('FRAUD_SCORE_THRESHOLD', default=1.0, cast=float),
+    'BUDGET_MS': config('FRAUD_SCORING_BUDGET_MS', default=25, cast=int),
+    'ZSCORE_LIMIT': 3.0,
+    'MIN_HISTORY': 5,
+    'NIGHT_HOURS': (1, 5),
+}
+
+# Replays of a money-moving request with the same Idempotency-Key return the
+# stored result for TTL_HOURS; purge_idempotency_keys trims the table to MAX_KEYS
+IDEMPOTENCY = {
+    'TTL_HOURS': config('IDEMPOTENCY_TTL_HOURS', default=24, cast=int),
+    'MAX_KEYS': config('IDEMPOTENCY_MAX_KEYS', default=1000000, cast=int),
+}
+
+# Notifications are queued in an outbox and delivered in batches of
+# BATCH_SIZE by manage.py process_notifications, which polls every POLL_SECONDS.
+# Broadcasts reach BROADCAST_BATCH_SIZE users per (short) transaction and pause
+# BROADCAST_PAUSE_SECONDS between chunks so user writes get the database in between
+NOTIFICATIONS = {
+    'BATCH_SIZE': config('NOTIFICATION_BATCH_SIZE', default=500, cast=int),
+    'BROADCAST_BATCH_SIZE': config('NOTIFICATION_BROADCAST_BATCH_SIZE', default=2000, cast=int),
+    'BROADCAST_PAUSE_SECONDS': config('NOTIFICATION_BROADCAST_PAUSE_SECONDS', default=0.05, cast=float),
+    'POLL_SECONDS': config('NOTIFICATION_POLL_SECONDS', default=1.0, cast=float),
+}
+
+# Server-sent events served by bankapp/asgi.py. LocalPubSubBackend only
+# reaches streams in the publishing process; run one ASGI worker with it
+LIVE_UPDATES = {
+    'BACKEND': config('LIVE_UPDATES_BACKEND', default='accounts.live.LocalPubSubBackend'),
+    'OPTIONS': {},
+    'KEEPALIVE_SECONDS': config('LIVE_UPDATES_KEEPALIVE_SECONDS', default=15, cast=float),
+    # How long a browser served by WSGI waits before asking again
+    'RETRY_SECONDS': config('LIVE_UPDATES_RETRY_SECONDS', default=30, cast=int),
+}
+
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
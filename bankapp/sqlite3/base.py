@@ -0,0 +1,60 @@
+"""SQLite backend accepting the connection OPTIONS Django 5.1 added.
+
+Django 4.2 passes OPTIONS straight to sqlite3.connect() and opens every
+transaction with a plain BEGIN. A deferred transaction that reads and
+then writes has to upgrade its lock, and SQLite refuses the upgrade with
+"database is locked" instead of waiting on busy_timeout. This backend
+adds two options:
+
+``init_command``
+    Semicolon-separated statements run on every new connection, used for
+    the PRAGMAs in settings.DATABASES.
+``transaction_mode``
+    Used as ``BEGIN <mode>``. IMMEDIATE takes the write lock when the
+    transaction starts, so concurrent writers queue instead of failing.
+
+They behave as in Django 5.1, so after upgrading, ENGINE can go back to
+django.db.backends.sqlite3 with the same OPTIONS.
+
+A third option, ``journal_mode``, is this project's own. SQLite stores the
+journal mode in the database file, so setting it on every connection
+would rewrite the file's header whenever any manage.py command opened
+it. Instead the server entry points (bankapp/wsgi.py and bankapp/asgi.py)
+call set_journal_modes() once at startup.
+"""
+from django.db import connections
+from django.db.backends.sqlite3 import base
+
+BACKEND_OPTIONS = ('init_command', 'transaction_mode', 'journal_mode')
+
+
+def set_journal_modes():
+    """Switch every SQLite database with a ``journal_mode`` option to that mode"""
+    for connection in connections.all():
+        mode = connection.settings_dict['OPTIONS'].get('journal_mode')
+        if connection.vendor == 'sqlite' and mode:
+            with connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA journal_mode = {mode}')
+            # Workers open their own connections
+            connection.close()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        for option in BACKEND_OPTIONS:
+            params.pop(option, None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        init_command = self.settings_dict['OPTIONS'].get('init_command')
+        if init_command:
+            for statement in init_command.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
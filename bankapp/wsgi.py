@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bankapp.settings")
 
 application = get_wsgi_application()
+
+from bankapp.sqlite3.base import set_journal_modes  # noqa: E402
+
+set_journal_modes()
@@ -0,0 +1,136 @@
+"""Bulk disbursements: one sender paying many receivers from a CSV or JSONL file.
+
+Rows are processed in batches. For each batch the receivers are resolved
+with one ``phone_number__in`` query and paid through
+``ledger.transfer_many`` in a single database transaction. If the sender
+cannot cover a batch, every row in that batch fails and earlier batches
+stay paid. Each input row gets exactly one result.
+
+A row above the single transfer limit (FRAUD_VELOCITY['MAX_SINGLE_AMOUNT'])
+fails like it would through send money. The per-minute and per-hour
+velocity limits are not applied row by row, since a payroll file exceeds
+them by design; the ledger records the paid rows against them, so the
+sender's next single transfers see the whole batch.
+"""
+import csv
+import io
+import json
+from itertools import islice
+from django.conf import settings
+from django.db import transaction
+from accounts import outbox
+from accounts.models import User
+from accounts.utils import normalize_phone
+from . import ledger
+
+BATCH_SIZE = 1000
+FORMATS = ('csv', 'jsonl')
+
+
+def read_payouts(stream, fmt='csv'):
+    """Yield {'line', 'phone', 'amount', 'description'} rows from a text stream.
+
+    CSV files need a header row with ``phone`` and ``amount`` columns;
+    ``description`` is optional. Rows that cannot be parsed, or whose amount
+    is not a positive number, come back with an ``error`` key instead of
+    being dropped, so they are still reported.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield _payout(
+                reader.line_num,
+                (row.get('phone') or '').strip(),
+                (row.get('amount') or '').strip(),
+                (row.get('description') or '').strip(),
+            )
+    elif fmt == 'jsonl':
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+                payout = _payout(line, str(row['phone']), str(row['amount']), str(row.get('description', '')))
+            except (ValueError, KeyError, TypeError):
+                payout = {'line': line, 'phone': '', 'amount': '', 'description': '', 'error': 'Unreadable row'}
+            yield payout
+    else:
+        raise ValueError(f'Unknown payout format {fmt!r}')
+
+
+def _payout(line, phone, amount, description):
+    row = {'line': line, 'phone': phone, 'amount': amount, 'description': description}
+    try:
+        ledger.to_amount(amount)
+    except ledger.LedgerError as exc:
+        row['error'] = str(exc)
+    return row
+
+
+def read_uploaded_payouts(uploaded_file):
+    """read_payouts for a Django UploadedFile, choosing the format by extension"""
+    fmt = 'jsonl' if uploaded_file.name.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+    return read_payouts(io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline=''), fmt)
+
+
+def _result(row, status, **extra):
+    return {'line': row['line'], 'phone': row['phone'], 'amount': row['amount'], 'status': status, **extra}
+
+
+def _pay_batch(sender, rows, transaction_type, notify):
+    limit = settings.FRAUD_VELOCITY['MAX_SINGLE_AMOUNT']
+    results = {}
+    valid = []
+    phones = {normalize_phone(row['phone']) for row in rows if 'error' not in row}
+    receivers = dict(
+        User.objects.filter(phone_number__in=phones, profile__isnull=False).values_list('phone_number', 'id')
+    )
+    for row in rows:
+        if 'error' in row:
+            results[row['line']] = _result(row, 'failed', error=row['error'])
+            continue
+        receiver_id = receivers.get(normalize_phone(row['phone']))
+        try:
+            amount = ledger.to_amount(row['amount'])
+        except ledger.LedgerError as exc:
+            results[row['line']] = _result(row, 'failed', error=str(exc))
+            continue
+        if limit is not None and amount > limit:
+            results[row['line']] = _result(row, 'failed', error='Large transaction amount')
+        elif receiver_id is None:
+            results[row['line']] = _result(row, 'failed', error='Receiver not found')
+        elif receiver_id == sender.pk:
+            results[row['line']] = _result(row, 'failed', error='Cannot pay yourself')
+        else:
+            valid.append((row, receiver_id, amount))
+
+    try:
+        with transaction.atomic():
+            transactions = ledger.transfer_many(
+                sender,
+                [(receiver_id, amount, row['description']) for row, receiver_id, amount in valid],
+                transaction_type,
+            )
+            if notify and transactions:
+                outbox.notify_many(
+                    (trans.receiver_id, 'Money Received', f'You received PKR {trans.amount} from {sender.get_full_name()}')
+                    for trans in transactions
+                )
+    except ledger.LedgerError as exc:
+        # Insufficient balance, or a receiver closed since the lookup; earlier batches stay paid
+        for row, _, _ in valid:
+            results[row['line']] = _result(row, 'failed', error=str(exc))
+    else:
+        for (row, _, _), trans in zip(valid, transactions):
+            results[row['line']] = _result(row, 'paid', transaction_id=trans.transaction_id)
+    return [results[row['line']] for row in rows]
+
+
+def disburse(sender, rows, batch_size=BATCH_SIZE, transaction_type='send', notify=True):
+    """Pay every row from ``sender`` and yield one result dict per row, in input order"""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        yield from _pay_batch(sender, batch, transaction_type, notify)
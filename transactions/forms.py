@@ -68,7 +68,17 @@ class QRPaymentForm(forms.Form):
     qr_data = forms.CharField(
         widget=forms.Textarea(attrs={'class': 'form-control', 'placeholder': 'Scan QR or paste data', 'rows': 3})
     )
+    # Only used for codes that do not fix an amount
+    amount = forms.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        required=False,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Amount (PKR)'})
+    )
     pin = forms.CharField(
         max_length=4,
         widget=forms.PasswordInput(attrs={'class': 'form-control', 'placeholder': 'Enter PIN'})
-    )
\ No newline at end of file
+    )
+class BulkTransferForm(forms.Form):
+    file = forms.FileField(help_text='CSV with phone, amount, description columns, or JSONL')
+    pin = forms.CharField(max_length=4)
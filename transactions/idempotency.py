@@ -0,0 +1,150 @@
+"""Exactly-once handling for money-moving requests.
+
+Clients send a key with each submission, either in the ``Idempotency-Key``
+header or in the ``idempotency_key`` form field that
+``{% idempotency_field %}`` renders. The first request that completes
+stores its transaction and response context under (user, key) in the
+same database transaction as the ledger write. A replay gets the stored
+response back from one indexed lookup and never reaches the ledger.
+
+A key also records the view it was used on and a hash of the submitted
+fields. Reusing it for a different view or different fields is a client
+bug, not a retry, and is answered with 422 instead of the old receipt.
+
+Concurrent duplicates are settled by the unique constraint. Their ledger
+writes are serialised, on PostgreSQL by the lock on the user's balance
+row and on SQLite by the database write lock that BEGIN IMMEDIATE takes.
+The second one fails to insert the key, its ledger write is rolled back,
+and it returns the first request's response.
+"""
+import functools
+import hashlib
+import re
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.shortcuts import render
+from django.utils import timezone
+from .models import IdempotencyKey
+
+KEY_PATTERN = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+# Not part of what the request asks for; the PIN is left out so the hash cannot be used to guess it
+UNHASHED_FIELDS = {'csrfmiddlewaretoken', 'idempotency_key', 'pin'}
+
+
+class KeyReused(Exception):
+    """An idempotency key sent again with a different view or different fields"""
+
+
+def get_key(request):
+    """The request's idempotency key, or None if it has no usable one"""
+    key = request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key', '')
+    key = key.strip()
+    return key if KEY_PATTERN.match(key) else None
+
+
+def fingerprint(request):
+    """(view name, hash of the submitted fields) identifying what a request asks for"""
+    match = request.resolver_match
+    endpoint = match.view_name if match is not None else request.path
+    digest = hashlib.sha256()
+    for name, values in sorted(request.POST.lists()):
+        if name not in UNHASHED_FIELDS:
+            digest.update(repr((name, values)).encode())
+    return endpoint, digest.hexdigest()
+
+
+def _check(record, request):
+    # Keys stored before fingerprints were recorded have none to compare
+    if record.request_hash and (record.endpoint, record.request_hash) != fingerprint(request):
+        raise KeyReused(get_key(request))
+
+
+def rejects_reused_keys(view):
+    """Answer a request that reuses a key for something else with 422"""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except KeyReused:
+            return render(request, 'transactions/error.html', {
+                'error_message': 'This request reuses the key of a different request. Reload the form and try again.',
+                'error_code': 'IDEMPOTENCY_KEY_REUSED'
+            }, status=422)
+    return wrapper
+
+
+def _expired(record, now=None):
+    ttl = timedelta(hours=settings.IDEMPOTENCY['TTL_HOURS'])
+    return record.created_at < (now or timezone.now()) - ttl
+
+
+def replay(request):
+    """The stored response for a request that already completed, or None.
+
+    Raises KeyReused if the key was stored for a different request.
+    """
+    key = get_key(request)
+    if key is None:
+        return None
+    record = IdempotencyKey.objects.filter(user=request.user, key=key).only(
+        'response', 'created_at', 'endpoint', 'request_hash'
+    ).first()
+    if record is None:
+        return None
+    if _expired(record):
+        # Free the key so this request can run and store a fresh result
+        record.delete()
+        return None
+    _check(record, request)
+    return record.response
+
+
+def run_once(request, action):
+    """Run ``action`` and store its result under the request's key.
+
+    ``action`` performs the ledger write and returns (transaction,
+    response context). The context must be JSON serialisable because it is
+    what replays are rendered from. Returns the context to render, which
+    is the stored one if a concurrent request with the same key won, and
+    raises KeyReused if that request asked for something else.
+    """
+    key = get_key(request)
+    if key is None:
+        with transaction.atomic():
+            return action()[1]
+    endpoint, request_hash = fingerprint(request)
+    try:
+        with transaction.atomic():
+            trans, response = action()
+            IdempotencyKey.objects.create(
+                user=request.user,
+                key=key,
+                endpoint=endpoint,
+                request_hash=request_hash,
+                transaction=trans,
+                response=response,
+            )
+    except IntegrityError:
+        record = IdempotencyKey.objects.filter(user=request.user, key=key).only(
+            'response', 'endpoint', 'request_hash'
+        ).first()
+        if record is None:
+            raise
+        _check(record, request)
+        return record.response
+    return response
+
+
+def purge(max_keys=None, now=None):
+    """Delete expired keys, then the oldest ones beyond ``max_keys``"""
+    now = now or timezone.now()
+    max_keys = settings.IDEMPOTENCY['MAX_KEYS'] if max_keys is None else max_keys
+    cutoff = now - timedelta(hours=settings.IDEMPOTENCY['TTL_HOURS'])
+    expired = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()[0]
+    # created_at of the newest key past the cap, found by walking the index
+    boundary = IdempotencyKey.objects.order_by('-created_at').values_list('created_at', flat=True)[max_keys:max_keys + 1]
+    trimmed = 0
+    if boundary:
+        trimmed = IdempotencyKey.objects.filter(created_at__lte=boundary[0]).delete()[0]
+    return expired, trimmed
@@ -0,0 +1,133 @@
+"""Transaction ids.
+
+Transaction ids used to be the first 12 characters of a random UUID: 44
+random bits, so every insert landed on a random page of the unique index,
+and two ids collide with even odds after about 5 million transactions.
+Ids now come from the generator named in TRANSACTION_IDS['GENERATOR'].
+
+TimeOrderedIdGenerator, the default, makes 16-character ids in Crockford's
+base32 from a 48-bit millisecond timestamp, a 16-bit node and a 16-bit
+sequence. Ids sort in the order they were made, so new rows go to the
+right-hand edge of the unique index, where its pages are already cached.
+Two processes only make the same id if they share a node, so each process
+draws a random node when it starts (again after a fork).
+TRANSACTION_IDS['OPTIONS']['node'] fixes it instead, for deployments that
+give every process its own number.
+
+A random node is shared with another process about once in 65536 process
+pairs, so inserts go through ``save_with_new_ids``. If an id is already
+taken, it draws a new node and inserts again with fresh ids.
+
+Existing ids keep their old format; both fit Transaction.transaction_id.
+"""
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+LENGTH = 16
+NODE_BITS = 16
+SEQUENCE_BITS = 16
+ATTEMPTS = 3
+
+
+def _encode(value):
+    chars = []
+    for _ in range(LENGTH):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+class TimeOrderedIdGenerator:
+    """Sortable ids of timestamp, node and sequence; safe to call from any thread"""
+
+    def __init__(self, node=None):
+        if node is not None and not 0 <= int(node) < 1 << NODE_BITS:
+            raise ImproperlyConfigured(f'Transaction id node must be between 0 and {(1 << NODE_BITS) - 1}')
+        self._fixed_node = None if node is None else int(node)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._last_ms = 0
+        self._sequence = 0
+
+    def __call__(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker must not share its parent's node
+                self._pid = os.getpid()
+                self.node = self._fixed_node if self._fixed_node is not None else random.SystemRandom().getrandbits(NODE_BITS)
+            now = time.time_ns() // 1_000_000
+            if now > self._last_ms:
+                self._last_ms, self._sequence = now, 0
+            else:
+                # Same millisecond, or the clock stepped back: keep counting from the last id
+                self._sequence += 1
+                if self._sequence >> SEQUENCE_BITS:
+                    self._last_ms, self._sequence = self._last_ms + 1, 0
+            value = (self._last_ms << NODE_BITS | self.node) << SEQUENCE_BITS | self._sequence
+        return _encode(value)
+
+    def reseed(self):
+        """Draw a new node for the next id, after one of ours turned out to be taken"""
+        if self._fixed_node is not None:
+            logger.warning('Transaction id node %s is used by another process', self._fixed_node)
+        with self._lock:
+            self._pid = None
+
+
+class RandomIdGenerator:
+    """The original format: the first 12 characters of a random UUID"""
+
+    def __call__(self):
+        return str(uuid.uuid4())[:12]
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def get_generator():
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                options = settings.TRANSACTION_IDS
+                _generator = import_string(options['GENERATOR'])(**options.get('OPTIONS', {}))
+    return _generator
+
+
+def new_id():
+    return get_generator()()
+
+
+def save_with_new_ids(objects, save):
+    """Give ``objects`` new transaction ids and call ``save()``, returning its result.
+
+    ``save`` runs in a savepoint. If it fails because one of the ids is
+    already in the table, the generator draws a new node and ``save`` is
+    retried with fresh ids; any other integrity error is raised.
+    """
+    model = type(objects[0])
+    for attempt in range(ATTEMPTS):
+        for obj in objects:
+            obj.transaction_id = new_id()
+        try:
+            with transaction.atomic():
+                return save()
+        except IntegrityError:
+            taken = model._default_manager.filter(transaction_id__in=[obj.transaction_id for obj in objects])
+            if attempt == ATTEMPTS - 1 or not taken.exists():
+                raise
+            reseed = getattr(get_generator(), 'reseed', None)
+            if reseed is not None:
+                reseed()
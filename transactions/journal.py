@@ -0,0 +1,132 @@
+"""Double-entry journal and balance checkpoints.
+
+The ledger writes two JournalEntry rows for every transaction it posts,
+in the same database transaction. The debited account gets an entry of
+minus the amount and the credited account gets plus the amount. A deposit
+or withdrawal has one side outside the bank, recorded with no account, so
+the entries of every transaction sum to zero. Entries are only ever
+inserted.
+
+An account's balance is its latest BalanceCheckpoint plus the entries
+written after it, and its balance at a past moment is the last checkpoint
+before that moment plus the entries between the two. ``manage.py
+checkpoint_balances`` checkpoints every account with new entries, so
+either query reads at most one period of one account's entries however
+long the history grows. Profile.balance stays the balance the ledger
+checks and updates; ``balance()`` derives the same number from the
+journal.
+
+Balances from before the journal started are opening checkpoints with
+entry_id 0, and balances earlier than those are not known. A profile
+created with a balance, rather than funded through the ledger, needs an
+opening checkpoint of its own.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+from .models import BalanceCheckpoint, JournalEntry
+
+CENT = Decimal('0.01')
+CHUNK_SIZE = 50000
+# Entries written in the last moments may still be inside an uncommitted transaction
+CHECKPOINT_LAG = timedelta(minutes=1)
+
+
+def record(trans, debit_id=None, credit_id=None):
+    """Journal a newly written transaction; call inside the transaction that created it"""
+    JournalEntry.objects.bulk_create([
+        JournalEntry(transaction=trans, account_id=debit_id, amount=-trans.amount, created_at=trans.completed_at),
+        JournalEntry(transaction=trans, account_id=credit_id, amount=trans.amount, created_at=trans.completed_at),
+    ])
+
+
+def record_many(transactions):
+    """Journal a batch of transfers from their sender to their receiver"""
+    JournalEntry.objects.bulk_create([
+        entry
+        for trans in transactions
+        for entry in (
+            JournalEntry(transaction=trans, account_id=trans.sender_id, amount=-trans.amount, created_at=trans.completed_at),
+            JournalEntry(transaction=trans, account_id=trans.receiver_id, amount=trans.amount, created_at=trans.completed_at),
+        )
+    ], batch_size=CHUNK_SIZE)
+
+
+def _sum(entries):
+    total = entries.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+    # SQLite sums decimal columns as floats; the error is far below a cent
+    return total.quantize(CENT)
+
+
+def balance(account_id, at=None):
+    """The balance of ``account_id`` now, or just after ``at``; None if that is before its opening"""
+    checkpoints = BalanceCheckpoint.objects.filter(account_id=account_id)
+    entries = JournalEntry.objects.filter(account_id=account_id)
+    if at is None:
+        checkpoint = checkpoints.order_by('-entry_id').first()
+    else:
+        checkpoint = checkpoints.filter(as_of__lte=at).order_by('-as_of', '-entry_id').first()
+        if checkpoint is None and checkpoints.filter(entry_id=0).exists():
+            return None
+        entries = entries.filter(created_at__lte=at)
+    if checkpoint is None:
+        return _sum(entries)
+    # The lower time bound keeps a past balance to the entries of one period
+    if at is not None:
+        entries = entries.filter(created_at__gte=checkpoint.as_of)
+    return checkpoint.balance + _sum(entries.filter(pk__gt=checkpoint.entry_id))
+
+
+def checkpoint(account_id, upto):
+    """Checkpoint ``account_id`` at its last entry up to id ``upto``; returns the checkpoint or None.
+
+    Call inside a transaction holding the account's lock, so no entry up
+    to ``upto`` can still be uncommitted.
+    """
+    previous = BalanceCheckpoint.objects.filter(account_id=account_id).order_by('-entry_id').first()
+    entries = JournalEntry.objects.filter(account_id=account_id, pk__lte=upto)
+    if previous is not None:
+        entries = entries.filter(pk__gt=previous.entry_id)
+    last = entries.order_by('-pk').values_list('pk', 'created_at').first()
+    if last is None:
+        return None
+    return BalanceCheckpoint.objects.create(
+        account_id=account_id,
+        entry_id=last[0],
+        balance=(previous.balance if previous is not None else Decimal('0.00')) + _sum(entries),
+        as_of=last[1],
+    )
+
+
+def checkpoint_accounts(cutoff=None, chunk_size=CHUNK_SIZE):
+    """Checkpoint every account with entries since the last run, up to ``cutoff``.
+
+    Reads the entries written since the newest checkpoint in id chunks, so
+    a run costs the new entries, not the whole journal. An account active
+    in several chunks gets a checkpoint in each. Returns the number of
+    checkpoints written.
+    """
+    # Imported here: the ledger imports this module
+    from .ledger import _lock_accounts
+
+    cutoff = cutoff or timezone.now() - CHECKPOINT_LAG
+    start = BalanceCheckpoint.objects.aggregate(last=Max('entry_id'))['last'] or 0
+    upto = JournalEntry.objects.filter(pk__gt=start, created_at__lt=cutoff).aggregate(last=Max('pk'))['last']
+    if upto is None:
+        return 0
+    written = 0
+    for low in range(start, upto, chunk_size):
+        high = min(low + chunk_size, upto)
+        account_ids = sorted(
+            JournalEntry.objects.filter(pk__gt=low, pk__lte=high, account__isnull=False)
+            .order_by().values_list('account_id', flat=True).distinct()
+        )
+        # Each chunk is checkpointed only up to its own last id, so the newest
+        # checkpoint marks where a run that stopped part-way has to resume
+        with transaction.atomic():
+            _lock_accounts(account_ids)
+            for account_id in account_ids:
+                written += checkpoint(account_id, high) is not None
+    return written
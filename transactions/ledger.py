@@ -0,0 +1,192 @@
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from accounts.models import Profile
+from accounts.utils import invalidate_monthly_stats
+from accounts import fraud, live, velocity
+from .models import Transaction
+from . import ids, journal, rollups
+
+CENT = Decimal('0.01')
+
+
+class LedgerError(Exception):
+    """Raised when a ledger write cannot be applied"""
+
+
+class InsufficientBalance(LedgerError):
+    """Raised when the debited account cannot cover the amount"""
+
+
+def to_amount(value):
+    """Normalize a user supplied amount to a positive 2dp Decimal"""
+    try:
+        amount = Decimal(str(value)).quantize(CENT)
+    except (InvalidOperation, TypeError, ValueError):
+        raise LedgerError('Invalid amount')
+    if not amount.is_finite():
+        # NaN cannot be compared with 0, and infinity is not an amount
+        raise LedgerError('Invalid amount')
+    if amount <= 0:
+        raise LedgerError('Amount must be greater than 0')
+    return amount
+
+
+def _lock_accounts(user_ids):
+    """Lock the profile rows of every party in ascending user id order.
+
+    A fixed lock order means two opposite transfers between the same pair
+    of users can never deadlock. SQLite has no row locks (the write lock is
+    taken by the first UPDATE), so the extra SELECT is skipped there.
+    """
+    if not connection.features.has_select_for_update:
+        return
+    ids = sorted(set(user_ids))
+    list(Profile.objects.select_for_update().filter(user_id__in=ids).order_by('user_id').values_list('id', flat=True))
+
+
+def _debit(user_id, amount):
+    # The balance check and the write are a single statement, so two
+    # concurrent debits can never both pass a stale Python-side check.
+    updated = Profile.objects.filter(user_id=user_id, balance__gte=amount).update(balance=F('balance') - amount)
+    if not updated:
+        raise InsufficientBalance('Insufficient balance')
+
+
+def _credit(user_id, amount):
+    updated = Profile.objects.filter(user_id=user_id).update(balance=F('balance') + amount)
+    if not updated:
+        raise LedgerError('Account not found')
+
+
+def _credit_many(amounts):
+    """Credit several users with one UPDATE per chunk; ``amounts`` maps user id to amount"""
+    # Plain SQL: building the equivalent Case(When(...)) for a thousand users
+    # costs more Python time than the statement itself
+    table = connection.ops.quote_name(Profile._meta.db_table)
+    # Each user takes three query parameters (WHEN, THEN and the IN list)
+    chunk_size = max(1, (connection.features.max_query_params or 3000) // 3)
+    items = list(amounts.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            cursor.execute(
+                f'UPDATE {table} SET balance = balance + CASE user_id '
+                + ' '.join(['WHEN %s THEN %s'] * len(chunk))
+                + ' END WHERE user_id IN (' + ', '.join(['%s'] * len(chunk)) + ')',
+                [value for item in chunk for value in item] + [user_id for user_id, _ in chunk],
+            )
+            if cursor.rowcount != len(chunk):
+                raise LedgerError('Account not found')
+
+
+def _post(amount, debit=None, credit=None, **fields):
+    amount = to_amount(amount)
+    with transaction.atomic():
+        _lock_accounts([user.pk for user in (debit, credit) if user is not None])
+        if debit is not None:
+            _debit(debit.pk, amount)
+        if credit is not None:
+            _credit(credit.pk, amount)
+        trans = Transaction.objects.create(
+            amount=amount,
+            status='completed',
+            completed_at=timezone.now(),
+            **fields
+        )
+        rollups.record(trans)
+        journal.record(trans, debit.pk if debit is not None else None, credit.pk if credit is not None else None)
+        transaction.on_commit(lambda: _after_commit(trans, debit is not None))
+    return trans
+
+
+def _after_commit(trans, is_debit):
+    invalidate_monthly_stats(trans.sender_id, trans.receiver_id)
+    live.publish({trans.sender_id, trans.receiver_id}, {'type': 'balance'})
+    if is_debit:
+        velocity.record_transfer(trans.sender_id, trans.receiver_id, trans.amount)
+        fraud.record_amount(trans.sender_id, trans.amount)
+
+
+def transfer_many(sender, credits, transaction_type='send'):
+    """Pay many receivers from one sender in a single database transaction.
+
+    ``credits`` is a list of (receiver id, amount, description). The sender
+    is debited once for the total and every receiver is credited by one
+    UPDATE, so a batch costs a handful of statements whatever its size.
+    Either the whole batch is applied or none of it. Returns the created
+    transactions in the order of ``credits``.
+    """
+    credits = [(receiver_id, to_amount(amount), description) for receiver_id, amount, description in credits]
+    if not credits:
+        return []
+    totals = defaultdict(Decimal)
+    for receiver_id, amount, _ in credits:
+        totals[receiver_id] += amount
+    with transaction.atomic():
+        _lock_accounts([sender.pk, *totals])
+        _debit(sender.pk, sum(totals.values()))
+        _credit_many(totals)
+        now = timezone.now()
+        transactions = [
+            Transaction(
+                sender=sender,
+                receiver_id=receiver_id,
+                transaction_type=transaction_type,
+                amount=amount,
+                description=description,
+                status='completed',
+                completed_at=now,
+            )
+            for receiver_id, amount, description in credits
+        ]
+        ids.save_with_new_ids(transactions, lambda: Transaction.objects.bulk_create(transactions))
+        rollups.record_many(transactions)
+        journal.record_many(transactions)
+        transaction.on_commit(lambda: _after_commit_many(sender.pk, transactions))
+        live.balance_changed([sender.pk, *totals])
+    return transactions
+
+
+def _after_commit_many(sender_id, transactions):
+    invalidate_monthly_stats(sender_id, *{trans.receiver_id for trans in transactions})
+    for trans in transactions:
+        velocity.record_transfer(sender_id, trans.receiver_id, trans.amount)
+    fraud.record_amounts(sender_id, [trans.amount for trans in transactions])
+
+
+def transfer(sender, receiver, amount, transaction_type='send', description=''):
+    """Move money between two users and record the transaction"""
+    return _post(
+        amount,
+        debit=sender,
+        credit=receiver,
+        sender=sender,
+        receiver=receiver,
+        transaction_type=transaction_type,
+        description=description,
+    )
+
+
+def withdraw(user, amount, transaction_type='bill_payment', description=''):
+    """Debit a user for an external payment such as a bill"""
+    return _post(
+        amount,
+        debit=user,
+        sender=user,
+        transaction_type=transaction_type,
+        description=description,
+    )
+
+
+def deposit(user, amount, description='Account top-up'):
+    """Credit a user's account from an external source"""
+    return _post(
+        amount,
+        credit=user,
+        sender=user,
+        transaction_type='deposit',
+        description=description,
+    )
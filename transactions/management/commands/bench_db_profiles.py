@@ -0,0 +1,196 @@
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from accounts.models import Profile, User
+from transactions import ledger
+from transactions.views import history_page
+
+BENCH_PREFIX = 'bench_db_'
+PHONE_BASE = 9500000000
+RESULT_MARKER = 'PROFILE_RESULT '
+
+# Environment for each profile, read by bankapp/settings.py through decouple
+PROFILES = {
+    # What Django does out of the box: rollback journal, every commit synced,
+    # deferred transactions and the 5 second default timeout
+    'sqlite-stock': {
+        'DB_ENGINE': 'sqlite',
+        'SQLITE_JOURNAL_MODE': 'DELETE',
+        'SQLITE_SYNCHRONOUS': 'FULL',
+        'SQLITE_TRANSACTION_MODE': '',
+        'SQLITE_MMAP_SIZE': '0',
+        'SQLITE_BUSY_TIMEOUT': '5',
+    },
+    # The defaults in settings.py
+    'sqlite-wal': {
+        'DB_ENGINE': 'sqlite',
+    },
+    'postgresql': {
+        'DB_ENGINE': 'postgresql',
+    },
+}
+
+
+class Command(BaseCommand):
+    help = 'Run the same concurrent transfer workload against each database profile and compare them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default='sqlite-stock,sqlite-wal',
+                            help=f"Comma-separated, from: {', '.join(PROFILES)}")
+        parser.add_argument('--writers', type=int, default=8, help='Threads sending transfers')
+        parser.add_argument('--readers', type=int, default=4, help='Threads reading transaction history')
+        parser.add_argument('--seconds', type=float, default=10.0, help='Duration per profile')
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--worker', help=f'Run one profile in this process and print its result ({RESULT_MARKER.strip()})')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            result = self._run_workload(options)
+            self.stdout.write(RESULT_MARKER + json.dumps(result))
+            return
+
+        names = [name.strip() for name in options['profiles'].split(',') if name.strip()]
+        unknown = set(names) - set(PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown profiles: {', '.join(sorted(unknown))}")
+        self.stdout.write(
+            f"{options['writers']} writer and {options['readers']} reader threads, {options['seconds']:g}s per profile"
+        )
+        self.stdout.write(
+            f"{'profile':14} {'transfers/s':>11} {'p50 ms':>8} {'p99 ms':>8} {'reads/s':>8} {'locked':>7} {'errors':>7}"
+        )
+        failed = []
+        for name in names:
+            result = self._run_profile(name, options)
+            if result is None:
+                failed.append(name)
+                continue
+            self.stdout.write(
+                f"{name:14} {result['transfers'] / result['elapsed']:>11.1f} {result['p50']:>8.1f} "
+                f"{result['p99']:>8.1f} {result['reads'] / result['elapsed']:>8.1f} {result['locked']:>7} {result['errors']:>7}"
+            )
+            if not result['conserved']:
+                failed.append(name)
+                self.stderr.write(f'{name}: money was not conserved')
+        if failed:
+            raise CommandError(f"Failed profiles: {', '.join(failed)}")
+
+    def _run_profile(self, name, options):
+        """Run the workload in a fresh process, since settings are read once at startup"""
+        with tempfile.TemporaryDirectory() as scratch:
+            env = {**os.environ, **PROFILES[name], 'DEBUG': 'False', 'DJANGO_SETTINGS_MODULE': 'bankapp.settings'}
+            # SQLite profiles get a throwaway database; PostgreSQL uses DB_NAME,
+            # which should point at a scratch database
+            env['SQLITE_PATH'] = os.path.join(scratch, 'bench.sqlite3')
+            command = [
+                sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'bench_db_profiles', '--worker', name,
+                '--writers', str(options['writers']), '--readers', str(options['readers']),
+                '--seconds', str(options['seconds']), '--users', str(options['users']),
+            ]
+            process = subprocess.run(command, env=env, capture_output=True, text=True)
+        for line in process.stdout.splitlines():
+            if line.startswith(RESULT_MARKER):
+                return json.loads(line[len(RESULT_MARKER):])
+        error = (process.stderr.strip().splitlines() or ['no output'])[-1]
+        self.stderr.write(f'{name}: {error}')
+        return None
+
+    def _run_workload(self, options):
+        call_command('migrate', verbosity=0)
+        users = self._populate(options['users'])
+        expected_total = Profile.objects.filter(user__in=users).aggregate(total=Sum('balance'))['total']
+        deadline = time.perf_counter() + options['seconds']
+        stats = {'transfers': 0, 'reads': 0, 'locked': 0, 'errors': 0}
+        timings = []
+        lock = threading.Lock()
+
+        def writer(seed):
+            rng = random.Random(seed)
+            local = {'transfers': 0, 'locked': 0, 'errors': 0}
+            local_timings = []
+            try:
+                while time.perf_counter() < deadline:
+                    sender, receiver = rng.sample(users, 2)
+                    started = time.perf_counter()
+                    try:
+                        ledger.transfer(sender, receiver, Decimal(rng.randint(1, 5000)) / 100, 'send', 'benchmark')
+                        local['transfers'] += 1
+                        local_timings.append((time.perf_counter() - started) * 1000)
+                    except OperationalError as e:
+                        local['locked' if 'locked' in str(e) else 'errors'] += 1
+                    except ledger.LedgerError:
+                        local['errors'] += 1
+            finally:
+                connection.close()
+                with lock:
+                    for key, value in local.items():
+                        stats[key] += value
+                    timings.extend(local_timings)
+
+        def reader(seed):
+            rng = random.Random(seed)
+            reads = 0
+            try:
+                while time.perf_counter() < deadline:
+                    history_page(rng.choice(users))
+                    reads += 1
+            finally:
+                connection.close()
+                with lock:
+                    stats['reads'] += reads
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(options['writers'])]
+        threads += [threading.Thread(target=reader, args=(-i,)) for i in range(1, options['readers'] + 1)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        actual_total = Profile.objects.filter(user__in=users).aggregate(total=Sum('balance'))['total']
+        timings.sort()
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        return {
+            **stats,
+            'elapsed': elapsed,
+            'p50': statistics.median(timings) if timings else 0.0,
+            'p99': timings[int(len(timings) * 0.99)] if timings else 0.0,
+            'conserved': actual_total == expected_total,
+        }
+
+    def _populate(self, count):
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        password = make_password(None)
+        users = User.objects.bulk_create([
+            User(username=f'{BENCH_PREFIX}{i}', phone_number=f'0{PHONE_BASE + i}', password=password)
+            for i in range(count)
+        ])
+        Profile.objects.bulk_create([
+            Profile(
+                user=user,
+                full_name=user.username,
+                cnic=f'95555-{i:07d}-5',
+                date_of_birth=date(1990, 1, 1),
+                address='Benchmark',
+                account_number=f'CE{PHONE_BASE + i}',
+                # Large enough that no transfer fails for lack of funds
+                balance=Decimal('1000000.00'),
+            )
+            for i, user in enumerate(users)
+        ])
+        return users
@@ -0,0 +1,95 @@
+import io
+import random
+import time
+from collections import Counter
+from datetime import date
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+from accounts.models import User, Profile, Notification
+from transactions import disbursement
+from transactions.ledger import CENT
+from transactions.models import Transaction
+
+BENCH_PREFIX = 'bench_pay_'
+PHONE_BASE = 3800000000
+CNIC_BASE = 9800000000000
+
+
+class Command(BaseCommand):
+    help = 'Time a bulk disbursement of synthetic payouts and check money is conserved'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payouts', type=int, default=100000)
+        parser.add_argument('--receivers', type=int, default=10000)
+        parser.add_argument('--batch-size', type=int, default=disbursement.BATCH_SIZE)
+        parser.add_argument('--wal', action='store_true', help='Switch the SQLite database to WAL mode first')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users afterwards')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                if options['wal']:
+                    cursor.execute('PRAGMA journal_mode=WAL')
+                cursor.execute('PRAGMA journal_mode')
+                self.stdout.write(f'SQLite journal mode: {cursor.fetchone()[0]}')
+
+        sender, receivers = self._populate(options['receivers'], options['payouts'])
+        rng = random.Random(1)
+        payouts = io.StringIO()
+        payouts.write('phone,amount,description\n')
+        for i in range(options['payouts']):
+            payouts.write(f'0{PHONE_BASE + rng.randrange(len(receivers))},{rng.randint(100, 50000) / 100},Salary {i}\n')
+        payouts.seek(0)
+        before = self._total(sender)
+
+        started = time.perf_counter()
+        counts = Counter(
+            result['status']
+            for result in disbursement.disburse(
+                sender, disbursement.read_payouts(payouts), batch_size=options['batch_size']
+            )
+        )
+        elapsed = time.perf_counter() - started
+
+        after = self._total(sender)
+        self.stdout.write(f"Paid {counts['paid']}, failed {counts['failed']}")
+        self.stdout.write(f'Elapsed: {elapsed:.1f}s ({counts["paid"] / elapsed:.0f} payouts/second)')
+        self.stdout.write(f'Total before/after: {before} / {after}')
+
+        if not options['keep']:
+            Notification.objects.filter(user__username__startswith=BENCH_PREFIX).delete()
+            Transaction.objects.filter(sender=sender).delete()
+            User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+        if before != after or counts['failed']:
+            raise CommandError('Disbursement lost money or rejected payouts')
+        self.stdout.write(self.style.SUCCESS('Money conserved'))
+
+    def _total(self, sender):
+        users = User.objects.filter(username__startswith=BENCH_PREFIX)
+        # SQLite sums decimals as floats
+        return Profile.objects.filter(user__in=users).aggregate(total=Sum('balance'))['total'].quantize(CENT)
+
+    def _populate(self, count, payouts):
+        Transaction.objects.filter(sender__username__startswith=BENCH_PREFIX).delete()
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        users = User.objects.bulk_create([
+            User(username=f'{BENCH_PREFIX}{i}', phone_number=f'0{PHONE_BASE + i}')
+            for i in range(count + 1)
+        ])
+        Profile.objects.bulk_create([
+            Profile(
+                user=user,
+                full_name=user.username,
+                cnic=f'{str(CNIC_BASE + i)[:5]}-{str(CNIC_BASE + i)[5:12]}-{str(CNIC_BASE + i)[12:]}',
+                date_of_birth=date(1990, 1, 1),
+                address='Benchmark',
+                account_number=f'CE{8000000000 + i}',
+                # The last user pays everyone and can cover every payout
+                balance=Decimal(payouts * 500) if i == count else Decimal('0.00'),
+            )
+            for i, user in enumerate(users)
+        ], batch_size=1000)
+        return users[-1], users[:-1]
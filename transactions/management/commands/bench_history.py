@@ -0,0 +1,103 @@
+import statistics
+import time
+import tracemalloc
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from accounts.models import User
+from django.db.models import Q
+from transactions.models import Transaction
+from transactions.pagination import encode_cursor
+from transactions.views import history_page
+
+BENCH_PREFIX = 'bench_hist_'
+
+
+class Command(BaseCommand):
+    help = 'Measure transaction history page latency and memory at increasing depth'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users afterwards')
+
+    def handle(self, *args, **options):
+        total = options['transactions']
+        user, other = self._populate(total)
+        queryset = Transaction.objects.filter(Q(sender=user) | Q(receiver=user))
+
+        self.stdout.write(f'{total} transactions for {user.username}')
+        self.stdout.write(f"{'depth':>10} {'median ms':>10} {'p99 ms':>10} {'peak KiB':>10}")
+        for depth in sorted({0, total // 10, total // 2, max(total - 50, 0)}):
+            cursor = None
+            if depth:
+                anchor = queryset.order_by('-created_at', '-pk')[depth - 1]
+                cursor = encode_cursor(anchor)
+            timings, peak = self._measure(lambda: history_page(user, cursor), options['repeat'])
+            self._report(depth, timings, peak)
+
+        # The previous implementation, for comparison
+        def merge_in_python():
+            rows = list(user.sent_transactions.all()) + list(user.received_transactions.all())
+            rows.sort(key=lambda x: x.created_at, reverse=True)
+            return rows
+        timings, peak = self._measure(merge_in_python, 1)
+        self.stdout.write(f'Python-side merge of all rows: {timings[0]:.1f} ms, peak {peak / 1024:.0f} KiB')
+
+        if not options['keep']:
+            Transaction.objects.filter(sender__in=[user, other]).delete()
+            User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+    def _measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        # Tracing slows everything down, so memory is measured in a separate run
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return timings, peak
+
+    def _report(self, depth, timings, peak):
+        timings = sorted(timings)
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        self.stdout.write(f'{depth:>10} {statistics.median(timings):>10.2f} {p99:>10.2f} {peak / 1024:>10.0f}')
+
+    def _populate(self, total):
+        Transaction.objects.filter(sender__username__startswith=BENCH_PREFIX).delete()
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        user = User.objects.create(username=f'{BENCH_PREFIX}user', phone_number='09800000001')
+        other = User.objects.create(username=f'{BENCH_PREFIX}other', phone_number='09800000002')
+
+        start = timezone.now() - timedelta(minutes=total)
+        batch = []
+        for i in range(total):
+            sender, receiver = (user, other) if i % 2 else (other, user)
+            batch.append(Transaction(
+                transaction_id=uuid.uuid4().hex[:12],
+                sender=sender,
+                receiver=receiver,
+                transaction_type='send',
+                amount=Decimal('10.00'),
+                description='benchmark',
+                status='completed',
+            ))
+            if len(batch) == 5000:
+                self._flush(batch, start, i)
+                batch = []
+        if batch:
+            self._flush(batch, start, total)
+        return user, other
+
+    def _flush(self, batch, start, last_index):
+        created = Transaction.objects.bulk_create(batch)
+        # auto_now_add stamps every row with "now"; spread them out like real history
+        first_index = last_index - len(created) + 1
+        for offset, trans in enumerate(created):
+            trans.created_at = start + timedelta(minutes=first_index + offset)
+        Transaction.objects.bulk_update(created, ['created_at'])
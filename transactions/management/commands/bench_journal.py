@@ -0,0 +1,151 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from accounts.models import Profile, User
+from transactions import journal
+from transactions.models import BalanceCheckpoint, JournalEntry, Transaction
+
+BENCH_PREFIX = 'bench_journal_'
+PHONE_BASE = 9600000000
+INSERT_BATCH = 10000
+
+
+def _ms(started):
+    return (time.perf_counter() - started) * 1000
+
+
+def _percentiles(timings):
+    timings = sorted(timings)
+    return statistics.median(timings), timings[int(len(timings) * 0.99)]
+
+
+class Command(BaseCommand):
+    help = 'Grow the journal step by step and time balance-at-date queries at each size (use a scratch database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100000,1000000,10000000',
+                            help='Comma-separated journal sizes to measure at, in entries')
+        parser.add_argument('--accounts', type=int, default=1000)
+        parser.add_argument('--checkpoint-every', type=int, default=1000,
+                            help='Entries per account between checkpoint runs')
+        parser.add_argument('--queries', type=int, default=500, help='Queries per measurement')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark accounts and entries afterwards')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        users, anchor = self._populate(options['accounts'])
+        account_ids = [user.pk for user in users]
+        # Each account gets one entry per second, ending before now, so every entry is old enough to checkpoint
+        self.origin = timezone.now() - timedelta(seconds=sizes[-1] // len(account_ids) + 60)
+        self.rng = random.Random(0)
+        self.amounts = [
+            connection.ops.adapt_decimalfield_value(Decimal(self.rng.randint(-50000, 50000)) / 100, 18, 2)
+            for _ in range(10000)
+        ]
+        round_size = options['checkpoint_every'] * len(account_ids)
+        self.stdout.write(
+            f"{len(account_ids)} accounts, a checkpoint run every {options['checkpoint_every']} entries per account, "
+            f"{options['queries']} queries per step"
+        )
+        self.stdout.write(
+            f"{'entries':>11} {'inserts/s':>10} {'at p50 ms':>10} {'at p99 ms':>10} {'now p50 ms':>11} "
+            f"{'full scan p50 ms':>17} {'checkpoints':>12}"
+        )
+        written = 0
+        try:
+            for size in sizes:
+                started = time.perf_counter()
+                inserted = 0
+                while written < size:
+                    count = min(size, (written // round_size + 1) * round_size) - written
+                    self._insert(anchor, account_ids, written, count)
+                    written += count
+                    inserted += count
+                    if written % round_size == 0:
+                        journal.checkpoint_accounts(timezone.now(), chunk_size=round_size)
+                rate = inserted / (time.perf_counter() - started)
+                self._measure(size, rate, account_ids, options['queries'])
+        finally:
+            if not options['keep']:
+                JournalEntry.objects.filter(account_id__in=account_ids).delete()
+                JournalEntry.objects.filter(transaction=anchor).delete()
+                User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+    def _insert(self, anchor, account_ids, start, count):
+        """Append ``count`` entries; entry n goes to account n mod accounts, one second after its previous one"""
+        table = connection.ops.quote_name(JournalEntry._meta.db_table)
+        sql = f'INSERT INTO {table} (transaction_id, account_id, amount, created_at) VALUES (%s, %s, %s, %s)'
+        accounts = len(account_ids)
+        for low in range(start, start + count, INSERT_BATCH):
+            high = min(low + INSERT_BATCH, start + count)
+            seconds = {
+                second: connection.ops.adapt_datetimefield_value(self.origin + timedelta(seconds=second))
+                for second in range(low // accounts, (high - 1) // accounts + 1)
+            }
+            rows = [
+                (anchor.pk, account_ids[n % accounts], self.rng.choice(self.amounts), seconds[n // accounts])
+                for n in range(low, high)
+            ]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+
+    def _measure(self, size, rate, account_ids, queries):
+        samples = [
+            (self.rng.choice(account_ids), self.origin + timedelta(seconds=self.rng.uniform(0, size / len(account_ids))))
+            for _ in range(queries)
+        ]
+        at_timings, now_timings, scan_timings = [], [], []
+        for account_id, at in samples:
+            started = time.perf_counter()
+            derived = journal.balance(account_id, at)
+            at_timings.append(_ms(started))
+
+            started = time.perf_counter()
+            journal.balance(account_id)
+            now_timings.append(_ms(started))
+
+            # The same answer without checkpoints: every entry of the account up to ``at``
+            started = time.perf_counter()
+            scanned = (JournalEntry.objects.filter(account_id=account_id, created_at__lte=at).aggregate(
+                total=Sum('amount')
+            )['total'] or Decimal('0.00')).quantize(journal.CENT)
+            scan_timings.append(_ms(started))
+            if derived != scanned:
+                raise CommandError(f'Account {account_id} at {at}: checkpointed {derived}, full scan {scanned}')
+
+        at_p50, at_p99 = _percentiles(at_timings)
+        checkpoints = BalanceCheckpoint.objects.filter(account_id__in=account_ids).count()
+        self.stdout.write(
+            f'{size:>11,} {rate:>10,.0f} {at_p50:>10.2f} {at_p99:>10.2f} {statistics.median(now_timings):>11.2f} '
+            f'{statistics.median(scan_timings):>17.2f} {checkpoints:>12,}'
+        )
+
+    def _populate(self, count):
+        JournalEntry.objects.filter(account__username__startswith=BENCH_PREFIX).delete()
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        password = make_password(None)
+        users = User.objects.bulk_create([
+            User(username=f'{BENCH_PREFIX}{i}', phone_number=f'0{PHONE_BASE + i}', password=password)
+            for i in range(count)
+        ], batch_size=5000)
+        Profile.objects.bulk_create([
+            Profile(
+                user=user,
+                full_name=user.username,
+                cnic=f'96666-{i:07d}-6',
+                date_of_birth=date(1990, 1, 1),
+                address='Benchmark',
+                account_number=f'CE{PHONE_BASE + i}',
+            )
+            for i, user in enumerate(users)
+        ], batch_size=5000)
+        # Every synthetic entry points at this one transaction; balance queries never read it
+        anchor = Transaction.objects.create(sender=users[0], transaction_type='deposit', amount=Decimal('0.01'))
+        return users, anchor
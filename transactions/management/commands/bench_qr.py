@@ -0,0 +1,67 @@
+import base64
+import io
+import json
+import shutil
+import tempfile
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+import qrcode
+from transactions import qr
+
+
+def legacy_generate(user_id, phone, amount):
+    """The previous per-request rendering, kept for comparison"""
+    qr_data = {'user_id': user_id, 'phone': phone, 'amount': amount}
+    code = qrcode.QRCode(version=1, box_size=10, border=5)
+    code.add_data(json.dumps(qr_data))
+    code.make(fit=True)
+    img = code.make_image(fill_color="black", back_color="white")
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+class Command(BaseCommand):
+    help = 'Measure QR generations per second for the old renderer and the cached one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=300)
+        parser.add_argument('--distinct', type=int, default=20,
+                            help='Distinct (user, amount) pairs in the repeated workload')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        amounts = [Decimal(i + 1) * 100 for i in range(options['distinct'])]
+        directory = tempfile.mkdtemp(prefix='bench_qr_')
+        try:
+            self._run('legacy png, every request', count,
+                      lambda i: legacy_generate(i, '03001234567', str(amounts[i % len(amounts)])))
+            qr._memory = qr.ImageCache(0)
+            with override_settings(QR_CACHE={'MEMORY_BYTES': 0, 'DIRECTORY': ''}):
+                for fmt in ('png', 'svg'):
+                    self._run(f'compact {fmt}, uncached', count, self._renderer(fmt, amounts, unique=True))
+            with override_settings(QR_CACHE={'MEMORY_BYTES': 0, 'DIRECTORY': directory}):
+                self._run('compact png, disk cache', count, self._renderer('png', amounts))
+                qr._memory = qr.ImageCache(16 * 1024 * 1024)
+                self._run('compact png, memory cache', count, self._renderer('png', amounts))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+            qr._memory = qr.ImageCache(settings.QR_CACHE['MEMORY_BYTES'])
+
+    def _renderer(self, fmt, amounts, unique=False):
+        def generate(i):
+            # The repeated workload cycles through len(amounts) distinct payloads
+            user_id = i if unique else i % len(amounts)
+            payload = qr.make_payload(user_id, amounts[i % len(amounts)])
+            return base64.b64encode(qr.render(payload, fmt)).decode()
+        return generate
+
+    def _run(self, name, count, func):
+        started = time.perf_counter()
+        for i in range(count):
+            func(i)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{name:28} {count / elapsed:>10.0f} generations/second')
@@ -0,0 +1,163 @@
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from accounts.models import Profile, User
+from transactions import reconcile
+from transactions.models import Transaction
+
+BENCH_PREFIX = 'bench_recon_'
+PHONE_BASE = 9700000000
+INSERT_BATCH = 10000
+
+
+def _memory_mb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _reset_peak_memory():
+    # Makes VmHWM start again from the current RSS
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+
+
+class Command(BaseCommand):
+    help = 'Reconcile a synthetic transaction log with planted drift, timing full and incremental runs (use a scratch database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=1000000)
+        parser.add_argument('--accounts', type=int, default=10000)
+        parser.add_argument('--drifted', type=int, default=25, help='Accounts given a wrong balance')
+        parser.add_argument('--incremental', type=int, default=100000, help='Transactions added before the incremental run')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark accounts and transactions afterwards')
+
+    def handle(self, *args, **options):
+        users = self._populate(options['accounts'])
+        account_ids = [user.pk for user in users]
+        self.rng = random.Random(0)
+        self.flows = {user_id: 0 for user_id in account_ids}
+        # Spread over the last day, so every row is older than the reconciliation lag
+        total = options['transactions'] + options['incremental']
+        self.origin = timezone.now() - timedelta(days=1)
+        self.step = timedelta(hours=23) / total
+        directory = tempfile.mkdtemp(prefix='reconcile-')
+        try:
+            started = time.perf_counter()
+            self._insert(account_ids, 0, options['transactions'])
+            self.stdout.write(
+                f"Wrote {options['transactions']:,} transactions over {len(account_ids):,} accounts "
+                f"in {time.perf_counter() - started:.0f}s"
+            )
+            planted = set(self.rng.sample(account_ids, options['drifted']))
+            self._set_balances(planted)
+
+            self._run('Full', False, directory, planted)
+
+            self._insert(account_ids, options['transactions'], options['incremental'])
+            self._set_balances(planted)
+            self._run('Incremental', True, directory, planted)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+            if not options['keep']:
+                self._cleanup(account_ids)
+
+    def _run(self, label, incremental, directory, planted):
+        _reset_peak_memory()
+        before = _memory_mb('VmRSS')
+        started = time.perf_counter()
+        result = reconcile.reconcile(incremental=incremental, directory=directory)
+        elapsed = time.perf_counter() - started
+        with open(result['path']) as handle:
+            # Accounts outside the benchmark may have drifted on their own
+            reported = {int(line.split(',', 1)[0]) for line in list(handle)[1:]} & set(self.flows)
+        self.stdout.write(
+            f"{label:11} run: {result['transactions']:>11,} transactions in {elapsed:6.1f}s "
+            f"({result['transactions'] / elapsed:,.0f}/s), peak memory +{_memory_mb('VmHWM') - before:.0f} MB, "
+            f"{len(reported)} drifted reported"
+        )
+        if reported != planted:
+            raise CommandError(
+                f'Reported {len(reported - planted)} accounts that were not planted, missed {len(planted - reported)}'
+            )
+
+    def _insert(self, account_ids, start, count):
+        table = connection.ops.quote_name(Transaction._meta.db_table)
+        sql = (
+            f'INSERT INTO {table} (transaction_id, sender_id, receiver_id, transaction_type, amount, description, '
+            f'status, created_at, completed_at) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)'
+        )
+        rng, flows = self.rng, self.flows
+        for low in range(start, start + count, INSERT_BATCH):
+            rows = []
+            for n in range(low, min(low + INSERT_BATCH, start + count)):
+                kind = rng.random()
+                sender, receiver = rng.sample(account_ids, 2)
+                cents = rng.randint(1, 500000)
+                # Most are transfers; some deposits and bill payments, and a few failed transfers that move nothing
+                if kind < 0.80:
+                    transaction_type, status = 'send', 'completed'
+                    flows[sender] -= cents
+                    flows[receiver] += cents
+                elif kind < 0.90:
+                    transaction_type, status, receiver = 'deposit', 'completed', None
+                    flows[sender] += cents
+                elif kind < 0.98:
+                    transaction_type, status, receiver = 'bill_payment', 'completed', None
+                    flows[sender] -= cents
+                else:
+                    transaction_type, status = 'send', 'failed'
+                at = connection.ops.adapt_datetimefield_value(self.origin + self.step * n)
+                rows.append((
+                    f'{BENCH_PREFIX}{n}', sender, receiver, transaction_type,
+                    connection.ops.adapt_decimalfield_value(Decimal(cents).scaleb(-2), 12, 2), '', status, at, at,
+                ))
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+
+    def _set_balances(self, planted):
+        profile_ids = dict(Profile.objects.filter(user_id__in=list(self.flows)).values_list('user_id', 'pk'))
+        profiles = [
+            Profile(pk=profile_ids[user_id], balance=Decimal(cents + (100 if user_id in planted else 0)).scaleb(-2))
+            for user_id, cents in self.flows.items()
+        ]
+        Profile.objects.bulk_update(profiles, ['balance'], batch_size=500)
+
+    def _cleanup(self, account_ids):
+        # In id chunks, so the cascade never loads the whole log at once
+        bench = Transaction.objects.filter(transaction_id__startswith=BENCH_PREFIX).order_by('pk')
+        while True:
+            ids = list(bench.values_list('pk', flat=True)[:INSERT_BATCH])
+            if not ids:
+                break
+            Transaction.objects.filter(pk__in=ids).delete()
+        User.objects.filter(pk__in=account_ids).delete()
+
+    def _populate(self, count):
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        password = make_password(None)
+        users = User.objects.bulk_create([
+            User(username=f'{BENCH_PREFIX}{i}', phone_number=f'0{PHONE_BASE + i}', password=password)
+            for i in range(count)
+        ], batch_size=5000)
+        Profile.objects.bulk_create([
+            Profile(
+                user=user,
+                full_name=user.username,
+                cnic=f'97777-{i:07d}-7',
+                date_of_birth=date(1990, 1, 1),
+                address='Benchmark',
+                account_number=f'CE{PHONE_BASE + i}',
+            )
+            for i, user in enumerate(users)
+        ], batch_size=5000)
+        return users
@@ -0,0 +1,86 @@
+import random
+import statistics
+import time
+from django.apps.registry import Apps
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+from transactions import ids
+
+INSERT_BATCH = 10000
+GENERATORS = {
+    'random': ids.RandomIdGenerator,
+    'time-ordered': ids.TimeOrderedIdGenerator,
+}
+
+
+def _table(label):
+    """A throwaway table shaped like the transaction id column: an integer key and a unique string"""
+    class Meta:
+        apps = Apps()
+        app_label = 'transactions'
+        db_table = f"bench_ids_{label.replace('-', '_')}"
+
+    return type(f"BenchIds{label.title().replace('-', '')}", (models.Model,), {
+        '__module__': __name__,
+        'Meta': Meta,
+        'id': models.BigAutoField(primary_key=True),
+        'transaction_id': models.CharField(max_length=50, unique=True),
+    })
+
+
+class Command(BaseCommand):
+    help = 'Insert random and time-ordered transaction ids into a unique index, timing each window (use a scratch database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000000)
+        parser.add_argument('--window', type=int, default=1000000, help='Rows per reported throughput window')
+        parser.add_argument('--lookups', type=int, default=2000, help='Lookups by id timed after the inserts')
+        parser.add_argument('--generators', default=','.join(GENERATORS))
+
+    def handle(self, *args, **options):
+        for label in options['generators'].split(','):
+            model = _table(label)
+            with connection.schema_editor() as editor:
+                editor.create_model(model)
+            try:
+                self._run(label, model, GENERATORS[label](), options)
+            finally:
+                with connection.schema_editor() as editor:
+                    editor.delete_model(model)
+
+    def _run(self, label, model, generator, options):
+        table = connection.ops.quote_name(model._meta.db_table)
+        # A clash with an earlier id is skipped and counted rather than aborting the run
+        sql = connection.ops.insert_statement(on_conflict=models.constants.OnConflict.IGNORE)
+        sql = f'{sql} {table} (transaction_id) VALUES (%s)'
+        if connection.vendor == 'postgresql':
+            sql += ' ON CONFLICT DO NOTHING'
+        self.stdout.write(f'{label}:')
+        rates, written = [], 0
+        total_started = started = time.perf_counter()
+        with connection.cursor() as cursor:
+            while written < options['rows']:
+                count = min(INSERT_BATCH, options['rows'] - written)
+                batch = [(generator(),) for _ in range(count)]
+                with transaction.atomic():
+                    cursor.executemany(sql, batch)
+                written += count
+                if written % options['window'] == 0 or written == options['rows']:
+                    rate = (written - options['window'] * len(rates)) / (time.perf_counter() - started)
+                    rates.append(rate)
+                    self.stdout.write(f'  {written:>12,} rows {rate:>10,.0f} inserts/s')
+                    started = time.perf_counter()
+        elapsed = time.perf_counter() - total_started
+
+        rowcount = model.objects.count()
+        samples = random.Random(0).sample(range(1, rowcount + 1), min(options['lookups'], rowcount))
+        wanted = dict(model.objects.filter(pk__in=samples).values_list('pk', 'transaction_id'))
+        timings = []
+        for transaction_id in wanted.values():
+            lookup_started = time.perf_counter()
+            model.objects.get(transaction_id=transaction_id)
+            timings.append((time.perf_counter() - lookup_started) * 1000)
+        self.stdout.write(
+            f'  {written:,} rows in {elapsed:.0f}s ({written / elapsed:,.0f}/s overall, last window {rates[-1]:,.0f}/s), '
+            f'{written - rowcount:,} collisions, lookup by id p50 {statistics.median(timings):.3f} ms'
+        )
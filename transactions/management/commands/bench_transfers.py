@@ -0,0 +1,97 @@
+import random
+import threading
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from accounts.models import User, Profile
+from transactions import ledger
+
+BENCH_PREFIX = 'bench_xfer_'
+
+
+class Command(BaseCommand):
+    help = 'Concurrent transfer stress test: reports transfers/second and checks money is conserved'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--transfers', type=int, default=2000, help='Transfers per worker')
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--balance', type=Decimal, default=Decimal('1000.00'))
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users afterwards')
+
+    def handle(self, *args, **options):
+        users = self._create_users(options['users'], options['balance'])
+        if len(users) < 2:
+            raise CommandError('Need at least two users')
+        expected_total = options['balance'] * len(users)
+
+        stats = {'ok': 0, 'insufficient': 0, 'busy': 0}
+        lock = threading.Lock()
+
+        def worker(seed):
+            rng = random.Random(seed)
+            local = {'ok': 0, 'insufficient': 0, 'busy': 0}
+            try:
+                for _ in range(options['transfers']):
+                    sender, receiver = rng.sample(users, 2)
+                    amount = Decimal(rng.randint(1, 20000)) / 100
+                    try:
+                        ledger.transfer(sender, receiver, amount, 'send', 'benchmark')
+                        local['ok'] += 1
+                    except ledger.InsufficientBalance:
+                        local['insufficient'] += 1
+                    except OperationalError:
+                        local['busy'] += 1
+            finally:
+                connection.close()
+                with lock:
+                    for key, value in local.items():
+                        stats[key] += value
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['workers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        profiles = Profile.objects.filter(user__in=users)
+        actual_total = profiles.aggregate(total=Sum('balance'))['total']
+        negative = profiles.filter(balance__lt=0).count()
+
+        self.stdout.write(f"Workers:            {options['workers']}")
+        self.stdout.write(f"Completed:          {stats['ok']}")
+        self.stdout.write(f"Insufficient funds: {stats['insufficient']}")
+        self.stdout.write(f"Database busy:      {stats['busy']}")
+        self.stdout.write(f"Elapsed:            {elapsed:.2f}s")
+        self.stdout.write(f"Transfers/second:   {stats['ok'] / elapsed:.1f}")
+        self.stdout.write(f"Total before/after: {expected_total} / {actual_total}")
+
+        if not options['keep']:
+            User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+        if actual_total != expected_total or negative:
+            raise CommandError(f'Money was not conserved ({negative} negative balances)')
+        self.stdout.write(self.style.SUCCESS('Money conserved'))
+
+    def _create_users(self, count, balance):
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        users = []
+        for i in range(count):
+            user = User.objects.create(
+                username=f'{BENCH_PREFIX}{i}',
+                phone_number=f'099{i:08d}',
+            )
+            Profile.objects.create(
+                user=user,
+                full_name=user.username,
+                cnic=f'99999-{i:07d}-9',
+                date_of_birth='1990-01-01',
+                address='Benchmark',
+                balance=balance,
+            )
+            users.append(user)
+        return users
@@ -0,0 +1,96 @@
+import threading
+import uuid
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from accounts.models import User, Profile
+from transactions.models import IdempotencyKey, Transaction
+
+BENCH_PREFIX = 'bench_idem_'
+PIN = '2468'
+
+
+class Command(BaseCommand):
+    help = 'Fire the same idempotency key at send_money from many threads and check it is applied once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--amount', type=Decimal, default=Decimal('10.00'))
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users afterwards')
+
+    def handle(self, *args, **options):
+        sender, receiver = self._create_users()
+        amount = options['amount']
+        failures = []
+
+        for round_number in range(options['rounds']):
+            key = uuid.uuid4().hex
+            barrier = threading.Barrier(options['threads'])
+            responses = []
+            lock = threading.Lock()
+
+            def submit():
+                client = Client()
+                client.force_login(sender)
+                barrier.wait()
+                try:
+                    response = client.post(
+                        '/transactions/send-money/',
+                        {'receiver_phone': receiver.phone_number, 'amount': str(amount), 'pin': PIN},
+                        HTTP_IDEMPOTENCY_KEY=key,
+                    )
+                    with lock:
+                        responses.append(response.content.decode())
+                finally:
+                    connection.close()
+
+            threads = [threading.Thread(target=submit) for _ in range(options['threads'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            applied = Transaction.objects.filter(sender=sender, idempotencykey__key=key).count()
+            record = IdempotencyKey.objects.filter(user=sender, key=key).first()
+            receipts = sum(record is not None and record.transaction.transaction_id in body for body in responses)
+            self.stdout.write(
+                f'round {round_number + 1}: {len(responses)} responses, {applied} transaction(s), '
+                f'{receipts} carried the original receipt'
+            )
+            if applied != 1 or receipts != len(responses):
+                failures.append(round_number + 1)
+
+        sender.profile.refresh_from_db()
+        expected = Decimal('1000.00') - amount * options['rounds']
+        total = Transaction.objects.filter(sender=sender).count()
+        self.stdout.write(f'Transactions: {total}, sender balance {sender.profile.balance} (expected {expected})')
+        if total != options['rounds'] or sender.profile.balance != expected:
+            failures.append('balance')
+
+        if not options['keep']:
+            Transaction.objects.filter(sender=sender).delete()
+            User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+        if failures:
+            raise CommandError(f'Duplicate submissions were not collapsed: {failures}')
+        self.stdout.write(self.style.SUCCESS('Every key was applied exactly once'))
+
+    def _create_users(self):
+        Transaction.objects.filter(sender__username__startswith=BENCH_PREFIX).delete()
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        users = []
+        for i in range(2):
+            user = User.objects.create(username=f'{BENCH_PREFIX}{i}', phone_number=f'0988{i:07d}')
+            Profile.objects.create(
+                user=user,
+                full_name=user.username,
+                cnic=f'98888-{i:07d}-8',
+                date_of_birth='1990-01-01',
+                address='Benchmark',
+                balance=Decimal('1000.00'),
+                pin=PIN,
+            )
+            users.append(user)
+        return users
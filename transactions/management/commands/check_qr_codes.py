@@ -0,0 +1,117 @@
+import threading
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from accounts.models import User, Profile
+from transactions import qr
+from transactions.models import QRCode, Transaction
+
+BENCH_PREFIX = 'bench_qr_'
+PIN = '1357'
+
+
+class Command(BaseCommand):
+    help = 'Pay one-time QR codes from many threads, check each is paid once, and time verification'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--scans', type=int, default=20000, help='Payloads verified for the timing')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users afterwards')
+
+    def handle(self, *args, **options):
+        payer, merchant = self._create_users()
+        amount = Decimal('10.00')
+        failures = []
+
+        for round_number in range(options['rounds']):
+            code = qr.issue(merchant, amount)
+            barrier = threading.Barrier(options['threads'])
+
+            def scan():
+                client = Client()
+                client.force_login(payer)
+                barrier.wait()
+                try:
+                    client.post('/transactions/qr-payment/', {'qr_data': code.qr_data, 'pin': PIN})
+                finally:
+                    connection.close()
+
+            threads = [threading.Thread(target=scan) for _ in range(options['threads'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            paid = Transaction.objects.filter(sender=payer, created_at__gte=code.created_at).count()
+            self.stdout.write(f'round {round_number + 1}: {options["threads"]} scans, {paid} payment(s)')
+            if paid != 1:
+                failures.append(round_number + 1)
+
+        # A replay this process has seen is rejected without a query
+        with CaptureQueriesContext(connection) as queries:
+            try:
+                qr.parse_payload(code.qr_data)
+                failures.append('replay accepted')
+            except qr.UsedQRCode:
+                pass
+        self.stdout.write(f'Replay of a used code: rejected with {len(queries)} queries')
+
+        # Another process only learns of the use from its failed UPDATE, then stops asking
+        qr._consumed = qr.ConsumedCodes()
+        client = Client()
+        client.force_login(payer)
+        client.post('/transactions/qr-payment/', {'qr_data': code.qr_data, 'pin': PIN})
+        if code.pk not in qr._consumed:
+            failures.append('bitmap not updated')
+
+        expired = qr.make_payload(merchant.id, amount, code.pk + 1, timezone.now())
+        try:
+            qr.parse_payload(expired)
+            failures.append('expired code accepted')
+        except qr.ExpiredQRCode:
+            pass
+
+        payloads = [qr.make_payload(merchant.id, amount, code.pk + i, code.expires_at) for i in range(2, 1002)]
+        started = time.perf_counter()
+        for i in range(options['scans']):
+            qr.parse_payload(payloads[i % len(payloads)])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'Verification: {options["scans"] / elapsed:.0f} payloads/second')
+
+        payer.profile.refresh_from_db()
+        expected = Decimal('1000.00') - amount * options['rounds']
+        self.stdout.write(f'Payer balance {payer.profile.balance} (expected {expected})')
+        if payer.profile.balance != expected:
+            failures.append('balance')
+
+        if not options['keep']:
+            Transaction.objects.filter(sender=payer).delete()
+            QRCode.objects.filter(user=merchant).delete()
+            User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+        if failures:
+            raise CommandError(f'One-time QR codes were not enforced: {failures}')
+        self.stdout.write(self.style.SUCCESS('Every one-time code was paid exactly once'))
+
+    def _create_users(self):
+        Transaction.objects.filter(sender__username__startswith=BENCH_PREFIX).delete()
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        users = []
+        for i in range(2):
+            user = User.objects.create(username=f'{BENCH_PREFIX}{i}', phone_number=f'0977{i:07d}')
+            Profile.objects.create(
+                user=user,
+                full_name=user.username,
+                cnic=f'97777-{i:07d}-7',
+                date_of_birth='1990-01-01',
+                address='Benchmark',
+                balance=Decimal('1000.00'),
+                pin=PIN,
+            )
+            users.append(user)
+        return users
@@ -0,0 +1,69 @@
+import re
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+from accounts.models import User, KYCDocument
+from accounts.utils import month_start
+from admin_panel.forms import TransactionFilterForm
+from admin_panel.search import prefix_query
+from transactions.models import Transaction, DailyTransactionRollup, UserVolumeRollup
+from transactions.pagination import encode_cursor, page_queryset
+from transactions.views import history_query
+
+# "SCAN transactions_transaction" on SQLite, "Seq Scan on ..." on PostgreSQL.
+# Index scans are reported as "SCAN t USING INDEX" / "Index Scan", which pass.
+FULL_SCAN = re.compile(r'(\bSCAN (?P<sqlite>\w+)(?! USING)\s*$)|(Seq Scan on (?P<pg>\w+))', re.MULTILINE)
+
+
+def hot_queries(user):
+    """The per-request queries that must be served from an index, built as the views build them"""
+    since = timezone.now() - timedelta(hours=1)
+    own = Q(sender=user) | Q(receiver=user)
+    # Any cursor will do: later pages differ from the first only by the seek condition
+    cursor = encode_cursor(Transaction(pk=1, created_at=timezone.now()))
+    history, branches = history_query(user)
+    completed = TransactionFilterForm({'status': 'completed'})
+    completed.is_valid()
+    users = User.objects.select_related('profile')
+    return {
+        'dashboard recent transactions': Transaction.objects.filter(own).order_by('-created_at')[:5],
+        'dashboard monthly stats': Transaction.objects.filter(own, created_at__gte=month_start()),
+        'dashboard pending requests': user.money_requests_received.filter(status='pending').select_related('requester'),
+        'notifications page': page_queryset(user.notification_set.all()),
+        'transaction history': page_queryset(history, branches=branches),
+        'transaction history next page': page_queryset(history, cursor, branches=branches),
+        'fraud velocity': Transaction.objects.filter(sender=user, created_at__gte=since, status='completed'),
+        'admin recent transactions': Transaction.objects.select_related('sender', 'receiver').order_by('-created_at')[:10],
+        'admin transaction filter': page_queryset(completed.filter(Transaction.objects.select_related('sender', 'receiver'))),
+        'admin daily report': DailyTransactionRollup.objects.filter(status='completed', day__gte=since.date()),
+        'admin top users': UserVolumeRollup.objects.order_by('-sent_volume')[:10],
+        'admin kyc review': KYCDocument.objects.filter(status='pending').order_by('-uploaded_at'),
+        'admin user list': page_queryset(users, field='date_joined'),
+        **{
+            f'admin {name} search': page_queryset(matches, field=field, descending=False)
+            for name, query in [('phone', '0300'), ('cnic', '35202'), ('account number', 'CE0001'), ('username', 'ali')]
+            for matches, field in [prefix_query(users, query)]
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot dashboard, history, fraud and admin queries and fail on full table scans'
+
+    def handle(self, *args, **options):
+        user = User(pk=1)
+        failures = []
+        for name, queryset in hot_queries(user).items():
+            plan = queryset.explain()
+            scan = FULL_SCAN.search(plan)
+            if scan:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f'FULL SCAN  {name}: {scan.group("sqlite") or scan.group("pg")}'))
+            else:
+                self.stdout.write(f'ok         {name}')
+            if options['verbosity'] > 1:
+                self.stdout.write(f'    {plan}')
+        if failures:
+            raise CommandError(f'{len(failures)} queries fall back to a full table scan')
+        self.stdout.write(self.style.SUCCESS('All hot queries use an index'))
@@ -0,0 +1,25 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from transactions import journal
+
+
+class Command(BaseCommand):
+    help = 'Checkpoint the balance of every account with new journal entries (run periodically, e.g. hourly from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cutoff', help='Only checkpoint entries written before this ISO datetime')
+        parser.add_argument('--chunk-size', type=int, default=journal.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        cutoff = None
+        if options['cutoff']:
+            try:
+                cutoff = datetime.fromisoformat(options['cutoff'])
+            except ValueError:
+                raise CommandError('--cutoff must be an ISO datetime')
+            if timezone.is_naive(cutoff):
+                cutoff = timezone.make_aware(cutoff)
+
+        written = journal.checkpoint_accounts(cutoff, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'{written} balance checkpoint(s) written'))
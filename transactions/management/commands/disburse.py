@@ -0,0 +1,62 @@
+import csv
+import sys
+import time
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import User
+from accounts.utils import normalize_phone
+from transactions import disbursement
+
+RESULT_FIELDS = ['line', 'phone', 'amount', 'status', 'transaction_id', 'error']
+
+
+class Command(BaseCommand):
+    help = 'Pay every row of a CSV or JSONL payout file (phone, amount, description) from one sender'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Payout file, or - for stdin')
+        parser.add_argument('--sender', required=True, help='Phone number of the paying account')
+        parser.add_argument('--format', choices=disbursement.FORMATS, default=None,
+                            help='Defaults to jsonl for .jsonl files and csv otherwise')
+        parser.add_argument('--batch-size', type=int, default=disbursement.BATCH_SIZE)
+        parser.add_argument('--output', help='Write per-row results to this CSV file')
+        parser.add_argument('--no-notify', action='store_true', help='Do not notify receivers')
+
+    def handle(self, *args, **options):
+        try:
+            sender = User.objects.get(phone_number=normalize_phone(options['sender']))
+        except User.DoesNotExist:
+            raise CommandError(f"No user with phone number {options['sender']}")
+        fmt = options['format'] or ('jsonl' if options['file'].endswith('.jsonl') else 'csv')
+
+        source = sys.stdin if options['file'] == '-' else open(options['file'], encoding='utf-8-sig', newline='')
+        output = open(options['output'], 'w', newline='') if options['output'] else None
+        writer = csv.DictWriter(output, RESULT_FIELDS) if output else None
+        if writer:
+            writer.writeheader()
+        counts = Counter()
+        started = time.perf_counter()
+        try:
+            results = disbursement.disburse(
+                sender,
+                disbursement.read_payouts(source, fmt),
+                batch_size=options['batch_size'],
+                notify=not options['no_notify'],
+            )
+            for result in results:
+                counts[result['status']] += 1
+                if writer:
+                    writer.writerow(result)
+                elif result['status'] != 'paid':
+                    self.stderr.write(f"line {result['line']}: {result['error']}")
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if output:
+                output.close()
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"Paid {counts['paid']}, failed {counts['failed']} in {elapsed:.1f}s")
+        if counts['failed']:
+            raise CommandError(f"{counts['failed']} payouts failed")
+        self.stdout.write(self.style.SUCCESS('All payouts completed'))
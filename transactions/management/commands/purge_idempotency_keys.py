@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from transactions import idempotency
+
+
+class Command(BaseCommand):
+    help = 'Delete expired idempotency keys and trim the table to IDEMPOTENCY["MAX_KEYS"]'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-keys', type=int, default=None)
+
+    def handle(self, *args, **options):
+        expired, trimmed = idempotency.purge(options['max_keys'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {expired} expired and {trimmed} surplus keys'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from transactions import rollups
+from transactions.models import DailyTransactionRollup, UserVolumeRollup
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily and per-user transaction rollups from the Transaction table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild daily rollups from this date (YYYY-MM-DD)')
+        parser.add_argument('--skip-users', action='store_true', help='Leave the per-user volume rollup alone')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError('--since must be a date (YYYY-MM-DD)')
+        rollups.rebuild(since=since, users=not options['skip_users'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {DailyTransactionRollup.objects.count()} daily rows and '
+            f'{UserVolumeRollup.objects.count()} user rows'
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from transactions import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Compare every balance with the sum of its completed transactions and write a drift report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only read transactions written since the last run, starting from its saved totals')
+        parser.add_argument('--chunk-size', type=int, default=reconcile.CHUNK_SIZE)
+        parser.add_argument('--directory', help='Defaults to settings.RECONCILIATION_DIR')
+
+    def handle(self, *args, **options):
+        result = reconcile.reconcile(options['incremental'], options['chunk_size'], options['directory'])
+        self.stdout.write(
+            f"{'Incremental' if result['incremental'] else 'Full'} run: {result['transactions']} transactions read, "
+            f"{result['accounts']} balances compared"
+        )
+        self.stdout.write(f"Report: {result['path']}")
+        if result['drifted']:
+            raise CommandError(
+                f"{result['drifted']} account(s) off by PKR {reconcile._amount(result['drift_cents'])} in total"
+            )
+        self.stdout.write(self.style.SUCCESS('Every balance matches its transactions'))
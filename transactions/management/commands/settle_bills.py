@@ -0,0 +1,28 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from transactions import settlement
+
+
+class Command(BaseCommand):
+    help = 'Write settlement files for paid bills not yet settled, one per bill type (run one at a time)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cutoff', help='Only settle bills paid before this ISO datetime')
+        parser.add_argument('--chunk-size', type=int, default=settlement.CHUNK_SIZE)
+        parser.add_argument('--directory', help='Defaults to settings.SETTLEMENT_DIR')
+
+    def handle(self, *args, **options):
+        cutoff = None
+        if options['cutoff']:
+            try:
+                cutoff = datetime.fromisoformat(options['cutoff'])
+            except ValueError:
+                raise CommandError('--cutoff must be an ISO datetime')
+            if timezone.is_naive(cutoff):
+                cutoff = timezone.make_aware(cutoff)
+
+        closed = settlement.settle(cutoff, options['chunk_size'], options['directory'])
+        for item in closed:
+            self.stdout.write(f'{item.bill_type:12} {item.bill_count:>8} bills  PKR {item.total_amount:>14}  {item.file_path}')
+        self.stdout.write(self.style.SUCCESS(f'{len(closed)} settlement file(s) written'))
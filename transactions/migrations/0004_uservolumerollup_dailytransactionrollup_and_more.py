@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_kycdocument_kyc_pending_uploaded_idx_and_more'),
+        ('transactions', '0003_moneyrequest_moneyreq_from_status_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserVolumeRollup',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='volume_rollup', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('sent_count', models.PositiveBigIntegerField(default=0)),
+                ('sent_volume', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-sent_volume'], name='rollup_sent_volume_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyTransactionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('transaction_type', models.CharField(choices=[('send', 'Send Money'), ('receive', 'Receive Money'), ('bill_payment', 'Bill Payment'), ('qr_payment', 'QR Payment'), ('deposit', 'Deposit'), ('withdrawal', 'Withdrawal')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], max_length=10)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('volume', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'day'], name='rollup_status_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailytransactionrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'transaction_type', 'status'), name='unique_daily_rollup'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:50
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def open_accounts(apps, schema_editor):
+    # Balances from before the journal become each account's opening checkpoint
+    Profile = apps.get_model('accounts', 'Profile')
+    BalanceCheckpoint = apps.get_model('transactions', 'BalanceCheckpoint')
+    now = timezone.now()
+    BalanceCheckpoint.objects.bulk_create(
+        (
+            BalanceCheckpoint(account_id=user_id, entry_id=0, balance=balance, as_of=now)
+            for user_id, balance in Profile.objects.values_list('user_id', 'balance').iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('transactions', '0006_billersettlement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=18)),
+                ('created_at', models.DateTimeField()),
+                ('account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='journal_entries', to=settings.AUTH_USER_MODEL)),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='journal_entries', to='transactions.transaction')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['account', 'id', 'amount'], name='journal_account_id_idx'), models.Index(fields=['account', 'created_at', 'id', 'amount'], name='journal_account_created_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_id', models.PositiveBigIntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=18)),
+                ('as_of', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_checkpoints', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['account', 'as_of'], name='checkpoint_account_asof_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='balancecheckpoint',
+            constraint=models.UniqueConstraint(fields=('account', 'entry_id'), name='unique_balance_checkpoint'),
+        ),
+        migrations.RunPython(open_accounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0007_journal'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='dailytransactionrollup',
+            name='unique_daily_rollup',
+        ),
+        migrations.AddField(
+            model_name='dailytransactionrollup',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='dailytransactionrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'transaction_type', 'status', 'shard'), name='unique_daily_rollup'),
+        ),
+    ]
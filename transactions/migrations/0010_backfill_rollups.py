@@ -0,0 +1,20 @@
+from django.db import migrations
+
+from transactions import rollups
+
+
+def backfill(apps, schema_editor):
+    # 0004 created the rollup tables empty, so reports showed nothing for
+    # transactions written before it
+    rollups.rebuild(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0009_idempotencykey_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
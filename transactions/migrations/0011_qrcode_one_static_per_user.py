@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:41
+
+from django.db import migrations, models
+
+
+def deactivate_duplicate_static_codes(apps, schema_editor):
+    # Concurrent get_or_create calls could leave a user with several; keep the first
+    QRCode = apps.get_model('transactions', 'QRCode')
+    static = QRCode.objects.filter(amount__isnull=True, is_active=True)
+    first = static.values('user').annotate(first_id=models.Min('id')).values('first_id')
+    static.exclude(id__in=first).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0010_backfill_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(deactivate_duplicate_static_codes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='qrcode',
+            constraint=models.UniqueConstraint(condition=models.Q(('amount__isnull', True), ('is_active', True)), fields=('user',), name='qrcode_one_static_per_user'),
+        ),
+    ]
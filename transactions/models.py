@@ -1,6 +1,6 @@
 from django.db import models
 from accounts.models import User
-import uuid
+from . import ids
 
 class Transaction(models.Model):
     TRANSACTION_TYPES = [
@@ -20,11 +20,6 @@ class Transaction(models.Model):
     ]
     
     transaction_id = models.CharField(max_length=50, unique=True, blank=True)
-    
-    def save(self, *args, **kwargs):
-        if not self.transaction_id:
-            self.transaction_id = str(uuid.uuid4())[:12]
-        super().save(*args, **kwargs)
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_transactions', null=True, blank=True)
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_transactions', null=True, blank=True)
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
@@ -36,6 +31,19 @@ class Transaction(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Per-user history, dashboard and fraud velocity lookups
+            models.Index(fields=['sender', 'created_at'], name='txn_sender_created_idx'),
+            models.Index(fields=['receiver', 'created_at'], name='txn_receiver_created_idx'),
+            # Admin filtering and reports
+            models.Index(fields=['status', 'created_at'], name='txn_status_created_idx'),
+            models.Index(fields=['created_at'], name='txn_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.transaction_id:
+            return super().save(*args, **kwargs)
+        ids.save_with_new_ids([self], lambda: super(Transaction, self).save(*args, **kwargs))
 
 class Bill(models.Model):
     BILL_TYPES = [
@@ -50,10 +58,35 @@ class Bill(models.Model):
     bill_type = models.CharField(max_length=20, choices=BILL_TYPES)
     bill_number = models.CharField(max_length=50)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    due_date = models.DateField()
+    # Bills paid on the spot by number have no due date on record
+    due_date = models.DateField(blank=True, null=True)
     is_paid = models.BooleanField(default=False)
     paid_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Unsettled bills are the settlement_id IS NULL range of this FK's index
+    settlement = models.ForeignKey('BillerSettlement', on_delete=models.SET_NULL, blank=True, null=True, related_name='bills')
+
+class BillerSettlement(models.Model):
+    """One settlement file of paid bills for a biller (bill type)"""
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('closed', 'Closed'),
+    ]
+    
+    bill_type = models.CharField(max_length=20, choices=Bill.BILL_TYPES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
+    bill_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    first_paid_at = models.DateTimeField(blank=True, null=True)
+    last_paid_at = models.DateTimeField(blank=True, null=True)
+    file_path = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    closed_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'bill_type'], name='settlement_status_type_idx'),
+        ]
 
 class MoneyRequest(models.Model):
     STATUS_CHOICES = [
@@ -69,6 +102,11 @@ class MoneyRequest(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     responded_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['requested_from', 'status'], name='moneyreq_from_status_idx'),
+        ]
 
 class QRCode(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -76,4 +114,104 @@ class QRCode(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    expires_at = models.DateTimeField(blank=True, null=True)
\ No newline at end of file
+    expires_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        constraints = [
+            # One static (no amount) code per user, so concurrent issue() calls cannot both create one
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(amount__isnull=True, is_active=True),
+                name='qrcode_one_static_per_user',
+            ),
+        ]
+
+class DailyTransactionRollup(models.Model):
+    """Per-day totals for each transaction type and status, kept current by the ledger.
+
+    Each total is split over up to ROLLUP_SHARDS rows so concurrent transfers
+    rarely update the same one; readers sum the shards.
+    """
+    day = models.DateField()
+    transaction_type = models.CharField(max_length=20, choices=Transaction.TRANSACTION_TYPES)
+    status = models.CharField(max_length=10, choices=Transaction.STATUS_CHOICES)
+    shard = models.PositiveSmallIntegerField(default=0)
+    count = models.PositiveBigIntegerField(default=0)
+    volume = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'transaction_type', 'status', 'shard'], name='unique_daily_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'day'], name='rollup_status_day_idx'),
+        ]
+
+class UserVolumeRollup(models.Model):
+    """Lifetime amount sent by each user, kept current by the ledger"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='volume_rollup')
+    sent_count = models.PositiveBigIntegerField(default=0)
+    sent_volume = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-sent_volume'], name='rollup_sent_volume_idx'),
+        ]
+
+class IdempotencyKey(models.Model):
+    """The outcome of a money-moving request, stored under its client-supplied key"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=64)
+    # The view and a hash of the submitted fields the key was first used for
+    endpoint = models.CharField(max_length=100, blank=True, default='')
+    request_hash = models.CharField(max_length=64, blank=True, default='')
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, blank=True, null=True)
+    response = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ]
+
+class JournalEntry(models.Model):
+    """One side of a transaction: a signed change to one account, never updated or deleted.
+
+    Every transaction writes one debit (negative) and one credit (positive)
+    entry of the same amount. The side of a deposit or withdrawal outside
+    the bank has no account.
+    """
+    id = models.BigAutoField(primary_key=True)
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='journal_entries')
+    account = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='journal_entries')
+    amount = models.DecimalField(max_digits=18, decimal_places=2)
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            # Entries after a checkpoint, by id for the current balance and by time for a past one.
+            # The amount is in the index so the sums never read the table, where one
+            # account's entries are scattered among everyone else's
+            models.Index(fields=['account', 'id', 'amount'], name='journal_account_id_idx'),
+            models.Index(fields=['account', 'created_at', 'id', 'amount'], name='journal_account_created_idx'),
+        ]
+
+class BalanceCheckpoint(models.Model):
+    """An account's balance after every journal entry up to ``entry_id``"""
+    account = models.ForeignKey(User, on_delete=models.CASCADE, related_name='balance_checkpoints')
+    entry_id = models.PositiveBigIntegerField()
+    balance = models.DecimalField(max_digits=18, decimal_places=2)
+    # created_at of the entry at entry_id; the opening checkpoint's is when the journal started
+    as_of = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'entry_id'], name='unique_balance_checkpoint'),
+        ]
+        indexes = [
+            models.Index(fields=['account', 'as_of'], name='checkpoint_account_asof_idx'),
+        ]
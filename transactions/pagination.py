@@ -0,0 +1,84 @@
+import base64
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+PAGE_SIZE = 25
+
+
+def encode_cursor(obj, field='created_at'):
+    """Opaque cursor pointing just past ``obj`` in (field, id) order"""
+    value = obj
+    for part in field.split('__'):
+        value = getattr(value, part)
+    value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+    raw = f'{value}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (value, id) from a cursor, or raise ValueError.
+
+    The value comes back as a string; the model field converts it when the
+    cursor is used in a lookup.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        value, pk = raw.rsplit('|', 1)
+        pk = int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+    return value, pk
+
+
+def page_queryset(queryset, cursor=None, page_size=PAGE_SIZE, field='created_at', descending=True, branches=None):
+    """The unevaluated query keyset_page runs for one page"""
+    direction = '-' if descending else ''
+    past = 'lt' if descending else 'gt'
+    ordering = (f'{direction}{field}', f'{direction}pk')
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        try:
+            # The redundant <=/>= bound gives the planner an index range to seek on
+            queryset = queryset.filter(
+                Q(**{f'{field}__{past}e': value}),
+                Q(**{f'{field}__{past}': value}) | Q(**{f'pk__{past}': pk})
+            )
+        except (ValidationError, TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+    if branches:
+        matches = Q()
+        for branch in branches:
+            matches |= Q(pk__in=queryset.filter(branch).order_by(*ordering).values('pk')[:page_size + 1])
+        queryset = queryset.filter(matches)
+    return queryset.order_by(*ordering)[:page_size + 1]
+
+
+def _cut(items, page_size, field):
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor(items[-1], field)
+    return items, next_cursor
+
+
+def keyset_page(queryset, cursor=None, page_size=PAGE_SIZE, field='created_at', descending=True, branches=None):
+    """Fetch one page after ``cursor``, newest first unless ``descending`` is False.
+
+    Seeks on (field, id) instead of using OFFSET, so every page costs the
+    same regardless of how deep it is. ``field`` may span a relation
+    (``profile__cnic``). Returns the page items and the cursor for the next
+    page (None on the last page).
+
+    ``branches`` is a list of Q objects that are ORed together. Each branch
+    walks its own index in order and stops after one page, and the outer
+    query merges those pages. A plain OR would have to sort every matching
+    row before applying the LIMIT.
+    """
+    items = list(page_queryset(queryset, cursor, page_size, field, descending, branches))
+    return _cut(items, page_size, field)
+
+
+async def akeyset_page(queryset, cursor=None, page_size=PAGE_SIZE, field='created_at', descending=True, branches=None):
+    """keyset_page for async views"""
+    items = [obj async for obj in page_queryset(queryset, cursor, page_size, field, descending, branches)]
+    return _cut(items, page_size, field)
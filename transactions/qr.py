@@ -0,0 +1,257 @@
+"""QR payment payloads and cached QR image rendering.
+
+Payloads are short HMAC-signed strings,
+``CE1.<user id>.<code id>.<expires>.<amount>:<signature>``. A static code
+(a merchant's counter code) leaves everything after the user id empty and
+can be paid any number of times. A dynamic code carries the id of its
+QRCode row, a Unix expiry time and a fixed amount, and can be paid once.
+
+qr_payment verifies the signature (in constant time), the expiry and a
+bitmap of dynamic codes already used without touching the database. Only
+the payment itself marks the code used, in the same database transaction.
+
+Static payloads are deterministic per user, so their images are cached by
+content: a bounded in-memory LRU sits in front of an on-disk cache under
+MEDIA_ROOT.
+"""
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.utils import timezone
+import qrcode
+from PIL import Image
+from .models import QRCode
+
+PAYLOAD_VERSION = 'CE1'
+MIME_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+BOX_SIZE = 10
+BORDER = 4
+
+_signer = signing.Signer(salt='transactions.qr')
+
+Payload = namedtuple('Payload', ['user_id', 'amount', 'code_id', 'expires'])
+
+
+class QRError(ValueError):
+    """A scanned QR code that cannot be paid"""
+
+
+class ExpiredQRCode(QRError):
+    pass
+
+
+class UsedQRCode(QRError):
+    pass
+
+
+class ConsumedCodes:
+    """Bitmap of dynamic code ids known to be used, one bit per QRCode id.
+
+    QRCode ids are dense, so the bitmap is exact and small (a million codes
+    take 125 KB). It only knows what this process has seen; consume() is
+    the authority and feeds it, so a replay in another process costs one
+    failed UPDATE and is then rejected here too.
+    """
+
+    def __init__(self):
+        self._bits = bytearray()
+        self._lock = threading.Lock()
+
+    def add(self, code_id):
+        with self._lock:
+            index = code_id >> 3
+            if index >= len(self._bits):
+                self._bits.extend(bytes(max(index + 1, 2 * len(self._bits)) - len(self._bits)))
+            self._bits[index] |= 1 << (code_id & 7)
+
+    def __contains__(self, code_id):
+        index = code_id >> 3
+        return index < len(self._bits) and bool(self._bits[index] & (1 << (code_id & 7)))
+
+
+_consumed = ConsumedCodes()
+
+
+def make_payload(user_id, amount=None, code_id=None, expires_at=None):
+    """Signed payload for paying ``user_id``; pass a QRCode id and expiry for a one-time code"""
+    expires = int(expires_at.timestamp()) if expires_at is not None else ''
+    return _signer.sign(
+        f'{PAYLOAD_VERSION}.{user_id}.{code_id if code_id is not None else ""}.{expires}.'
+        f'{amount if amount is not None else ""}'
+    )
+
+
+def parse_payload(data, now=None):
+    """Return the Payload of a scanned QR code, or raise QRError.
+
+    Raises ExpiredQRCode or UsedQRCode for a dynamic code past its expiry
+    or already paid. No database access.
+    """
+    try:
+        version, user_id, code_id, expires, amount = _signer.unsign(data.strip()).split('.', 4)
+    except (signing.BadSignature, ValueError):
+        raise QRError('Invalid QR code.')
+    if version != PAYLOAD_VERSION or not all(
+        field.isdigit() for field in (user_id, code_id or '0', expires or '0')
+    ):
+        raise QRError('Invalid QR code.')
+    if expires and int(expires) <= (now if now is not None else time.time()):
+        raise ExpiredQRCode('This QR code has expired.')
+    if code_id and int(code_id) in _consumed:
+        raise UsedQRCode('This QR code has already been used.')
+    return Payload(int(user_id), amount or None, int(code_id) if code_id else None, int(expires) if expires else None)
+
+
+def issue(user, amount=None):
+    """The QRCode for ``user``: their static code, or a new one-time code for ``amount``"""
+    if amount is None:
+        # get_or_create falls back to reading the row when qrcode_one_static_per_user rejects a concurrent insert
+        payload = make_payload(user.id)
+        code, created = QRCode.objects.get_or_create(
+            user=user, amount=None, is_active=True, defaults={'qr_data': payload},
+        )
+        if code.qr_data != payload:
+            # Signed with an earlier SECRET_KEY
+            code.qr_data = payload
+            code.save(update_fields=['qr_data'])
+        return code
+    expires_at = timezone.now() + timedelta(minutes=settings.QR_CODE_TTL_MINUTES)
+    code = QRCode.objects.create(user=user, qr_data='', amount=amount, expires_at=expires_at)
+    # The row id is the code's one-time identity, so the payload is signed after the insert
+    code.qr_data = make_payload(user.id, amount, code.pk, expires_at)
+    code.save(update_fields=['qr_data'])
+    return code
+
+
+def consume(payload):
+    """Mark a one-time code used inside the payment's transaction, or raise UsedQRCode"""
+    if payload.code_id is None:
+        return
+    if not QRCode.objects.filter(pk=payload.code_id, is_active=True).update(is_active=False):
+        _consumed.add(payload.code_id)
+        raise UsedQRCode('This QR code has already been used.')
+    # Recorded only once the payment commits; a rolled back payment leaves the code usable
+    transaction.on_commit(lambda: _consumed.add(payload.code_id))
+
+
+class ImageCache:
+    """LRU of rendered images, bounded by total size in bytes"""
+
+    def __init__(self, max_bytes):
+        self._images = OrderedDict()
+        self._max_bytes = max_bytes
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+            return image
+
+    def set(self, key, image):
+        with self._lock:
+            if key in self._images:
+                return
+            self._images[key] = image
+            self._size += len(image)
+            while self._size > self._max_bytes and self._images:
+                self._size -= len(self._images.popitem(last=False)[1])
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._size = 0
+
+
+_memory = ImageCache(settings.QR_CACHE['MEMORY_BYTES'])
+
+
+def _matrix(payload):
+    # A fixed mask skips scoring all eight candidates, most of the encoder's
+    # time; every mask is valid and scanners do not care which one is used
+    code = qrcode.QRCode(border=BORDER, mask_pattern=0)
+    code.add_data(payload)
+    code.make(fit=True)
+    return code.get_matrix()
+
+
+def _png(matrix):
+    size = len(matrix)
+    image = Image.new('1', (size, size), 1)
+    image.putdata([0 if dark else 1 for row in matrix for dark in row])
+    buffer = io.BytesIO()
+    image.resize((size * BOX_SIZE, size * BOX_SIZE), Image.NEAREST).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _svg(matrix):
+    # One path segment per horizontal run of dark modules; no Pillow involved
+    size = len(matrix)
+    segments = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if row[x]:
+                start = x
+                while x < size and row[x]:
+                    x += 1
+                segments.append(f'M{start} {y}h{x - start}v1h-{x - start}z')
+            else:
+                x += 1
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+        f'width="{size * BOX_SIZE}" height="{size * BOX_SIZE}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{"".join(segments)}" fill="#000"/></svg>'
+    ).encode()
+
+
+def _encode(payload, fmt):
+    matrix = _matrix(payload)
+    return _svg(matrix) if fmt == 'svg' else _png(matrix)
+
+
+def _disk_path(key, fmt):
+    directory = settings.QR_CACHE['DIRECTORY']
+    return os.path.join(directory, key[:2], f'{key}.{fmt}') if directory else None
+
+
+def render(payload, fmt='png', cache=True):
+    """The QR image for ``payload`` as PNG or SVG bytes, rendered at most once per cache.
+
+    One-time codes are shown once, so they pass ``cache=False`` rather than
+    evicting static codes from the caches.
+    """
+    if fmt not in MIME_TYPES:
+        raise ValueError(f'Unknown QR format {fmt!r}')
+    if not cache:
+        return _encode(payload, fmt)
+    key = hashlib.sha256(f'{fmt}:{payload}'.encode()).hexdigest()
+    image = _memory.get(key)
+    if image is not None:
+        return image
+
+    path = _disk_path(key, fmt)
+    if path and os.path.exists(path):
+        with open(path, 'rb') as handle:
+            image = handle.read()
+    else:
+        image = _encode(payload, fmt)
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Unique temporary name, then an atomic rename, so readers never see a partial file
+            temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temporary, 'wb') as handle:
+                handle.write(image)
+            os.replace(temporary, path)
+    _memory.set(key, image)
+    return image
@@ -0,0 +1,211 @@
+"""Reconciliation of account balances against the transaction log.
+
+Every account's balance is recomputed from its completed transactions and
+compared with Profile.balance. Transactions are read in primary key
+chunks and folded into one array of net flows in cents, indexed by user
+id. Memory therefore grows with the number of accounts, not with the
+number of transactions. Balances are then read in user id chunks and
+compared in whole cents, so float-tainted amounts cannot hide drift.
+
+A transfer debits its sender and credits its receiver. A deposit credits
+its sender, because the ledger records top-ups with the user as sender.
+A payment with no receiver only debits.
+
+Balances keep moving while a run reads. Transactions are read only up to
+the newest one older than RECONCILE_LAG. An account that looks off is
+checked again while holding its lock, adding the transactions written
+since, and only then goes into the drift report.
+
+Each run saves the net flows and the last transaction read to the
+report directory. An incremental run starts from them and reads only
+the transactions written since.
+"""
+import csv
+import json
+import os
+from array import array
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from accounts.models import Profile
+from .ledger import _lock_accounts
+from .models import Transaction
+
+CHUNK_SIZE = 10000
+# Accounts rechecked per locked transaction
+CONFIRM_CHUNK_SIZE = 500
+# Transactions written in the last moments may still be inside an uncommitted database transaction
+RECONCILE_LAG = timedelta(minutes=1)
+
+STATE_FILE = 'state.json'
+FLOWS_FILE = 'flows.bin'
+REPORT_FIELDS = ['user_id', 'account_number', 'balance', 'expected', 'drift']
+
+
+def _cents(amount):
+    return int(round(amount * 100))
+
+
+def _amount(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def _log():
+    # Not filtered on status: with that condition the planner may pick the
+    # status index and sort every completed transaction for each chunk
+    return Transaction.objects.order_by('pk').values_list(
+        'pk', 'status', 'transaction_type', 'sender_id', 'receiver_id', 'amount'
+    )
+
+
+def _sides(transaction_type, sender_id, receiver_id):
+    """The (debited, credited) account ids of a transaction"""
+    return (None, sender_id) if transaction_type == 'deposit' else (sender_id, receiver_id)
+
+
+def _apply(flows, rows):
+    """Add the money movements of ``rows`` to ``flows``, growing it to fit new account ids"""
+    for _, status, transaction_type, sender_id, receiver_id, amount in rows:
+        if status != 'completed':
+            continue
+        debit_id, credit_id = _sides(transaction_type, sender_id, receiver_id)
+        cents = _cents(amount)
+        for account_id, change in ((debit_id, -cents), (credit_id, cents)):
+            if account_id is None:
+                continue
+            if account_id >= len(flows):
+                flows.frombytes(bytes(8 * (max(account_id + 1, 2 * len(flows)) - len(flows))))
+            flows[account_id] += change
+
+
+def _last_settled_pk(cutoff):
+    """The highest pk below every transaction written since ``cutoff``"""
+    # Only the rows since the cutoff are read, through the created_at index
+    recent = Transaction.objects.filter(created_at__gte=cutoff).aggregate(first=Min('pk'))['first']
+    if recent is not None:
+        return recent - 1
+    return Transaction.objects.aggregate(last=Max('pk'))['last'] or 0
+
+
+def scan(flows, after, upto, chunk_size=CHUNK_SIZE):
+    """Fold completed transactions with ``after`` < pk <= ``upto`` into ``flows``; returns the count read"""
+    count = 0
+    while after < upto:
+        rows = list(_log().filter(pk__gt=after, pk__lte=upto)[:chunk_size])
+        if not rows:
+            break
+        _apply(flows, rows)
+        count += len(rows)
+        after = rows[-1][0]
+    return count
+
+
+def _candidates(flows, chunk_size):
+    """Returns the number of balances compared and the ids of those that disagree with ``flows``"""
+    drifted = array('q')
+    compared, last_id = 0, 0
+    while True:
+        rows = list(
+            Profile.objects.filter(user_id__gt=last_id).order_by('user_id').values_list('user_id', 'balance')[:chunk_size]
+        )
+        if not rows:
+            return compared, drifted
+        for user_id, balance in rows:
+            if _cents(balance) != (flows[user_id] if user_id < len(flows) else 0):
+                drifted.append(user_id)
+        compared += len(rows)
+        last_id = rows[-1][0]
+
+
+def _confirm(flows, account_ids, upto):
+    """Recheck ``account_ids`` under their locks; returns (user id, account number, balance, expected cents) of those still off"""
+    expected = {user_id: flows[user_id] if user_id < len(flows) else 0 for user_id in account_ids}
+    with transaction.atomic():
+        _lock_accounts(account_ids)
+        newer = _log().filter(pk__gt=upto).filter(Q(sender_id__in=account_ids) | Q(receiver_id__in=account_ids))
+        for _, status, transaction_type, sender_id, receiver_id, amount in newer:
+            if status != 'completed':
+                continue
+            debit_id, credit_id = _sides(transaction_type, sender_id, receiver_id)
+            if debit_id in expected:
+                expected[debit_id] -= _cents(amount)
+            if credit_id in expected:
+                expected[credit_id] += _cents(amount)
+        balances = Profile.objects.filter(user_id__in=account_ids).order_by('user_id').values_list(
+            'user_id', 'account_number', 'balance'
+        )
+        return [
+            (user_id, account_number, balance, expected[user_id])
+            for user_id, account_number, balance in balances
+            if _cents(balance) != expected[user_id]
+        ]
+
+
+def load_state(directory):
+    """The saved (flows, last pk) of the previous run, or None"""
+    try:
+        with open(os.path.join(directory, STATE_FILE)) as handle:
+            state = json.load(handle)
+        flows = array('q')
+        with open(os.path.join(directory, FLOWS_FILE), 'rb') as handle:
+            flows.frombytes(handle.read())
+    except (OSError, ValueError):
+        return None
+    return flows, state['last_pk']
+
+
+def save_state(directory, flows, last_pk):
+    # Written under temporary names so a crash never leaves a torn state behind
+    for name, write in (
+        (FLOWS_FILE, lambda handle: flows.tofile(handle)),
+        (STATE_FILE, lambda handle: handle.write(json.dumps({'last_pk': last_pk, 'saved_at': timezone.now().isoformat()}).encode())),
+    ):
+        path = os.path.join(directory, name)
+        with open(path + '.part', 'wb') as handle:
+            write(handle)
+        os.replace(path + '.part', path)
+
+
+def reconcile(incremental=False, chunk_size=CHUNK_SIZE, directory=None):
+    """Compare every balance with its transactions and write a drift report.
+
+    Returns a summary with the report path, the number of transactions
+    read and accounts compared, the accounts off and their total drift in
+    cents.
+    """
+    directory = directory or settings.RECONCILIATION_DIR
+    os.makedirs(directory, exist_ok=True)
+    upto = _last_settled_pk(timezone.now() - RECONCILE_LAG)
+    state = load_state(directory) if incremental else None
+    if state is not None and state[1] > upto:
+        # The log is shorter than when the state was saved, so the state is not for this database
+        state = None
+    flows, after = state or (array('q'), 0)
+    read = scan(flows, after, upto, chunk_size)
+
+    drifted, total = 0, 0
+    path = os.path.join(directory, f'drift-{timezone.now():%Y%m%d-%H%M%S}.csv')
+    with open(path + '.part', 'w', newline='') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(REPORT_FIELDS)
+        compared, candidates = _candidates(flows, chunk_size)
+        for start in range(0, len(candidates), CONFIRM_CHUNK_SIZE):
+            account_ids = list(candidates[start:start + CONFIRM_CHUNK_SIZE])
+            for user_id, account_number, balance, expected in _confirm(flows, account_ids, upto):
+                drift = _cents(balance) - expected
+                writer.writerow([user_id, account_number, balance, _amount(expected), _amount(drift)])
+                drifted += 1
+                total += drift
+    os.replace(path + '.part', path)
+    save_state(directory, flows, upto)
+    return {
+        'path': path,
+        'incremental': state is not None,
+        'transactions': read,
+        'accounts': compared,
+        'drifted': drifted,
+        'drift_cents': total,
+    }
@@ -0,0 +1,119 @@
+import random
+from collections import defaultdict
+from itertools import islice
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Transaction, DailyTransactionRollup, UserVolumeRollup
+
+
+def _bump(model, lookup, count_field, volume_field, amount, count=1):
+    increments = {count_field: F(count_field) + count, volume_field: F(volume_field) + amount}
+    if model.objects.filter(**lookup).update(**increments):
+        return
+    try:
+        # The savepoint keeps a lost creation race from aborting the caller's transaction
+        with transaction.atomic():
+            model.objects.create(**lookup, **{count_field: count, volume_field: amount})
+    except IntegrityError:
+        model.objects.filter(**lookup).update(**increments)
+
+
+def _shard():
+    # Every transfer of a day would otherwise update the same row and wait for each other's commits
+    return random.randrange(settings.ROLLUP_SHARDS)
+
+
+def record(trans):
+    """Add a newly written transaction to the rollups.
+
+    Call inside the transaction that created ``trans`` so the rollups can
+    never disagree with the table they summarize.
+    """
+    _bump(
+        DailyTransactionRollup,
+        {
+            'day': timezone.localdate(trans.created_at),
+            'transaction_type': trans.transaction_type,
+            'status': trans.status,
+            'shard': _shard(),
+        },
+        'count', 'volume', trans.amount,
+    )
+    if trans.sender_id is not None:
+        _bump(UserVolumeRollup, {'user_id': trans.sender_id}, 'sent_count', 'sent_volume', trans.amount)
+
+
+def record_many(transactions):
+    """Add a batch of newly written transactions, one update per rollup row touched"""
+    daily = defaultdict(lambda: [0, 0])
+    senders = defaultdict(lambda: [0, 0])
+    for trans in transactions:
+        key = (timezone.localdate(trans.created_at), trans.transaction_type, trans.status)
+        daily[key][0] += 1
+        daily[key][1] += trans.amount
+        if trans.sender_id is not None:
+            senders[trans.sender_id][0] += 1
+            senders[trans.sender_id][1] += trans.amount
+    for (day, transaction_type, status), (count, volume) in daily.items():
+        _bump(
+            DailyTransactionRollup,
+            {'day': day, 'transaction_type': transaction_type, 'status': status, 'shard': _shard()},
+            'count', 'volume', volume, count,
+        )
+    for sender_id, (count, volume) in senders.items():
+        _bump(UserVolumeRollup, {'user_id': sender_id}, 'sent_count', 'sent_volume', volume, count)
+
+
+def _bulk_create(model, rows, batch_size=1000):
+    # bulk_create materializes its input, so feed it one batch at a time
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        model.objects.bulk_create(batch)
+
+
+def rebuild(since=None, users=True, apps=global_apps):
+    """Recompute the rollups from the Transaction table.
+
+    With ``since`` only daily rows from that date onwards are replaced.
+    Migrations pass their historical ``apps``.
+    """
+    Transaction = apps.get_model('transactions', 'Transaction')
+    DailyTransactionRollup = apps.get_model('transactions', 'DailyTransactionRollup')
+    UserVolumeRollup = apps.get_model('transactions', 'UserVolumeRollup')
+    with transaction.atomic():
+        daily = Transaction.objects.all()
+        stale = DailyTransactionRollup.objects.all()
+        if since is not None:
+            daily = daily.filter(created_at__date__gte=since)
+            stale = stale.filter(day__gte=since)
+        stale.delete()
+        _bulk_create(
+            DailyTransactionRollup,
+            (
+                DailyTransactionRollup(**row)
+                for row in daily.annotate(
+                    day=TruncDate('created_at')
+                ).order_by().values(
+                    'day', 'transaction_type', 'status'
+                ).annotate(count=Count('id'), volume=Sum('amount')).iterator()
+            ),
+        )
+
+        if users:
+            UserVolumeRollup.objects.all().delete()
+            _bulk_create(
+                UserVolumeRollup,
+                (
+                    UserVolumeRollup(user_id=row['sender'], sent_count=row['count'], sent_volume=row['volume'])
+                    for row in Transaction.objects.filter(
+                        sender__isnull=False
+                    ).order_by().values('sender').annotate(count=Count('id'), volume=Sum('amount')).iterator()
+                ),
+            )
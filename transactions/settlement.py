@@ -0,0 +1,107 @@
+"""End-of-day biller settlement.
+
+Paid bills that have not been settled yet are claimed into one open
+BillerSettlement per bill type. They are read in id chunks from the
+``settlement_id IS NULL`` range of the settlement foreign key index, so
+the cost is proportional to the number of new bills, not to the size of
+the Bill table. Each open settlement then gets a CSV file written from
+its own bills and is closed.
+
+A run that dies part-way leaves open settlements behind. The next run
+claims any remaining bills into them and then writes and closes them.
+"""
+import csv
+import os
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Bill, BillerSettlement
+
+CHUNK_SIZE = 2000
+# Bills paid in the last moments may still be inside an uncommitted transaction
+SETTLEMENT_LAG = timedelta(minutes=1)
+
+FILE_FIELDS = ['bill_id', 'bill_number', 'bill_type', 'amount', 'paid_at', 'user_id']
+
+
+def _open_settlement(bill_type):
+    settlement = BillerSettlement.objects.filter(bill_type=bill_type, status='open').first()
+    return settlement or BillerSettlement.objects.create(bill_type=bill_type)
+
+
+def claim_bills(cutoff=None, chunk_size=CHUNK_SIZE):
+    """Attach every paid, unsettled bill paid before ``cutoff`` to its open settlement.
+
+    Returns the number of bills claimed per bill type.
+    """
+    cutoff = cutoff or timezone.now() - SETTLEMENT_LAG
+    settlements = {}
+    claimed = defaultdict(int)
+    last_id = 0
+    while True:
+        chunk = list(
+            Bill.objects.filter(
+                is_paid=True, settlement__isnull=True, paid_at__lt=cutoff, pk__gt=last_id
+            ).order_by('pk').values_list('pk', 'bill_type')[:chunk_size]
+        )
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        by_type = defaultdict(list)
+        for pk, bill_type in chunk:
+            by_type[bill_type].append(pk)
+        with transaction.atomic():
+            for bill_type, ids in by_type.items():
+                if bill_type not in settlements:
+                    settlements[bill_type] = _open_settlement(bill_type)
+                # settlement__isnull guards against a concurrent run claiming the same bills
+                claimed[bill_type] += Bill.objects.filter(
+                    pk__in=ids, settlement__isnull=True
+                ).update(settlement=settlements[bill_type])
+    return dict(claimed)
+
+
+def close_settlement(settlement, directory=None):
+    """Write the settlement file from the settlement's bills and close it"""
+    directory = directory or settings.SETTLEMENT_DIR
+    os.makedirs(directory, exist_ok=True)
+    started = timezone.now()
+    path = os.path.join(directory, f'{settlement.bill_type}-{started:%Y%m%d-%H%M%S}-{settlement.pk}.csv')
+
+    count, total, first, last = 0, Decimal('0.00'), None, None
+    rows = settlement.bills.order_by('pk').values_list(
+        'pk', 'bill_number', 'bill_type', 'amount', 'paid_at', 'user_id'
+    ).iterator(chunk_size=CHUNK_SIZE)
+    # Written under a temporary name so a crash never leaves a truncated file behind
+    with open(path + '.part', 'w', newline='') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(FILE_FIELDS)
+        for pk, bill_number, bill_type, amount, paid_at, user_id in rows:
+            writer.writerow([pk, bill_number, bill_type, amount, paid_at.isoformat(), user_id])
+            count += 1
+            total += amount
+            first = paid_at if first is None or paid_at < first else first
+            last = paid_at if last is None or paid_at > last else last
+    os.replace(path + '.part', path)
+
+    settlement.bill_count = count
+    settlement.total_amount = total
+    settlement.first_paid_at = first
+    settlement.last_paid_at = last
+    settlement.file_path = path
+    settlement.status = 'closed'
+    settlement.closed_at = timezone.now()
+    settlement.save()
+    return settlement
+
+
+def settle(cutoff=None, chunk_size=CHUNK_SIZE, directory=None):
+    """Claim new paid bills and close every open settlement; returns the closed settlements"""
+    claim_bills(cutoff, chunk_size)
+    return [
+        close_settlement(settlement, directory)
+        for settlement in BillerSettlement.objects.filter(status='open').order_by('bill_type')
+    ]
@@ -0,0 +1,17 @@
+import uuid
+from django import template
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def idempotency_field(context):
+    """Hidden idempotency key input for a money-moving form.
+
+    A form re-rendered after a failed submit keeps its key, so the retry
+    still counts as the same request.
+    """
+    request = context.get('request')
+    key = request.POST.get('idempotency_key') if request is not None else None
+    return format_html('<input type="hidden" name="idempotency_key" value="{}">', key or uuid.uuid4().hex)
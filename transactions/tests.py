@@ -0,0 +1,431 @@
+import csv
+import glob
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import timedelta
+from unittest import mock
+from decimal import Decimal
+from io import StringIO
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.db.models import F, Sum
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from accounts import velocity
+from accounts.models import Profile, User
+from accounts.tests import make_user
+from . import disbursement, ids, journal, ledger, qr, rollups
+from .management.commands.check_query_plans import FULL_SCAN, hot_queries
+from .models import BalanceCheckpoint, DailyTransactionRollup, IdempotencyKey, JournalEntry, QRCode, Transaction
+
+
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_an_index(self):
+        for name, queryset in hot_queries(User(pk=1)).items():
+            with self.subTest(name):
+                plan = queryset.explain()
+                self.assertIsNone(FULL_SCAN.search(plan), plan)
+
+    def test_command_passes(self):
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertIn('All hot queries use an index', out.getvalue())
+
+    def test_full_scan_is_detected(self):
+        self.assertIsNotNone(FULL_SCAN.search('SCAN transactions_transaction'))
+        self.assertIsNotNone(FULL_SCAN.search('Seq Scan on transactions_transaction  (cost=0.00..1.00 rows=1)'))
+        self.assertIsNone(FULL_SCAN.search('SCAN transactions_transaction USING INDEX txn_created_idx'))
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.user = make_user('alice', '03000000001', balance='100.00')
+        self.other = make_user('bob', '03000000002', balance='50.00')
+
+    def balances(self):
+        return dict(Profile.objects.values_list('user__username', 'balance'))
+
+    def test_invalid_amounts_are_rejected(self):
+        for value in ('nan', 'NaN', 'inf', '-Infinity', 'sNaN', '0', '0.001', '-5', 'abc', None):
+            with self.subTest(value), self.assertRaises(ledger.LedgerError):
+                ledger.to_amount(value)
+        self.assertEqual(ledger.to_amount('12.345'), Decimal('12.34'))
+
+    def test_transfer_conserves_the_total(self):
+        ledger.transfer(self.user, self.other, Decimal('30.00'))
+        self.assertEqual(self.balances(), {'alice': Decimal('70.00'), 'bob': Decimal('80.00')})
+
+    def test_insufficient_balance_changes_nothing(self):
+        with self.assertRaises(ledger.InsufficientBalance):
+            ledger.transfer(self.user, self.other, Decimal('100.01'))
+        self.assertEqual(self.balances(), {'alice': Decimal('100.00'), 'bob': Decimal('50.00')})
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_transfer_many_is_all_or_nothing(self):
+        with self.assertRaises(ledger.LedgerError):
+            ledger.transfer_many(self.user, [(self.other.pk, '10.00', ''), (999999, '10.00', '')])
+        self.assertEqual(self.balances(), {'alice': Decimal('100.00'), 'bob': Decimal('50.00')})
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(DailyTransactionRollup.objects.exists())
+        self.assertFalse(JournalEntry.objects.exists())
+
+    def test_rollups_and_journal_are_written_with_the_transfer(self):
+        trans = ledger.transfer(self.user, self.other, Decimal('30.00'))
+        self.assertEqual(
+            DailyTransactionRollup.objects.aggregate(count=Sum('count'), volume=Sum('volume')),
+            {'count': 1, 'volume': Decimal('30.00')},
+        )
+        self.assertEqual(
+            sorted(JournalEntry.objects.filter(transaction=trans).values_list('account_id', 'amount')),
+            sorted([(self.user.pk, Decimal('-30.00')), (self.other.pk, Decimal('30.00'))]),
+        )
+
+    def test_a_failed_journal_write_rolls_back_the_transfer(self):
+        with mock.patch.object(journal, 'record', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            ledger.transfer(self.user, self.other, Decimal('30.00'))
+        self.assertEqual(self.balances(), {'alice': Decimal('100.00'), 'bob': Decimal('50.00')})
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(DailyTransactionRollup.objects.exists())
+
+    def test_top_up_rejects_non_finite_amounts(self):
+        self.client.force_login(self.user)
+        for amount in ('nan', 'inf'):
+            response = self.client.post('/transactions/top-up/', {'amount': amount, 'pin': '4821'})
+            self.assertContains(response, 'Invalid amount.')
+        self.assertEqual(self.balances(), {'alice': Decimal('100.00'), 'bob': Decimal('50.00')})
+        self.assertFalse(Transaction.objects.exists())
+
+
+class ReconcileTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        # Funded through the ledger, so every balance has transactions behind it
+        self.user = make_user('alice', '03000000001')
+        self.other = make_user('bob', '03000000002')
+        ledger.deposit(self.user, Decimal('100.00'))
+        ledger.transfer(self.user, self.other, Decimal('30.00'))
+
+    def reconcile(self):
+        call_command('reconcile_balances', directory=self.directory, stdout=StringIO())
+
+    def report(self):
+        [path] = glob.glob(os.path.join(self.directory, 'drift-*.csv'))
+        with open(path, newline='') as handle:
+            return [(row['user_id'], row['drift']) for row in csv.DictReader(handle)]
+
+    def test_matching_balances_pass(self):
+        self.reconcile()
+        self.assertEqual(self.report(), [])
+
+    def test_tampered_balance_is_reported(self):
+        Profile.objects.filter(user=self.other).update(balance=F('balance') + Decimal('5.00'))
+        with self.assertRaisesMessage(CommandError, '1 account(s) off by PKR 5.00'):
+            self.reconcile()
+        self.assertEqual(self.report(), [(str(self.other.pk), '5.00')])
+
+    def test_missing_transaction_is_reported(self):
+        Transaction.objects.filter(transaction_type='send').delete()
+        with self.assertRaisesMessage(CommandError, '2 account(s) off'):
+            self.reconcile()
+        self.assertEqual(self.report(), [(str(self.user.pk), '-30.00'), (str(self.other.pk), '30.00')])
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.user = make_user('alice', '03000000001', balance='1000.00')
+        self.other = make_user('bob', '03000000002')
+
+    def totals(self):
+        return DailyTransactionRollup.objects.filter(status='completed').aggregate(count=Sum('count'), volume=Sum('volume'))
+
+    def test_shards_sum_to_the_totals(self):
+        for _ in range(20):
+            ledger.transfer(self.user, self.other, Decimal('5.00'))
+        self.assertEqual(self.totals(), {'count': 20, 'volume': Decimal('100.00')})
+        self.assertGreater(DailyTransactionRollup.objects.count(), 1)
+        rollups.rebuild()
+        self.assertEqual(self.totals(), {'count': 20, 'volume': Decimal('100.00')})
+
+
+class JournalTests(TestCase):
+    def setUp(self):
+        self.user = make_user('alice', '03000000001', balance='1000.00')
+        self.other = make_user('bob', '03000000002')
+        # Profiles created with a balance need an opening checkpoint, as in the 0007 migration
+        self.opened_at = timezone.now()
+        for user in (self.user, self.other):
+            BalanceCheckpoint.objects.create(account=user, entry_id=0, balance=user.profile.balance, as_of=self.opened_at)
+
+    def assertJournalMatchesProfiles(self):
+        for user in (self.user, self.other):
+            self.assertEqual(journal.balance(user.pk), Profile.objects.get(user=user).balance)
+
+    def test_entries_of_every_transaction_sum_to_zero(self):
+        ledger.transfer(self.user, self.other, Decimal('10.00'))
+        ledger.deposit(self.other, Decimal('25.50'))
+        ledger.withdraw(self.user, Decimal('3.25'))
+        ledger.transfer_many(self.user, [(self.other.pk, '1.10', ''), (self.other.pk, '2.20', '')])
+        totals = {}
+        for trans_id, amount in JournalEntry.objects.values_list('transaction_id', 'amount'):
+            totals.setdefault(trans_id, []).append(amount)
+        self.assertEqual(set(totals), set(Transaction.objects.values_list('pk', flat=True)))
+        for amounts in totals.values():
+            self.assertEqual(len(amounts), 2)
+            self.assertEqual(sum(amounts), 0)
+
+    def test_balance_from_checkpoint_matches_profile(self):
+        for _ in range(3):
+            ledger.transfer(self.user, self.other, Decimal('7.00'))
+        self.assertEqual(journal.checkpoint_accounts(cutoff=timezone.now() + timedelta(seconds=1)), 2)
+        ledger.transfer(self.other, self.user, Decimal('2.00'))
+        ledger.deposit(self.user, Decimal('5.00'))
+        self.assertEqual(BalanceCheckpoint.objects.filter(entry_id__gt=0).count(), 2)
+        self.assertJournalMatchesProfiles()
+
+    def test_past_balances_by_as_of(self):
+        moments = []
+        for amount in ('100.00', '50.00', '25.00'):
+            ledger.transfer(self.user, self.other, Decimal(amount))
+            moments.append(timezone.now())
+        # Checkpoints after the first transfer, so later moments add entries on top of it
+        self.assertEqual(journal.checkpoint_accounts(cutoff=moments[0] + timedelta(microseconds=1)), 2)
+        self.assertIsNone(journal.balance(self.user.pk, at=self.opened_at - timedelta(seconds=1)))
+        self.assertEqual(journal.balance(self.user.pk, at=self.opened_at), Decimal('1000.00'))
+        self.assertEqual([journal.balance(self.user.pk, at=moment) for moment in moments], [
+            Decimal('900.00'), Decimal('850.00'), Decimal('825.00'),
+        ])
+        self.assertEqual([journal.balance(self.other.pk, at=moment) for moment in moments], [
+            Decimal('100.00'), Decimal('150.00'), Decimal('175.00'),
+        ])
+        self.assertJournalMatchesProfiles()
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.user = make_user('alice', '03000000001', balance='1000.00')
+        self.other = make_user('bob', '03000000002')
+        self.client.force_login(self.user)
+
+    def send(self, key, amount='10.00'):
+        return self.client.post(
+            '/transactions/send-money/',
+            {'receiver_phone': self.other.phone_number, 'amount': amount, 'pin': '4821'},
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_replay_returns_the_original_receipt(self):
+        key = uuid.uuid4().hex
+        first = self.send(key)
+        second = self.send(key)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.context['transaction_id'], second.context['transaction_id'])
+        self.assertEqual(Transaction.objects.filter(sender=self.user).count(), 1)
+
+    def test_key_reused_for_other_fields_is_rejected(self):
+        key = uuid.uuid4().hex
+        self.send(key)
+        response = self.send(key, amount='20.00')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Transaction.objects.filter(sender=self.user).count(), 1)
+
+    def test_key_reused_for_other_view_is_rejected(self):
+        key = uuid.uuid4().hex
+        self.send(key)
+        response = self.client.post('/transactions/top-up/', {'amount': '10.00', 'pin': '4821'}, HTTP_IDEMPOTENCY_KEY=key)
+        self.assertEqual(response.status_code, 422)
+
+
+class ConcurrentIdempotencyTests(TransactionTestCase):
+    def test_same_key_is_applied_once(self):
+        sender = make_user('alice', '03000000001', balance='1000.00')
+        receiver = make_user('bob', '03000000002')
+        key = uuid.uuid4().hex
+        barrier = threading.Barrier(4, timeout=30)
+        statuses = []
+
+        def submit():
+            client = Client()
+            client.force_login(sender)
+            barrier.wait()
+            try:
+                response = client.post(
+                    '/transactions/send-money/',
+                    {'receiver_phone': receiver.phone_number, 'amount': '10.00', 'pin': '4821'},
+                    HTTP_IDEMPOTENCY_KEY=key,
+                )
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=submit) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(60)
+        self.assertEqual(statuses, [200] * 4)
+        self.assertEqual(Transaction.objects.filter(sender=sender).count(), 1)
+        self.assertEqual(IdempotencyKey.objects.filter(user=sender, key=key).count(), 1)
+        sender.profile.refresh_from_db()
+        self.assertEqual(sender.profile.balance, Decimal('990.00'))
+
+
+class DisbursementTests(TestCase):
+    def setUp(self):
+        # Velocity counters and amount statistics outlive the test database rows they describe
+        self.addCleanup(setattr, velocity, '_backend', None)
+        self.addCleanup(cache.clear)
+        self.user = make_user('alice', '03000000001', balance='500000.00')
+        self.other = make_user('bob', '03000000002')
+        self.client.force_login(self.user)
+
+    def upload(self, rows):
+        payouts = SimpleUploadedFile('payouts.csv', ('phone,amount\n' + ''.join(f'{phone},{amount}\n' for phone, amount in rows)).encode())
+        return self.client.post('/transactions/bulk-transfer/', {'file': payouts, 'pin': '4821'})
+
+    def test_rows_over_the_single_transfer_limit_fail(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.upload([(self.other.phone_number, '100.00'), (self.other.phone_number, '200000.00')])
+        self.assertEqual([result['status'] for result in response.json()['results']], ['paid', 'failed'])
+        self.assertEqual(response.json()['results'][1]['error'], 'Large transaction amount')
+
+    def test_paid_rows_count_towards_velocity(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload([(self.other.phone_number, '10000.00')] * 5)
+        is_fraud, reason = velocity.check(self.user, Decimal('100.00'), self.other)
+        self.assertTrue(is_fraud, reason)
+
+    @override_settings(DISBURSEMENT_MAX_UPLOAD_ROWS=3)
+    def test_large_uploads_are_rejected_whole(self):
+        response = self.upload([(self.other.phone_number, '1.00')] * 4)
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_unparseable_amounts_fail_when_read(self):
+        stream = StringIO('phone,amount\n03000000002,1\n03000000002,nan\n03000000002,inf\n03000000002,-5\n')
+        rows = list(disbursement.read_payouts(stream))
+        self.assertEqual([row.get('error') for row in rows], [
+            None, 'Invalid amount', 'Invalid amount', 'Amount must be greater than 0',
+        ])
+
+    def test_a_bad_row_does_not_stop_a_run_that_has_paid(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.upload([(self.other.phone_number, amount) for amount in ('1', 'nan', '2')])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['paid', 'failed', 'paid'])
+        self.other.profile.refresh_from_db()
+        self.assertEqual(self.other.profile.balance, Decimal('3.00'))
+
+    def test_a_failed_batch_does_not_stop_later_batches(self):
+        rows = [{'line': line, 'phone': self.other.phone_number, 'amount': '1', 'description': ''} for line in (2, 3)]
+        errors = iter([ledger.LedgerError('Account not found')])
+        transfer_many = ledger.transfer_many
+
+        def receiver_closed_once(*args, **kwargs):
+            for error in errors:
+                raise error
+            return transfer_many(*args, **kwargs)
+
+        with mock.patch.object(ledger, 'transfer_many', side_effect=receiver_closed_once):
+            with self.captureOnCommitCallbacks(execute=True):
+                results = list(disbursement.disburse(self.user, rows, batch_size=1))
+        self.assertEqual([(result['status'], result.get('error')) for result in results], [
+            ('failed', 'Account not found'), ('paid', None),
+        ])
+
+
+class QRCodeTests(TestCase):
+    def setUp(self):
+        # Ids of codes used in earlier tests come back once their rows roll back
+        patcher = mock.patch.object(qr, '_consumed', qr.ConsumedCodes())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = make_user('alice', '03000000001')
+        self.client.force_login(self.user)
+
+    def test_non_finite_amounts_are_rejected(self):
+        for amount in ('nan', 'inf', '-inf'):
+            response = self.client.post('/transactions/generate-qr/', {'amount': amount})
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'Invalid amount.')
+        self.assertFalse(QRCode.objects.exists())
+
+    def test_static_code_is_issued_once(self):
+        code = qr.issue(self.user)
+        self.assertEqual(qr.issue(self.user).pk, code.pk)
+        with self.assertRaises(IntegrityError):
+            QRCode.objects.create(user=self.user, qr_data=code.qr_data)
+
+    def test_tampered_payload_is_rejected(self):
+        payload = qr.make_payload(self.user.pk, '10.00')
+        data, signature = payload.rsplit(':', 1)
+        for tampered in (data.replace('10.00', '1.00') + ':' + signature, data + ':' + 'x' * len(signature), data):
+            with self.assertRaises(qr.QRError):
+                qr.parse_payload(tampered)
+
+    def test_expired_code_is_rejected(self):
+        code = qr.issue(self.user, Decimal('10.00'))
+        with self.assertRaises(qr.ExpiredQRCode):
+            qr.parse_payload(code.qr_data, now=code.expires_at.timestamp())
+        self.assertEqual(qr.parse_payload(code.qr_data, now=code.expires_at.timestamp() - 1).code_id, code.pk)
+
+    def test_one_time_code_cannot_be_replayed(self):
+        code = qr.issue(self.user, Decimal('10.00'))
+        payload = qr.parse_payload(code.qr_data)
+        with self.captureOnCommitCallbacks(execute=True):
+            qr.consume(payload)
+        with self.assertRaises(qr.UsedQRCode):
+            qr.consume(payload)
+        # Known to this process now, so the scan is refused before the database
+        with self.assertRaises(qr.UsedQRCode):
+            qr.parse_payload(code.qr_data)
+
+    def test_replay_through_another_process_is_refused_by_the_database(self):
+        code = qr.issue(self.user, Decimal('10.00'))
+        QRCode.objects.filter(pk=code.pk).update(is_active=False)
+        payload = qr.parse_payload(code.qr_data)
+        with self.assertRaises(qr.UsedQRCode):
+            qr.consume(payload)
+        self.assertIn(code.pk, qr._consumed)
+
+    def test_static_code_is_resigned_after_a_key_change(self):
+        code = qr.issue(self.user)
+        QRCode.objects.filter(pk=code.pk).update(qr_data='stale')
+        self.assertEqual(qr.issue(self.user).qr_data, code.qr_data)
+        self.assertEqual(QRCode.objects.get().qr_data, code.qr_data)
+
+
+class TransactionIdTests(TestCase):
+    def setUp(self):
+        self.user = make_user('alice', '03000000001', balance='100.00')
+        self.other = make_user('bob', '03000000002')
+        self.taken = ledger.transfer(self.user, self.other, Decimal('1.00')).transaction_id
+
+    def colliding_generator(self, *fresh):
+        generator = mock.Mock(side_effect=[self.taken, *fresh])
+        return mock.patch.object(ids, 'get_generator', return_value=generator)
+
+    def test_save_retries_a_taken_id(self):
+        with self.colliding_generator('RETRIED000000001') as get_generator:
+            trans = ledger.transfer(self.user, self.other, Decimal('1.00'))
+        self.assertEqual(trans.transaction_id, 'RETRIED000000001')
+        get_generator.return_value.reseed.assert_called_once()
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_bulk_insert_retries_taken_ids(self):
+        with self.colliding_generator('RETRIED000000001', 'RETRIED000000002', 'RETRIED000000003'):
+            transactions = ledger.transfer_many(
+                self.user, [(self.other.pk, '1.00', ''), (self.other.pk, '2.00', '')]
+            )
+        self.assertEqual([trans.transaction_id for trans in transactions], ['RETRIED000000002', 'RETRIED000000003'])
+        self.assertEqual(Transaction.objects.count(), 3)
+
+    def test_other_integrity_errors_are_raised(self):
+        trans = Transaction(sender=self.user, transaction_type='send', amount=None)
+        with self.assertRaises(IntegrityError):
+            trans.save()
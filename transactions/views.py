@@ -1,21 +1,32 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.conf import settings
 from django.db import transaction
 from django.utils import timezone
-from django.http import JsonResponse
-from .models import Transaction, Bill, MoneyRequest, QRCode
-from .forms import SendMoneyForm, RequestMoneyForm, BillPaymentForm, QRPaymentForm
-from accounts.models import User, Profile, Notification
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_POST
+from django.db.models import Q
+from .models import Transaction, Bill, MoneyRequest
+from .forms import SendMoneyForm, RequestMoneyForm, BillPaymentForm, QRPaymentForm, BulkTransferForm
+from accounts import outbox
+from accounts.decorators import alogin_required
+from accounts.models import User, Profile
 from accounts.utils import detect_fraud
-import qrcode
-import io
+from . import disbursement, idempotency, ledger, qr
+from .pagination import akeyset_page, keyset_page
 import base64
-import json
+from itertools import islice
 
 @login_required
+@idempotency.rejects_reused_keys
 def send_money(request):
     if request.method == 'POST':
+        # A retried or double-submitted request gets the original receipt
+        replayed = idempotency.replay(request)
+        if replayed is not None:
+            return render(request, 'transactions/success.html', replayed)
+        
         form = SendMoneyForm(request.POST)
         if form.is_valid():
             receiver_phone = form.cleaned_data['receiver_phone']
@@ -40,62 +51,77 @@ def send_money(request):
             try:
                 receiver = User.objects.get(phone_number=receiver_phone)
                 
-                # Fraud detection (if fraud detection function exists)
-                try:
-                    is_fraud, fraud_reason = detect_fraud(request.user, amount, 'send')
-                    if is_fraud:
-                        return render(request, 'transactions/error.html', {
-                            'error_message': f'Transaction blocked for security reasons: {fraud_reason}',
-                            'error_code': 'FRAUD_DETECTED'
-                        })
-                except:
-                    pass  # Skip fraud detection if function doesn't exist
+                # Fraud detection
+                is_fraud, fraud_reason = detect_fraud(
+                    request.user,
+                    amount,
+                    'send',
+                    receiver,
+                    ip=request.META.get('REMOTE_ADDR'),
+                    device=request.META.get('HTTP_USER_AGENT', '')
+                )
+                if is_fraud:
+                    return render(request, 'transactions/error.html', {
+                        'error_message': f'Transaction blocked for security reasons: {fraud_reason}',
+                        'error_code': 'FRAUD_DETECTED'
+                    })
                 
-                with transaction.atomic():
-                    # Create transaction
-                    trans = Transaction.objects.create(
-                        sender=request.user,
-                        receiver=receiver,
-                        transaction_type='send',
-                        amount=amount,
-                        description=description,
-                        status='completed',
-                        completed_at=timezone.now()
-                    )
-                    
-                    # Update balances
-                    request.user.profile.balance -= amount
-                    request.user.profile.save()
+                def send():
+                    trans = ledger.transfer(request.user, receiver, amount, 'send', description)
                     
-                    receiver.profile.balance += amount
-                    receiver.profile.save()
-                    
-                    # Create notifications
-                    Notification.objects.create(
-                        user=receiver,
-                        title='Money Received',
-                        message=f'You received PKR {amount} from {request.user.get_full_name()}'
+                    # Queued in the same transaction, delivered by the notification worker
+                    outbox.notify(
+                        receiver,
+                        'Money Received',
+                        f'You received PKR {amount} from {request.user.get_full_name()}'
                     )
-                    
-                    messages.success(request, f'Successfully sent PKR {amount} to {receiver.get_full_name()}')
-                    return render(request, 'transactions/success.html', {
+                    return trans, {
                         'success_message': f'Successfully sent PKR {amount} to {receiver.get_full_name()}',
                         'transaction_id': trans.transaction_id,
-                        'amount': amount,
+                        'amount': str(amount),
                         'receiver': receiver.get_full_name(),
                         'redirect_url': 'accounts:dashboard'
-                    })
+                    }
+                
+                response = idempotency.run_once(request, send)
+                messages.success(request, response['success_message'])
+                return render(request, 'transactions/success.html', response)
                     
             except User.DoesNotExist:
                 return render(request, 'transactions/error.html', {
                     'error_message': f'No user found with phone number {receiver_phone}. Please check the number and try again.',
                     'error_code': 'USER_NOT_FOUND'
                 })
+            except ledger.InsufficientBalance:
+                return render(request, 'transactions/error.html', {
+                    'error_message': f'Insufficient balance to send PKR {amount}.',
+                    'error_code': 'INSUFFICIENT_BALANCE'
+                })
     else:
         form = SendMoneyForm()
     
     return render(request, 'transactions/send_money.html', {'form': form})
 
+@login_required
+@require_POST
+def bulk_transfer(request):
+    # Payroll-style payouts; see transactions.disbursement for the file format
+    form = BulkTransferForm(request.POST, request.FILES)
+    if not form.is_valid():
+        return JsonResponse({'error': 'Upload a payout file and your PIN', 'fields': form.errors}, status=400)
+    if request.user.profile.pin != form.cleaned_data['pin']:
+        return JsonResponse({'error': 'Invalid PIN'}, status=403)
+    
+    # Checked before anything is paid, so a file over the limit is rejected whole
+    limit = settings.DISBURSEMENT_MAX_UPLOAD_ROWS
+    rows = list(islice(disbursement.read_uploaded_payouts(form.cleaned_data['file']), limit + 1))
+    if len(rows) > limit:
+        return JsonResponse({'error': f'Upload at most {limit} rows; use manage.py disburse for larger files'}, status=413)
+    
+    results = list(disbursement.disburse(request.user, rows))
+    paid = sum(result['status'] == 'paid' for result in results)
+    return JsonResponse({'paid': paid, 'failed': len(results) - paid, 'results': results})
+
 @login_required
 def request_money(request):
     if request.method == 'POST':
@@ -115,10 +141,10 @@ def request_money(request):
                     message=message
                 )
                 
-                Notification.objects.create(
-                    user=requested_from,
-                    title='Money Request',
-                    message=f'{request.user.get_full_name()} requested PKR {amount}'
+                outbox.notify(
+                    requested_from,
+                    'Money Request',
+                    f'{request.user.get_full_name()} requested PKR {amount}'
                 )
                 
                 messages.success(request, 'Money request sent successfully!')
@@ -137,8 +163,14 @@ def request_money(request):
     return render(request, 'transactions/request_money.html', {'form': form})
 
 @login_required
+@idempotency.rejects_reused_keys
 def pay_bill(request):
     if request.method == 'POST':
+        # A retried or double-submitted request gets the original receipt
+        replayed = idempotency.replay(request)
+        if replayed is not None:
+            return render(request, 'transactions/success.html', replayed)
+        
         form = BillPaymentForm(request.POST)
         if form.is_valid():
             bill_type = form.cleaned_data['bill_type']
@@ -154,21 +186,14 @@ def pay_bill(request):
                 messages.error(request, 'Insufficient balance.')
                 return render(request, 'transactions/pay_bill.html', {'form': form})
             
-            with transaction.atomic():
-                # Create transaction
-                Transaction.objects.create(
-                    sender=request.user,
-                    transaction_type='bill_payment',
-                    amount=amount,
-                    description=f'{bill_type} bill payment - {bill_number}',
-                    status='completed',
-                    completed_at=timezone.now()
+            def pay():
+                trans = ledger.withdraw(
+                    request.user,
+                    amount,
+                    'bill_payment',
+                    f'{bill_type} bill payment - {bill_number}'
                 )
                 
-                # Update balance
-                request.user.profile.balance -= amount
-                request.user.profile.save()
-                
                 # Create/update bill record
                 Bill.objects.create(
                     user=request.user,
@@ -178,15 +203,21 @@ def pay_bill(request):
                     is_paid=True,
                     paid_at=timezone.now()
                 )
-                
-                messages.success(request, f'Bill payment of PKR {amount} completed successfully!')
-                return render(request, 'transactions/success.html', {
+                return trans, {
                     'success_message': f'{bill_type.title()} bill payment of PKR {amount} completed successfully!',
-                    'transaction_id': Transaction.objects.latest('created_at').transaction_id,
-                    'amount': amount,
+                    'transaction_id': trans.transaction_id,
+                    'amount': str(amount),
                     'bill_type': bill_type,
                     'redirect_url': 'accounts:dashboard'
-                })
+                }
+            
+            try:
+                response = idempotency.run_once(request, pay)
+                messages.success(request, f'Bill payment of PKR {amount} completed successfully!')
+                return render(request, 'transactions/success.html', response)
+            except ledger.InsufficientBalance:
+                messages.error(request, 'Insufficient balance.')
+                return render(request, 'transactions/pay_bill.html', {'form': form})
     else:
         form = BillPaymentForm()
     
@@ -195,41 +226,38 @@ def pay_bill(request):
 @login_required
 def generate_qr(request):
     if request.method == 'POST':
-        amount = request.POST.get('amount')
-        
-        qr_data = {
-            'user_id': request.user.id,
-            'phone': request.user.phone_number,
-            'amount': amount if amount else None
-        }
-        
-        # Generate QR code
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(json.dumps(qr_data))
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        qr_image = base64.b64encode(buffer.getvalue()).decode()
+        amount = request.POST.get('amount') or None
+        if amount is not None:
+            try:
+                amount = ledger.to_amount(amount)
+            except ledger.LedgerError:
+                messages.error(request, 'Invalid amount.')
+                return render(request, 'transactions/generate_qr.html')
+        fmt = 'svg' if request.POST.get('format') == 'svg' else 'png'
         
-        # Save QR code
-        QRCode.objects.create(
-            user=request.user,
-            qr_data=json.dumps(qr_data),
-            amount=amount if amount else None
-        )
+        # A fixed amount makes a one-time, expiring code; otherwise the user's static code
+        code = qr.issue(request.user, amount)
+        # Only the static code is shown repeatedly, so only it goes through the image cache
+        qr_image = base64.b64encode(qr.render(code.qr_data, fmt, cache=code.expires_at is None)).decode()
         
         return render(request, 'transactions/qr_display.html', {
             'qr_image': qr_image,
-            'amount': amount
+            'qr_mime': qr.MIME_TYPES[fmt],
+            'amount': amount,
+            'expires_at': code.expires_at
         })
     
     return render(request, 'transactions/generate_qr.html')
 
 @login_required
+@idempotency.rejects_reused_keys
 def qr_payment(request):
     if request.method == 'POST':
+        # A retried or double-submitted request gets the original receipt
+        replayed = idempotency.replay(request)
+        if replayed is not None:
+            return render(request, 'transactions/success.html', replayed)
+        
         form = QRPaymentForm(request.POST)
         if form.is_valid():
             qr_data = form.cleaned_data['qr_data']
@@ -240,60 +268,95 @@ def qr_payment(request):
                 return render(request, 'transactions/qr_payment.html', {'form': form})
             
             try:
-                data = json.loads(qr_data)
-                receiver = User.objects.get(id=data['user_id'])
-                amount = float(data.get('amount', 0))
+                # Signature, expiry and reuse are checked without the database
+                payload = qr.parse_payload(qr_data)
+                receiver = User.objects.get(id=payload.user_id)
                 
-                if amount <= 0:
-                    messages.error(request, 'Invalid amount in QR code.')
+                try:
+                    # A static code leaves the amount to the payer
+                    amount = ledger.to_amount(payload.amount or form.cleaned_data['amount'])
+                except ledger.LedgerError:
+                    messages.error(request, 'Invalid amount in QR code.' if payload.amount else 'Enter a valid amount.')
                     return render(request, 'transactions/qr_payment.html', {'form': form})
                 
                 if request.user.profile.balance < amount:
                     messages.error(request, 'Insufficient balance.')
                     return render(request, 'transactions/qr_payment.html', {'form': form})
                 
-                with transaction.atomic():
-                    Transaction.objects.create(
-                        sender=request.user,
-                        receiver=receiver,
-                        transaction_type='qr_payment',
-                        amount=amount,
-                        description='QR Code Payment',
-                        status='completed',
-                        completed_at=timezone.now()
-                    )
-                    
-                    request.user.profile.balance -= amount
-                    request.user.profile.save()
-                    
-                    receiver.profile.balance += amount
-                    receiver.profile.save()
-                    
-                    messages.success(request, f'QR payment of PKR {amount} completed!')
-                    return render(request, 'transactions/success.html', {
+                def pay():
+                    qr.consume(payload)
+                    trans = ledger.transfer(request.user, receiver, amount, 'qr_payment', 'QR Code Payment')
+                    return trans, {
                         'success_message': f'QR payment of PKR {amount} completed successfully!',
-                        'amount': amount,
+                        'transaction_id': trans.transaction_id,
+                        'amount': str(amount),
                         'receiver': receiver.get_full_name(),
                         'redirect_url': 'accounts:dashboard'
-                    })
+                    }
+                
+                response = idempotency.run_once(request, pay)
+                messages.success(request, f'QR payment of PKR {amount} completed!')
+                return render(request, 'transactions/success.html', response)
                     
-            except (json.JSONDecodeError, User.DoesNotExist, ValueError):
+            except ledger.InsufficientBalance:
+                messages.error(request, 'Insufficient balance.')
+            except qr.QRError as e:
+                messages.error(request, str(e))
+            except (User.DoesNotExist, ledger.LedgerError):
                 messages.error(request, 'Invalid QR code.')
     else:
         form = QRPaymentForm()
     
     return render(request, 'transactions/qr_payment.html', {'form': form})
 
-@login_required
-def transaction_history(request):
-    sent_transactions = request.user.sent_transactions.all()
-    received_transactions = request.user.received_transactions.all()
+def history_query(user):
+    """The queryset and branches a user's history is paged from"""
+    # Sent and received rows are merged and ordered by the database
+    return Transaction.objects.select_related('sender', 'receiver'), [Q(sender=user), Q(receiver=user)]
+
+def history_page(user, cursor=None):
+    queryset, branches = history_query(user)
+    return keyset_page(queryset, cursor, branches=branches)
+
+async def ahistory_page(user, cursor=None):
+    queryset, branches = history_query(user)
+    return await akeyset_page(queryset, cursor, branches=branches)
+
+@alogin_required
+async def transaction_history(request):
+    try:
+        transactions, next_cursor = await ahistory_page(request.user, request.GET.get('cursor'))
+    except ValueError:
+        return redirect('transactions:transaction_history')
     
-    # Combine and sort by date
-    all_transactions = list(sent_transactions) + list(received_transactions)
-    all_transactions.sort(key=lambda x: x.created_at, reverse=True)
+    return render(request, 'transactions/history.html', {
+        'transactions': transactions,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+    })
+
+@alogin_required
+async def transaction_history_json(request):
+    try:
+        transactions, next_cursor = await ahistory_page(request.user, request.GET.get('cursor'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
     
-    return render(request, 'transactions/history.html', {'transactions': all_transactions})
+    results = []
+    for trans in transactions:
+        is_sender = trans.sender_id == request.user.id
+        counterpart = trans.receiver if is_sender else trans.sender
+        results.append({
+            'transaction_id': trans.transaction_id,
+            'created_at': trans.created_at.isoformat(),
+            'transaction_type': trans.transaction_type,
+            'description': trans.description,
+            'amount': str(trans.amount),
+            'direction': 'debit' if is_sender else 'credit',
+            'status': trans.status,
+            'counterpart': counterpart.get_full_name() if counterpart else None,
+        })
+    return JsonResponse({'results': results, 'next_cursor': next_cursor})
 
 @login_required
 def verify_pin(request):
@@ -313,31 +376,27 @@ def respond_money_request(request, request_id):
         
         if action == 'accept':
             if request.user.profile.balance >= money_request.amount:
-                with transaction.atomic():
-                    # Transfer money
-                    request.user.profile.balance -= money_request.amount
-                    request.user.profile.save()
-                    
-                    money_request.requester.profile.balance += money_request.amount
-                    money_request.requester.profile.save()
-                    
-                    # Update request status
-                    money_request.status = 'accepted'
-                    money_request.responded_at = timezone.now()
-                    money_request.save()
-                    
-                    # Create transaction record
-                    Transaction.objects.create(
-                        sender=request.user,
-                        receiver=money_request.requester,
-                        transaction_type='send',
-                        amount=money_request.amount,
-                        description=f'Money request payment: {money_request.message}',
-                        status='completed',
-                        completed_at=timezone.now()
-                    )
-                    
-                    messages.success(request, 'Money request accepted and payment sent!')
+                try:
+                    with transaction.atomic():
+                        # Claim the request first so a double submit cannot pay it twice
+                        claimed = MoneyRequest.objects.filter(
+                            id=money_request.id,
+                            status='pending'
+                        ).update(status='accepted', responded_at=timezone.now())
+                        
+                        if claimed:
+                            ledger.transfer(
+                                request.user,
+                                money_request.requester,
+                                money_request.amount,
+                                'send',
+                                f'Money request payment: {money_request.message}'
+                            )
+                            messages.success(request, 'Money request accepted and payment sent!')
+                        else:
+                            messages.info(request, 'This money request has already been answered.')
+                except ledger.InsufficientBalance:
+                    messages.error(request, 'Insufficient balance.')
             else:
                 messages.error(request, 'Insufficient balance.')
         
@@ -349,9 +408,14 @@ def respond_money_request(request, request_id):
     
     return redirect('accounts:dashboard')
 
-@login_required
-def transaction_detail(request, transaction_id):
-    transaction_obj = get_object_or_404(Transaction, transaction_id=transaction_id)
+@alogin_required
+async def transaction_detail(request, transaction_id):
+    try:
+        transaction_obj = await Transaction.objects.select_related(
+            'sender__profile', 'receiver__profile'
+        ).aget(transaction_id=transaction_id)
+    except Transaction.DoesNotExist:
+        raise Http404('No Transaction matches the given query.')
     
     # Check if user is authorized to view this transaction
     if transaction_obj.sender != request.user and transaction_obj.receiver != request.user:
@@ -367,8 +431,14 @@ def transaction_detail(request, transaction_id):
     return render(request, 'transactions/transaction_detail.html', context)
 
 @login_required
+@idempotency.rejects_reused_keys
 def top_up(request):
     if request.method == 'POST':
+        # A retried or double-submitted request gets the original receipt
+        replayed = idempotency.replay(request)
+        if replayed is not None:
+            return render(request, 'transactions/success.html', replayed)
+        
         amount = request.POST.get('amount')
         pin = request.POST.get('pin')
         
@@ -377,38 +447,27 @@ def top_up(request):
             return render(request, 'transactions/top_up.html')
         
         try:
-            amount = float(amount)
-            if amount <= 0:
-                messages.error(request, 'Amount must be greater than 0.')
-                return render(request, 'transactions/top_up.html')
-        except ValueError:
-            messages.error(request, 'Invalid amount.')
+            # Decimal throughout: a float amount could be credited a cent off
+            amount = ledger.to_amount(amount)
+        except ledger.LedgerError as e:
+            messages.error(request, f'{e}.')
             return render(request, 'transactions/top_up.html')
         
         if request.user.profile.pin != pin:
             messages.error(request, 'Invalid PIN.')
             return render(request, 'transactions/top_up.html')
         
-        with transaction.atomic():
-            # Add money to balance
-            request.user.profile.balance += amount
-            request.user.profile.save()
-            
-            # Create transaction record
-            Transaction.objects.create(
-                sender=request.user,
-                transaction_type='deposit',
-                amount=amount,
-                description='Account top-up',
-                status='completed',
-                completed_at=timezone.now()
-            )
-            
-            messages.success(request, f'Successfully added PKR {amount} to your account!')
-            return render(request, 'transactions/success.html', {
+        def add_funds():
+            trans = ledger.deposit(request.user, amount, 'Account top-up')
+            return trans, {
                 'success_message': f'Successfully added PKR {amount} to your account!',
-                'amount': amount,
+                'transaction_id': trans.transaction_id,
+                'amount': str(amount),
                 'redirect_url': 'accounts:dashboard'
-            })
+            }
+        
+        response = idempotency.run_once(request, add_funds)
+        messages.success(request, f'Successfully added PKR {amount} to your account!')
+        return render(request, 'transactions/success.html', response)
     
     return render(request, 'transactions/top_up.html')
\ No newline at end of file